@@ -0,0 +1,231 @@
+import time
+import queue
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+import cv2
+import requests
+from requests.adapters import HTTPAdapter
+
+from client import EdgeClient, LatestFrame, PipelineStats
+
+logger = logging.getLogger(__name__)
+
+
+class AgentSource:
+    """エージェントが管理する1つの映像ソース（カメラ番号・動画ファイル・ストリームURL）"""
+
+    def __init__(self, client: EdgeClient, source):
+        self.client = client
+        self.source = source
+        self.slot = LatestFrame()
+        self.stats = PipelineStats(name=client.device_id)
+        self.encoding = False  # エンコード中は次のフレームを取り出さない（スロットで上書きされる）
+
+    @property
+    def is_file(self) -> bool:
+        return isinstance(self.source, str) and '://' not in self.source
+
+
+class MultiSourceAgent:
+    """複数ソースを1プロセスで扱うエッジエージェント
+
+    ソースごとにキャプチャスレッドを持ち、エンコードと送信はすべてのソースで
+    共有のスレッドプール・keep-aliveセッションを使う。
+    """
+
+    def __init__(self, server_url: str, api_key: str, sources: List[Tuple[str, object]], fps: float = 1.0,
+                 encode_workers: int = 2, upload_workers: int = 4, reconnect_after: int = 50):
+        self.fps = fps
+        self.encode_workers = encode_workers
+        self.upload_workers = upload_workers
+        self.reconnect_after = reconnect_after
+
+        # 全ソース共有のセッション（接続プールは送信スレッド数分）
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=upload_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.sources = []
+        for device_id, source in sources:
+            client = EdgeClient(device_id, server_url, api_key)
+            client.session.close()
+            client.session = self.session
+            self.sources.append(AgentSource(client, source))
+
+        # 送信待ちは全ソース共有。溢れたら古いフレームから捨てて鮮度を優先
+        self.upload_queue: queue.Queue = queue.Queue(maxsize=max(upload_workers * 2, len(self.sources)))
+        self.encode_pool = ThreadPoolExecutor(max_workers=encode_workers, thread_name_prefix='encode')
+
+    def _capture_loop(self, source: AgentSource, stop: threading.Event):
+        """キャプチャ段: 読み込み失敗が続いたら開き直す（ストリーム切断・動画ファイル終端）"""
+        camera = source.client.camera
+        # 動画ファイルは記録時のfpsで読み進める
+        file_fps = camera.get(cv2.CAP_PROP_FPS) if source.is_file else 0
+        frame_interval = 1.0 / file_fps if file_fps > 0 else 0.0
+        failures = 0
+        while not stop.is_set():
+            read_start = time.monotonic()
+            ret, frame = camera.read()
+            if not ret:
+                source.stats.incr('capture_failed')
+                failures += 1
+                if failures >= self.reconnect_after or source.is_file:
+                    logger.warning(f"{source.client.device_id}: reopening source {source.source}")
+                    camera.release()
+                    stop.wait(1.0 if not source.is_file else 0.0)
+                    camera = cv2.VideoCapture(source.source)
+                    source.client.camera = camera
+                    failures = 0
+                else:
+                    time.sleep(0.01)
+                continue
+            failures = 0
+            source.stats.incr('captured')
+            source.slot.put(frame, time.time())
+            if frame_interval:
+                stop.wait(max(0.0, frame_interval - (time.monotonic() - read_start)))
+
+    def _encode(self, source: AgentSource, frame, captured_at: float):
+        """エンコード段（共有プール）: エンコードして共有の送信キューへ"""
+        try:
+            image_data = source.client.encode_frame(frame)
+            source.stats.incr('encoded')
+            item = (source, image_data, captured_at)
+            try:
+                self.upload_queue.put_nowait(item)
+            except queue.Full:
+                try:
+                    dropped_source, _, _ = self.upload_queue.get_nowait()
+                    dropped_source.stats.incr('upload_dropped')
+                except queue.Empty:
+                    pass
+                self.upload_queue.put_nowait(item)
+        except Exception as e:
+            logger.error(f"{source.client.device_id}: encode failed: {e}")
+        finally:
+            source.encoding = False
+
+    def _upload_loop(self, stop: threading.Event):
+        """送信段（共有プール）: どのソースのフレームも同じ接続プールで送信"""
+        while not stop.is_set():
+            try:
+                source, image_data, captured_at = self.upload_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            source.stats.begin_upload()
+            send_start = time.monotonic()
+            try:
+                result = source.client.deliver(image_data, captured_at)
+            except Exception:
+                source.stats.end_upload(None)
+                continue
+            if result is None:
+                source.stats.end_upload(None)
+                source.stats.incr('spooled')
+                continue
+            source.stats.end_upload((time.monotonic() - send_start) * 1000)
+
+    def run(self, stats_interval: float = 10.0):
+        opened = [source for source in self.sources if source.client.init_camera(source.source)]
+        if not opened:
+            logger.error("No sources could be opened")
+            return
+        logger.info(f"Starting multi-source agent: {len(opened)} sources, fps={self.fps}, "
+                    f"encode_workers={self.encode_workers}, upload_workers={self.upload_workers}")
+
+        stop = threading.Event()
+        threads = [
+            threading.Thread(target=self._capture_loop, args=(source, stop),
+                             name=f'capture-{source.client.device_id}', daemon=True)
+            for source in opened
+        ]
+        threads += [
+            threading.Thread(target=self._upload_loop, args=(stop,), name=f'uploader-{i}', daemon=True)
+            for i in range(self.upload_workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            next_tick = time.monotonic()
+            last_log = next_tick
+            while True:
+                # fps間隔で各ソースの最新フレームを共有エンコードプールへ
+                for source in opened:
+                    if source.encoding:
+                        continue
+                    item = source.slot.take(timeout=0)
+                    if item is None:
+                        continue
+                    if source.client.change_detector is not None and \
+                            source.client.change_detector.check(item[0], item[1]) is None:
+                        continue
+                    source.encoding = True
+                    self.encode_pool.submit(self._encode, source, *item)
+
+                now = time.monotonic()
+                if now - last_log >= stats_interval:
+                    for source in opened:
+                        source.stats.log(source.slot, self.upload_queue)
+                    last_log = now
+
+                next_tick += 1.0 / self.fps
+                sleep_time = next_tick - time.monotonic()
+                if sleep_time > 0:
+                    time.sleep(sleep_time)
+                else:
+                    next_tick = time.monotonic()
+
+        except KeyboardInterrupt:
+            logger.info("Stopping agent...")
+
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join(timeout=5)
+            self.encode_pool.shutdown(wait=False)
+            for source in opened:
+                source.stats.log(source.slot, self.upload_queue)
+                if source.client.camera:
+                    source.client.camera.release()
+            self.session.close()
+
+
+def parse_source(value: str, index: int, device_prefix: str) -> Tuple[str, object]:
+    """'device_id=source' または 'source' を (device_id, source) に変換（数字はカメラ番号）"""
+    device_id, sep, source = value.partition('=')
+    if not sep or '://' in device_id:
+        device_id, source = f'{device_prefix}-{index}', value
+    return device_id, int(source) if source.isdigit() else source
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Multi-camera Edge Agent')
+    parser.add_argument('--sources', nargs='+', required=True, metavar='[DEVICE_ID=]SOURCE',
+                        help='Camera indices, video files or stream URLs, e.g. 0 cam2=1 gate=rtsp://...')
+    parser.add_argument('--device-prefix', default='agent', help='Device ID prefix for unnamed sources')
+    parser.add_argument('--server-url', default='http://localhost:8000', help='Server URL')
+    parser.add_argument('--api-key', default='your_api_key_here', help='API Key')
+    parser.add_argument('--fps', type=float, default=1.0, help='Target frames per second per source')
+    parser.add_argument('--encode-workers', type=int, default=2, help='Shared encode threads')
+    parser.add_argument('--upload-workers', type=int, default=4, help='Shared upload threads (connections)')
+    parser.add_argument('--stats-interval', type=float, default=10.0, help='Per-source stats log interval')
+
+    args = parser.parse_args()
+
+    sources = [parse_source(value, i, args.device_prefix) for i, value in enumerate(args.sources)]
+    agent = MultiSourceAgent(
+        args.server_url, args.api_key, sources, fps=args.fps,
+        encode_workers=args.encode_workers, upload_workers=args.upload_workers
+    )
+    agent.run(stats_interval=args.stats_interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,27 @@
 import os
 import time
+import queue
+import struct
+import threading
 import requests
+from requests.adapters import HTTPAdapter
 import cv2
+import numpy as np
 import json
 from datetime import datetime
 from pathlib import Path
+from collections import deque
 import logging
 import argparse
 
+from spool import FrameSpool
+from replay import ReplaySource
+
+try:
+    import websocket  # websocket-client（WebSocket送信モード用、オプション）
+except ImportError:
+    websocket = None
+
 # ログ設定
 logging.basicConfig(
     level=logging.INFO,
@@ -15,23 +29,431 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-class EdgeClient:
+class WebSocketTransport:
+    """WebSocketでフレームを送り続け、検出結果を非同期に受け取る送信路"""
+    
+    # seq: uint32, 撮影時刻: float64 epoch秒（サーバの WS_FRAME_HEADER と同じ形式）
+    FRAME_HEADER = struct.Struct('!Id')
+    
     def __init__(self, device_id: str, server_url: str, api_key: str):
+        if websocket is None:
+            raise ImportError("websocket-client is required for the websocket transport")
+        
+        base_url = server_url.rstrip('/')
+        if base_url.startswith('https://'):
+            base_url = 'wss://' + base_url[len('https://'):]
+        elif base_url.startswith('http://'):
+            base_url = 'ws://' + base_url[len('http://'):]
+        self.url = f"{base_url}/ws/ingest?device_id={device_id}"
+        self.api_key = api_key
+        
+        self.ws = None
+        self.seq = 0
+        self.throttle_interval = 0.0  # サーバから要求された最小送信間隔（秒）
+        self.in_flight = 0
+        self.last_result = None
+        self._lock = threading.Lock()
+        self._receiver = None
+    
+    @property
+    def connected(self) -> bool:
+        return self.ws is not None and self.ws.connected
+    
+    def connect(self):
+        """接続して受信スレッドを開始"""
+        self.ws = websocket.create_connection(
+            self.url,
+            header=[f'Authorization: Bearer {self.api_key}'],
+            timeout=30
+        )
+        self.throttle_interval = 0.0
+        self.in_flight = 0
+        self._receiver = threading.Thread(target=self._receive_loop, name='ws-receiver', daemon=True)
+        self._receiver.start()
+        logger.info(f"WebSocket connected: {self.url}")
+    
+    def send_frame(self, image_data: bytes, timestamp: float = None, suppressed: int = 0) -> int:
+        """フレームを送信してseqを返す（結果は受信スレッドで処理）
+        
+        suppressed: 前回の送信以降に変化検出で送信しなかったフレーム数（フレームの後に制御メッセージで送る。
+        例外時は送れていないので呼び出し側で戻す）
+        """
+        with self._lock:
+            self.seq = (self.seq + 1) % 2**32
+            seq = self.seq
+            self.in_flight += 1
+        header = self.FRAME_HEADER.pack(seq, timestamp if timestamp is not None else time.time())
+        self.ws.send_binary(header + image_data)
+        if suppressed:
+            self.ws.send(json.dumps({'type': 'suppressed', 'count': suppressed}))
+        return seq
+    
+    def _receive_loop(self):
+        """結果・フロー制御メッセージの受信"""
+        try:
+            while True:
+                message = json.loads(self.ws.recv())
+                message_type = message.get('type')
+                
+                if message_type == 'result':
+                    with self._lock:
+                        self.in_flight = max(0, self.in_flight - 1)
+                    self.last_result = message
+                    logger.info(
+                        f"Result seq={message['seq']}: persons={message.get('person_count', 0)}, "
+                        f"anomaly={message.get('anomaly_detected', False)}, "
+                        f"processing_time={message.get('processing_time_ms', 0):.1f}ms"
+                    )
+                elif message_type == 'throttle':
+                    self.throttle_interval = message.get('min_interval_ms', 0) / 1000
+                    logger.warning(f"Server requested throttle: pending={message.get('pending')}, "
+                                   f"min_interval={self.throttle_interval:.2f}s")
+                elif message_type == 'resume':
+                    self.throttle_interval = 0.0
+                    logger.info("Server resumed normal rate")
+                elif message_type in ('dropped', 'error'):
+                    with self._lock:
+                        self.in_flight = max(0, self.in_flight - 1)
+                    logger.warning(f"Frame seq={message.get('seq')} {message_type}: {message.get('detail', '')}")
+        except Exception as e:
+            if self.ws is not None:
+                logger.error(f"WebSocket receive stopped: {e}")
+    
+    def close(self):
+        if self.ws is not None:
+            ws, self.ws = self.ws, None
+            ws.close()
+
+class LatestFrame:
+    """キャプチャスレッドが最新フレームだけを保持するスロット"""
+    
+    def __init__(self):
+        self._cond = threading.Condition()
+        self.frame = None
+        self.timestamp = None
+        self.seq = 0
+        self.overwritten = 0  # 取り出される前に上書きされたフレーム数
+        self._taken_seq = 0
+    
+    def put(self, frame, timestamp: float):
+        with self._cond:
+            if self.seq != self._taken_seq:
+                self.overwritten += 1
+            self.frame = frame
+            self.timestamp = timestamp
+            self.seq += 1
+            self._cond.notify_all()
+    
+    def take(self, timeout: float):
+        """未取得の最新フレームを (frame, timestamp) で返す（timeoutまでに来なければNone）"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.seq != self._taken_seq, timeout):
+                return None
+            self._taken_seq = self.seq
+            return self.frame, self.timestamp
+
+class PipelineStats:
+    """パイプライン各段のカウンタと送信RTT"""
+    
+    def __init__(self, name: str = 'Pipeline'):
+        self.name = name
+        self._lock = threading.Lock()
+        self.counters = {'captured': 0, 'capture_failed': 0, 'encoded': 0,
+                         'upload_dropped': 0, 'sent': 0, 'failed': 0, 'spooled': 0}
+        self.rtt_total_ms = 0.0
+        self.in_flight = 0
+        self._last_counters = dict(self.counters)
+        self._last_time = time.monotonic()
+    
+    def incr(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] += n
+    
+    def begin_upload(self):
+        with self._lock:
+            self.in_flight += 1
+    
+    def end_upload(self, rtt_ms: float = None):
+        """送信完了（rtt_msがNoneなら失敗）"""
+        with self._lock:
+            self.in_flight -= 1
+            if rtt_ms is None:
+                self.counters['failed'] += 1
+            else:
+                self.counters['sent'] += 1
+                self.rtt_total_ms += rtt_ms
+    
+    def log(self, slot: LatestFrame, upload_queue: queue.Queue):
+        """前回からの区間レートとキュー状況をログ出力"""
+        now = time.monotonic()
+        with self._lock:
+            counters = dict(self.counters)
+            avg_rtt = self.rtt_total_ms / counters['sent'] if counters['sent'] else 0.0
+        elapsed = max(now - self._last_time, 1e-6)
+        rate = {name: (counters[name] - self._last_counters[name]) / elapsed for name in counters}
+        self._last_counters, self._last_time = counters, now
+        
+        logger.info(
+            f"{self.name}: capture={rate['captured']:.1f}fps encode={rate['encoded']:.1f}fps "
+            f"send={rate['sent']:.1f}fps | overwritten={slot.overwritten} "
+            f"upload_queue={upload_queue.qsize()}/{upload_queue.maxsize} in_flight={self.in_flight} "
+            f"dropped={counters['upload_dropped']} failed={counters['failed']} spooled={counters['spooled']} "
+            f"avg_rtt={avg_rtt:.0f}ms"
+        )
+
+class ChangeDetector:
+    """縮小グレースケール画像の差分でシーン変化を検出し、変化のないフレームの送信を抑制"""
+    
+    def __init__(self, width: int = 64, pixel_threshold: int = 25, min_changed_ratio: float = 0.01,
+                 keepalive_seconds: float = 60.0, mask_path: str = None, ignore_regions: list = None):
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.min_changed_ratio = min_changed_ratio
+        self.keepalive_seconds = keepalive_seconds
+        self.mask_path = mask_path
+        self.ignore_regions = ignore_regions or []  # (x, y, w, h) 画像サイズに対する比率
+        
+        self.reference = None
+        self.last_upload_at = 0.0
+        self.mask = None
+        self.suppressed_total = 0
+        self._suppressed_pending = 0
+        self._lock = threading.Lock()
+    
+    def _thumbnail(self, frame):
+        height = max(1, round(frame.shape[0] * self.width / frame.shape[1]))
+        gray = cv2.cvtColor(cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (3, 3), 0)
+    
+    def _build_mask(self, shape):
+        """監視対象ピクセルのマスク（マスク画像の白い部分、除外領域を除く）"""
+        height, width = shape
+        if self.mask_path:
+            mask_image = cv2.imread(self.mask_path, cv2.IMREAD_GRAYSCALE)
+            if mask_image is None:
+                raise FileNotFoundError(f"Mask image not found: {self.mask_path}")
+            mask = cv2.resize(mask_image, (width, height), interpolation=cv2.INTER_NEAREST) > 0
+        else:
+            mask = np.ones(shape, dtype=bool)
+        for x, y, w, h in self.ignore_regions:
+            mask[int(y * height):int((y + h) * height), int(x * width):int((x + w) * width)] = False
+        return mask
+    
+    def check(self, frame, now: float = None) -> str:
+        """送信すべきなら理由（'initial'/'change'/'keepalive'）、抑制するならNoneを返す"""
+        now = time.time() if now is None else now
+        thumbnail = self._thumbnail(frame)
+        if self.mask is None or self.mask.shape != thumbnail.shape:
+            self.mask = self._build_mask(thumbnail.shape)
+        
+        reason = None
+        if self.reference is None or self.reference.shape != thumbnail.shape:
+            reason = 'initial'
+        else:
+            changed = (cv2.absdiff(thumbnail, self.reference) > self.pixel_threshold) & self.mask
+            monitored = max(int(self.mask.sum()), 1)
+            if changed.sum() / monitored >= self.min_changed_ratio:
+                reason = 'change'
+            elif now - self.last_upload_at >= self.keepalive_seconds:
+                reason = 'keepalive'
+        
+        if reason is None:
+            with self._lock:
+                self.suppressed_total += 1
+                self._suppressed_pending += 1
+            return None
+        
+        self.reference = thumbnail
+        self.last_upload_at = now
+        return reason
+    
+    def take_suppressed(self) -> int:
+        """前回の報告以降に抑制したフレーム数を取り出す"""
+        with self._lock:
+            count, self._suppressed_pending = self._suppressed_pending, 0
+            return count
+    
+    def restore_suppressed(self, count: int):
+        """送信に失敗した場合、報告できなかった抑制数を戻す"""
+        with self._lock:
+            self._suppressed_pending += count
+
+class AdaptiveController:
+    """送信RTT・失敗・サーバ処理時間からJPEG画質・解像度・fpsを自動調整
+    
+    混雑（失敗、RTT中央値やサーバ処理時間が目標超過）を検出したら画質段階を1つ下げてfpsを半減し、
+    良好な送信が recover_after 回続いたら画質段階を1つ戻す（最上段ならfpsを少しずつ上げる）。
+    """
+    
+    # (解像度の倍率, 画質の下げ幅)
+    TIER_STEPS = [(1.0, 0), (1.0, 15), (0.75, 20), (0.5, 30)]
+    
+    def __init__(self, width: int, height: int, quality: int, max_fps: float, min_fps: float = 0.2,
+                 min_quality: int = 40, target_rtt_ms: float = 500.0, target_processing_ms: float = 300.0,
+                 window: int = 5, recover_after: int = 10):
+        self.tiers = [
+            (int(width * scale) // 2 * 2, int(height * scale) // 2 * 2, max(min_quality, quality - drop))
+            for scale, drop in self.TIER_STEPS
+        ]
+        self.max_fps = max_fps
+        self.min_fps = min(min_fps, max_fps)
+        self.target_rtt_ms = target_rtt_ms
+        self.target_processing_ms = target_processing_ms
+        self.window = window
+        self.recover_after = recover_after
+        
+        self.tier = 0
+        self.fps = max_fps
+        self._rtts = deque(maxlen=window)
+        self._good = 0
+        self._cooldown = 0  # 調整直後は新しい設定でのRTTが溜まるまで判定しない
+        self._lock = threading.Lock()
+    
+    def observe(self, rtt_ms: float = None, processing_time_ms: float = None) -> bool:
+        """送信結果を記録（rtt_msがNoneなら失敗）。設定を変更したらTrue"""
+        with self._lock:
+            if rtt_ms is not None:
+                self._rtts.append(rtt_ms)
+            if self._cooldown > 0:
+                self._cooldown -= 1
+                return False
+            
+            congested = (
+                rtt_ms is None
+                or (len(self._rtts) == self._rtts.maxlen and float(np.median(self._rtts)) > self.target_rtt_ms)
+                or (processing_time_ms or 0) > self.target_processing_ms
+            )
+            if congested:
+                self._good = 0
+                return self._back_off()
+            
+            self._good += 1
+            if self._good >= self.recover_after:
+                self._good = 0
+                return self._recover()
+            return False
+    
+    def _back_off(self) -> bool:
+        tier, fps = min(self.tier + 1, len(self.tiers) - 1), max(self.min_fps, self.fps / 2)
+        return self._set(tier, fps, 'back off')
+    
+    def _recover(self) -> bool:
+        if self.tier > 0:
+            return self._set(self.tier - 1, self.fps, 'recover')
+        return self._set(0, min(self.max_fps, self.fps + self.max_fps * 0.1), 'recover')
+    
+    def _set(self, tier: int, fps: float, reason: str) -> bool:
+        if tier == self.tier and fps == self.fps:
+            return False
+        self.tier, self.fps = tier, fps
+        self._rtts.clear()
+        self._cooldown = self.window
+        width, height, quality = self.tiers[tier]
+        logger.info(f"Adaptive {reason}: {width}x{height} q={quality} fps={fps:.2f}")
+        return True
+    
+    @property
+    def settings(self) -> tuple:
+        """現在の (幅, 高さ, 画質, fps)"""
+        with self._lock:
+            return self.tiers[self.tier] + (self.fps,)
+    
+    def apply(self, client: 'EdgeClient'):
+        """現在の設定をクライアントに反映"""
+        client.capture_width, client.capture_height, client.jpeg_quality, client.fps = self.settings
+
+class LocalDetector:
+    """エッジ側の軽量人物検出（OpenCVのHOG、またはultralyticsがあればYOLO）"""
+    
+    def __init__(self, backend: str = 'hog', model_path: str = 'yolov8n.pt', threshold: float = 0.5,
+                 width: int = 320):
+        self.backend = backend
+        self.threshold = threshold
+        self.width = width  # HOGはこの幅に縮小して検出（CPU負荷を抑える）
+        
+        if backend == 'yolo':
+            try:
+                from ultralytics import YOLO
+            except ImportError:
+                raise ImportError("ultralytics is required for --local-inference yolo")
+            self.model = YOLO(model_path)
+        elif backend == 'hog':
+            self.model = cv2.HOGDescriptor()
+            self.model.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+        else:
+            raise ValueError(f"Unknown local inference backend: {backend}")
+    
+    def detect(self, frame) -> tuple:
+        """人物検出を実行し、([{'confidence', 'bbox'}], 推論時間ms) を返す（bboxは元画像の座標）"""
+        start = time.monotonic()
+        detections = []
+        if self.backend == 'yolo':
+            for result in self.model(frame, conf=self.threshold, classes=[0], verbose=False):
+                for box in result.boxes:
+                    detections.append({
+                        'confidence': float(box.conf[0]),
+                        'bbox': [round(float(v), 1) for v in box.xyxy[0]]
+                    })
+        else:
+            scale = min(1.0, self.width / frame.shape[1])
+            small = cv2.resize(frame, None, fx=scale, fy=scale) if scale < 1.0 else frame
+            rects, weights = self.model.detectMultiScale(small, winStride=(8, 8), padding=(8, 8), scale=1.05)
+            for (x, y, w, h), weight in zip(rects, np.ravel(weights)):
+                confidence = min(float(weight), 1.0)  # SVMスコアを信頼度の代わりに使う
+                if confidence >= self.threshold:
+                    detections.append({
+                        'confidence': round(confidence, 3),
+                        'bbox': [round(float(v) / scale, 1) for v in (x, y, x + w, y + h)]
+                    })
+        return detections, (time.monotonic() - start) * 1000
+
+class EdgeClient:
+    # サーバのレートヒントの画質段階 -> (解像度の倍率, 画質の下げ幅)
+    RATE_HINT_TIERS = {'high': (1.0, 0), 'medium': (1.0, 15), 'low': (0.5, 30)}
+    
+    def __init__(self, device_id: str, server_url: str, api_key: str, transport: str = 'http'):
         self.device_id = device_id
         self.server_url = server_url.rstrip('/')
         self.api_key = api_key
         self.camera = None
+        self.replay_source = None  # ReplaySourceを設定するとカメラの代わりに録画を再生
         self.capture_width = 640
         self.capture_height = 360
         self.jpeg_quality = 80
         self.fps = 1  # 1秒ごとに1フレーム
+        self.transport = transport
+        self.ws_transport = None
+        self.session = None
+        self._set_session_pool(4)
+        self.change_detector = None  # ChangeDetectorを設定すると変化のないフレームを送信しない
+        self.adaptive = None  # AdaptiveControllerを設定すると通信・サーバ負荷に応じて画質とfpsを調整
+        self.rate_hints = None  # enable_rate_hints() でサーバのレートヒントに従う（基準設定とfps上限）
+        
+        # エッジ側推論モード（LocalDetectorを設定すると検出結果のみ送信し、フレームは必要な時だけ添付）
+        self.local_detector = None
+        self.frame_upload_interval = 30.0  # 人物がいる間にフレームを添付する間隔（秒）
+        self._last_frame_upload = 0.0
+        self._last_person_count = 0
+        self._frame_requested = False
+        
+        # オフライン時のスプール（FrameSpoolを設定すると送信できなかったフレームを保存して後で再送）
+        self.spool = None
+        self.replay_fps = 2.0
+        self.replay_batch_size = 8  # サーバの上限（BATCH_MAX_FRAMES）を超えて413が返れば半分に縮める
+        self.replay_max_attempts = 5  # 同じバッチがサーバエラーで失敗し続けた場合に破棄するまでの試行回数
+        self._live_inflight = 0
+        self._live_lock = threading.Lock()
+        self._server_up = threading.Event()
+        
+        if transport == 'websocket':
+            self.ws_transport = WebSocketTransport(device_id, self.server_url, api_key)
         
-        logger.info(f"EdgeClient initialized: device_id={device_id}")
+        logger.info(f"EdgeClient initialized: device_id={device_id}, transport={transport}")
     
     def init_camera(self, camera_index: int = 0):
         """カメラを初期化"""
         try:
-            self.camera = cv2.VideoCapture(camera_index)
+            self.camera = self.replay_source if self.replay_source is not None else cv2.VideoCapture(camera_index)
             if not self.camera.isOpened():
                 raise Exception(f"Cannot open camera {camera_index}")
             
@@ -47,15 +469,17 @@ class EdgeClient:
             logger.error(f"Failed to initialize camera: {e}")
             return False
     
-    def capture_frame(self) -> bytes:
-        """フレームをキャプチャしてJPEGにエンコード"""
-        if not self.camera:
-            raise Exception("Camera not initialized")
-        
-        ret, frame = self.camera.read()
-        if not ret:
-            raise Exception("Failed to capture frame")
-        
+    def _set_session_pool(self, pool_size: int):
+        """keep-aliveで接続を使い回すセッション（同時送信数に合わせたプールサイズ）"""
+        if self.session is not None:
+            self.session.close()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+    
+    def encode_frame(self, frame) -> bytes:
+        """フレームをリサイズしてJPEGにエンコード"""
         # リサイズ
         frame = cv2.resize(frame, (self.capture_width, self.capture_height))
         
@@ -65,12 +489,38 @@ class EdgeClient:
         
         return encoded_img.tobytes()
     
-    def send_image(self, image_data: bytes) -> dict:
-        """画像をサーバに送信"""
+    def read_frame(self):
+        """カメラからフレームを読み込み"""
+        if not self.camera:
+            raise Exception("Camera not initialized")
+        
+        ret, frame = self.camera.read()
+        if not ret:
+            raise Exception("Failed to capture frame")
+        
+        return frame
+    
+    def capture_time(self, now: float) -> float:
+        """最後に読み込んだフレームの撮影時刻（再生ソースなら録画上の時刻）"""
+        return self.replay_source.timestamp if self.replay_source is not None else now
+    
+    @property
+    def replay_finished(self) -> bool:
+        return self.replay_source is not None and self.replay_source.finished
+    
+    def capture_frame(self) -> bytes:
+        """フレームをキャプチャしてJPEGにエンコード"""
+        return self.encode_frame(self.read_frame())
+    
+    def send_image(self, image_data: bytes, captured_at: float = None) -> dict:
+        """画像をサーバに送信（captured_atは撮影時刻のepoch秒、省略時は送信時刻）"""
         url = f"{self.server_url}/ingest"
         
         # リクエストデータの準備
-        timestamp = datetime.now().isoformat()
+        if captured_at is not None:
+            timestamp = datetime.fromtimestamp(captured_at).isoformat()
+        else:
+            timestamp = datetime.now().isoformat()
         
         files = {
             'file': ('image.jpg', image_data, 'image/jpeg')
@@ -85,15 +535,204 @@ class EdgeClient:
             'Authorization': f'Bearer {self.api_key}'
         }
         
+        # 変化検出で抑制したフレーム数をサーバへ報告
+        suppressed = self.change_detector.take_suppressed() if self.change_detector is not None else 0
+        if suppressed:
+            data['suppressed_frames'] = suppressed
+        
         try:
-            response = requests.post(url, files=files, data=data, headers=headers, timeout=30)
+            response = self.session.post(url, files=files, data=data, headers=headers, timeout=30)
             response.raise_for_status()
             return response.json()
         
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to send image: {e}")
+            if suppressed:
+                self.change_detector.restore_suppressed(suppressed)
             raise
     
+    @staticmethod
+    def _is_retryable(error: requests.exceptions.RequestException) -> bool:
+        """サーバに届かなかった（後で再送すべき）エラーか"""
+        if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+            return True
+        response = getattr(error, 'response', None)
+        return response is not None and (response.status_code >= 500 or response.status_code == 429)
+    
+    def deliver(self, image_data: bytes, captured_at: float = None):
+        """ライブフレームを送信し、サーバに届かなければスプールに保存してNoneを返す"""
+        captured_at = time.time() if captured_at is None else captured_at
+        with self._live_lock:
+            self._live_inflight += 1
+        send_start = time.monotonic()
+        try:
+            result = self.send_image(image_data, captured_at)
+            self._server_up.set()
+            self._adapt((time.monotonic() - send_start) * 1000, result.get('processing_time_ms'))
+            self._apply_rate_hint(result.get('rate_hint'))
+            return result
+        except requests.exceptions.RequestException as e:
+            self._adapt(None)
+            if self.spool is None or not self._is_retryable(e):
+                raise
+            self._server_up.clear()
+            self.spool.append(image_data, captured_at)
+            logger.warning(f"Server unreachable, frame spooled ({self.spool.total_bytes() / 1024:.0f}KB pending)")
+            return None
+        finally:
+            with self._live_lock:
+                self._live_inflight -= 1
+    
+    def _adapt(self, rtt_ms: float = None, processing_time_ms: float = None):
+        if self.adaptive is not None and self.adaptive.observe(rtt_ms, processing_time_ms):
+            self.adaptive.apply(self)
+    
+    def send_metadata(self, detections: list, inference_time_ms: float, captured_at: float,
+                      image_data: bytes = None) -> dict:
+        """エッジ側の検出結果を送信（image_dataを渡すとフレームを添付）"""
+        data = {
+            'device_id': self.device_id,
+            'detections': json.dumps(detections),
+            'ts': datetime.fromtimestamp(captured_at).isoformat(),
+            'inference_time_ms': inference_time_ms
+        }
+        suppressed = self.change_detector.take_suppressed() if self.change_detector is not None else 0
+        if suppressed:
+            data['suppressed_frames'] = suppressed
+        files = {'file': ('image.jpg', image_data, 'image/jpeg')} if image_data is not None else None
+        headers = {'Authorization': f'Bearer {self.api_key}'}
+        
+        try:
+            response = self.session.post(f"{self.server_url}/ingest/metadata", data=data, files=files,
+                                         headers=headers, timeout=30)
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.RequestException:
+            if suppressed:
+                self.change_detector.restore_suppressed(suppressed)
+            raise
+    
+    def _should_attach_frame(self, person_count: int, now: float) -> bool:
+        """フレームを添付するか（人物が現れた時・人物がいる間の一定間隔・サーバから要求された時）"""
+        if self._frame_requested:
+            return True
+        if person_count == 0:
+            return False
+        return self._last_person_count == 0 or now - self._last_frame_upload >= self.frame_upload_interval
+    
+    def process_local(self, frame, captured_at: float) -> dict:
+        """エッジ側で推論し、検出結果（必要ならフレームも）を送信"""
+        detections, inference_time_ms = self.local_detector.detect(frame)
+        image_data = None
+        if self._should_attach_frame(len(detections), captured_at):
+            image_data = self.encode_frame(frame)
+        
+        result = self.send_metadata(detections, inference_time_ms, captured_at, image_data)
+        if image_data is not None:
+            self._last_frame_upload = captured_at
+        self._last_person_count = len(detections)
+        self._frame_requested = bool(result.get('frame_requested'))
+        self._apply_rate_hint(result.get('rate_hint'))
+        return result
+    
+    def enable_rate_hints(self, max_fps: float):
+        """サーバのレートヒントに従う（現在の解像度・画質を最高段階、max_fpsをfpsの上限とする）"""
+        self.rate_hints = (self.capture_width, self.capture_height, self.jpeg_quality, max_fps)
+    
+    def _apply_rate_hint(self, hint: dict):
+        """レートヒントの送信間隔・画質段階を反映（適応制御が有効ならより控えめな方を採用）"""
+        if self.rate_hints is None or not hint:
+            return
+        base_width, base_height, base_quality, max_fps = self.rate_hints
+        scale, drop = self.RATE_HINT_TIERS.get(hint.get('quality'), (1.0, 0))
+        width, height = int(base_width * scale) // 2 * 2, int(base_height * scale) // 2 * 2
+        quality = max(10, base_quality - drop)
+        fps = min(max_fps, 1000.0 / max(float(hint.get('next_interval_ms') or 0), 1.0))
+        
+        if self.adaptive is not None:
+            adaptive_width, adaptive_height, adaptive_quality, adaptive_fps = self.adaptive.settings
+            if adaptive_quality < quality:
+                width, height, quality = adaptive_width, adaptive_height, adaptive_quality
+            fps = min(fps, adaptive_fps)
+        
+        if (width, height, quality) != (self.capture_width, self.capture_height, self.jpeg_quality):
+            logger.info(f"Rate hint: quality={hint.get('quality')} ({width}x{height} q={quality}), load={hint.get('load')}")
+        self.capture_width, self.capture_height, self.jpeg_quality, self.fps = width, height, quality, fps
+    
+    def send_batch(self, frames: list) -> dict:
+        """複数フレーム (image_data, captured_at) を /ingest/batch でまとめて送信"""
+        files = [('files', (f'frame{i}.jpg', image_data, 'image/jpeg')) for i, (image_data, _) in enumerate(frames)]
+        data = {
+            'device_ids': [self.device_id] * len(frames),
+            'ts': [datetime.fromtimestamp(captured_at).isoformat() for _, captured_at in frames]
+        }
+        headers = {'Authorization': f'Bearer {self.api_key}'}
+        
+        response = self.session.post(f"{self.server_url}/ingest/batch", files=files, data=data,
+                                     headers=headers, timeout=60)
+        response.raise_for_status()
+        return response.json()
+    
+    def _replay_loop(self, stop: threading.Event):
+        """スプールの再送: サーバ復帰後、ライブ送信の合間にreplay_fps以下の速度でまとめて送る"""
+        failed_cursor, attempts = None, 0
+        while not stop.is_set():
+            if not self._server_up.wait(timeout=1.0):
+                continue
+            
+            # ライブフレームの送信中はそちらを優先
+            with self._live_lock:
+                live_busy = self._live_inflight > 0
+            if live_busy:
+                stop.wait(0.05)
+                continue
+            
+            frames, cursor = self.spool.read_batch(self.replay_batch_size)
+            if not frames:
+                stop.wait(1.0)
+                continue
+            
+            batch_start = time.monotonic()
+            try:
+                result = self.send_batch(frames)
+                errors = [r for r in result.get('results', []) if r and 'error' in r]
+                if errors:
+                    logger.warning(f"Replay: {len(errors)} spooled frames rejected by server")
+                self.spool.ack(cursor)
+                logger.info(f"Replayed {len(frames)} spooled frames ({self.spool.total_bytes() / 1024:.0f}KB pending)")
+            except requests.exceptions.RequestException as e:
+                status = e.response.status_code if getattr(e, 'response', None) is not None else None
+                if status == 413 and len(frames) > 1:
+                    # バッチがサーバの上限を超えている: 縮めて同じ位置から送り直す
+                    self.replay_batch_size = max(1, len(frames) // 2)
+                    logger.warning(f"Replay batch too large, shrinking to {self.replay_batch_size} frames")
+                    continue
+                if self._is_retryable(e):
+                    self._server_up.clear()
+                    if status is None or status == 429:
+                        logger.warning(f"Replay paused, server unreachable: {e}")
+                        continue
+                    # サーバエラーは同じバッチで繰り返し起きうるため、試行回数を制限する
+                    attempts = attempts + 1 if cursor == failed_cursor else 1
+                    failed_cursor = cursor
+                    if attempts < self.replay_max_attempts:
+                        logger.warning(f"Replay paused, server error ({attempts}/{self.replay_max_attempts}): {e}")
+                        continue
+                # 再送しても受け付けられないバッチは破棄
+                logger.error(f"Replay batch rejected, dropping {len(frames)} spooled frames: {e}")
+                self.spool.ack(cursor)
+            
+            # 再送レートの制限
+            stop.wait(max(0.0, len(frames) / self.replay_fps - (time.monotonic() - batch_start)))
+    
+    def _start_replay(self, stop: threading.Event):
+        """スプールが設定されていれば再送スレッドを開始"""
+        if self.spool is None:
+            return None
+        thread = threading.Thread(target=self._replay_loop, args=(stop,), name='spool-replay', daemon=True)
+        thread.start()
+        return thread
+    
     def run_continuous(self):
         """連続実行モード"""
         logger.info("Starting continuous capture mode...")
@@ -101,37 +740,199 @@ class EdgeClient:
         if not self.init_camera():
             return
         
+        stop = threading.Event()
+        self._start_replay(stop)
+        
         try:
-            while True:
+            while not self.replay_finished:
                 start_time = time.time()
                 
+                # 再生ソースを待たずに流す場合は送信間隔を空けない
+                interval = 0.0 if self.replay_source is not None and self.replay_source.pacing == 'fast' else 1.0 / self.fps
+                
                 try:
                     # フレームキャプチャ
-                    image_data = self.capture_frame()
+                    frame = self.read_frame()
+                    captured_at = self.capture_time(start_time)
+                    
+                    # シーンに変化がなければ送信しない（キープアライブ間隔ごとには送信）
+                    if self.change_detector is not None and self.change_detector.check(frame, captured_at) is None:
+                        logger.debug("Frame suppressed (no scene change)")
+                        time.sleep(max(0, interval - (time.time() - start_time)))
+                        continue
                     
-                    # サーバに送信
-                    result = self.send_image(image_data)
+                    if self.local_detector is not None:
+                        # エッジ側で推論し、検出結果のみ送信
+                        result = self.process_local(frame, captured_at)
+                        logger.info(f"Sent detections: persons={result.get('person_count', 0)}, "
+                                    f"anomaly={result.get('anomaly_detected', False)}, "
+                                    f"frame_requested={result.get('frame_requested', False)}")
+                        time.sleep(max(0, interval - (time.time() - start_time)))
+                        continue
                     
-                    # ログ出力
-                    person_count = result.get('person_count', 0)
-                    anomaly = result.get('anomaly_detected', False)
-                    processing_time = result.get('processing_time_ms', 0)
+                    image_data = self.encode_frame(frame)
                     
-                    logger.info(f"Sent frame: persons={person_count}, anomaly={anomaly}, processing_time={processing_time:.1f}ms")
+                    if self.ws_transport is not None:
+                        # WebSocketで送信（結果は受信スレッドで非同期に処理）
+                        if not self.ws_transport.connected:
+                            self.ws_transport.connect()
+                        suppressed = self.change_detector.take_suppressed() if self.change_detector is not None else 0
+                        try:
+                            seq = self.ws_transport.send_frame(image_data, captured_at, suppressed)
+                        except Exception:
+                            if suppressed:
+                                self.change_detector.restore_suppressed(suppressed)
+                            raise
+                        logger.debug(f"Queued frame seq={seq} ({len(image_data)} bytes)")
+                        interval = max(interval, self.ws_transport.throttle_interval)
+                    else:
+                        # サーバに送信（届かなければスプールへ。スプール時も送信間隔は維持する）
+                        result = self.deliver(image_data, captured_at)
+                        if result is not None:
+                            # ログ出力
+                            person_count = result.get('person_count', 0)
+                            anomaly = result.get('anomaly_detected', False)
+                            processing_time = result.get('processing_time_ms', 0)
+                            
+                            logger.info(f"Sent frame: persons={person_count}, anomaly={anomaly}, processing_time={processing_time:.1f}ms")
                     
                 except Exception as e:
                     logger.error(f"Error in capture/send cycle: {e}")
+                    if self.ws_transport is not None:
+                        self.ws_transport.close()
                 
-                # 1秒間隔を維持
+                # 送信間隔を維持（デフォルト1秒、サーバからthrottle要求があればそれ以上）
                 elapsed = time.time() - start_time
-                sleep_time = max(0, 1.0 - elapsed)
+                sleep_time = max(0, interval - elapsed)
                 if sleep_time > 0:
                     time.sleep(sleep_time)
+            
+            if self.replay_finished:
+                logger.info("Replay finished")
         
         except KeyboardInterrupt:
             logger.info("Stopping capture...")
         
         finally:
+            stop.set()
+            if self.ws_transport is not None:
+                self.ws_transport.close()
+            if self.camera:
+                self.camera.release()
+                logger.info("Camera released")
+    
+    def _capture_loop(self, slot: LatestFrame, stop: threading.Event, stats: PipelineStats):
+        """キャプチャ段: カメラから読み続け、最新フレームだけをスロットに残す"""
+        while not stop.is_set():
+            ret, frame = self.camera.read()
+            if not ret:
+                if self.replay_finished:
+                    break
+                stats.incr('capture_failed')
+                time.sleep(0.01)
+                continue
+            stats.incr('captured')
+            slot.put(frame, self.capture_time(time.time()))
+    
+    def _upload_loop(self, upload_queue: queue.Queue, stop: threading.Event, stats: PipelineStats):
+        """送信段: キューからフレームを取り出して送信（スレッド数 = 同時送信数）"""
+        while not stop.is_set():
+            try:
+                image_data, captured_at = upload_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            
+            stats.begin_upload()
+            send_start = time.monotonic()
+            try:
+                result = self.deliver(image_data, captured_at)
+            except Exception:
+                stats.end_upload(None)
+                continue
+            if result is None:
+                stats.end_upload(None)
+                stats.incr('spooled')
+                continue
+            stats.end_upload((time.monotonic() - send_start) * 1000)
+            logger.debug(f"Sent frame: persons={result.get('person_count', 0)}, "
+                         f"anomaly={result.get('anomaly_detected', False)}")
+    
+    def run_pipelined(self, max_inflight: int = 2, stats_interval: float = 10.0):
+        """パイプライン実行モード: キャプチャ・エンコード・送信を並行させ、通信遅延があってもfpsを維持"""
+        logger.info(f"Starting pipelined capture mode (fps={self.fps}, max_inflight={max_inflight})...")
+        
+        if not self.init_camera():
+            return
+        
+        self._set_session_pool(max_inflight)
+        slot = LatestFrame()
+        stats = PipelineStats()
+        stop = threading.Event()
+        # 送信待ちは同時送信数分まで。溢れたら古いフレームから捨てて鮮度を優先
+        upload_queue: queue.Queue = queue.Queue(maxsize=max_inflight)
+        
+        threads = [threading.Thread(target=self._capture_loop, args=(slot, stop, stats), name='capture', daemon=True)]
+        threads += [
+            threading.Thread(target=self._upload_loop, args=(upload_queue, stop, stats),
+                             name=f'uploader-{i}', daemon=True)
+            for i in range(max_inflight)
+        ]
+        for thread in threads:
+            thread.start()
+        replay_thread = self._start_replay(stop)
+        if replay_thread is not None:
+            threads.append(replay_thread)
+        
+        try:
+            next_tick = time.monotonic()
+            last_log = next_tick
+            while True:
+                # エンコード段: fps間隔で最新フレームを取り出してエンコード
+                item = slot.take(timeout=1.0)
+                if item is None and self.replay_finished:
+                    break
+                if item is not None and (
+                    self.change_detector is None or self.change_detector.check(item[0], item[1]) is not None
+                ):
+                    frame, captured_at = item
+                    image_data = self.encode_frame(frame)
+                    stats.incr('encoded')
+                    try:
+                        upload_queue.put_nowait((image_data, captured_at))
+                    except queue.Full:
+                        try:
+                            upload_queue.get_nowait()
+                            stats.incr('upload_dropped')
+                        except queue.Empty:
+                            pass
+                        upload_queue.put_nowait((image_data, captured_at))
+                
+                now = time.monotonic()
+                if now - last_log >= stats_interval:
+                    stats.log(slot, upload_queue)
+                    last_log = now
+                
+                next_tick += 1.0 / self.fps
+                sleep_time = next_tick - time.monotonic()
+                if sleep_time > 0:
+                    time.sleep(sleep_time)
+                else:
+                    # 処理が間に合わなかった場合は遅れを持ち越さない
+                    next_tick = time.monotonic()
+            
+            # 再生が終わったら送信待ち・送信中のフレームを送り切ってから終了
+            while not upload_queue.empty() or stats.in_flight > 0:
+                time.sleep(0.05)
+            logger.info("Replay finished")
+        
+        except KeyboardInterrupt:
+            logger.info("Stopping capture...")
+        
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join(timeout=5)
+            stats.log(slot, upload_queue)
             if self.camera:
                 self.camera.release()
                 logger.info("Camera released")
@@ -162,13 +963,100 @@ def main():
     parser.add_argument('--camera-index', type=int, default=0, help='Camera index')
     parser.add_argument('--test-image', help='Path to test image file')
     parser.add_argument('--mode', choices=['continuous', 'test'], default='continuous', help='Running mode')
+    parser.add_argument('--transport', choices=['http', 'websocket'], default='http',
+                        help="Frame transport for continuous mode (websocket keeps one long-lived connection; not supported with --pipeline)")
+    parser.add_argument('--fps', type=float, default=1.0, help='Target frames per second')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='Pipelined capture/encode/upload (keeps fps regardless of network latency)')
+    parser.add_argument('--max-inflight', type=int, default=2, help='Concurrent uploads in pipeline mode')
+    parser.add_argument('--motion', action='store_true',
+                        help='Upload only when the scene changes (plus periodic keepalive frames)')
+    parser.add_argument('--motion-threshold', type=int, default=25, help='Per-pixel gray level change (0-255)')
+    parser.add_argument('--motion-ratio', type=float, default=0.01,
+                        help='Fraction of monitored pixels that must change to upload')
+    parser.add_argument('--motion-keepalive', type=float, default=60.0, help='Keepalive upload interval (seconds)')
+    parser.add_argument('--motion-mask', help='Mask image (white = monitored area)')
+    parser.add_argument('--ignore-region', action='append', default=[], metavar='X,Y,W,H',
+                        help='Region to ignore as fractions of the frame (repeatable), e.g. 0,0,1,0.1')
+    
+    parser.add_argument('--adaptive', action='store_true',
+                        help='Adjust JPEG quality, resolution and fps to upload RTT and server load (HTTP only)')
+    parser.add_argument('--min-fps', type=float, default=0.2, help='Lowest fps the adaptive controller may use')
+    parser.add_argument('--min-quality', type=int, default=40, help='Lowest JPEG quality for adaptive mode')
+    parser.add_argument('--target-rtt-ms', type=float, default=500.0, help='Upload RTT above which to back off')
+    parser.add_argument('--target-processing-ms', type=float, default=300.0,
+                        help='Server processing time above which to back off')
+    parser.add_argument('--follow-hints', action='store_true',
+                        help='Follow server rate hints (next frame interval and quality tier)')
+    parser.add_argument('--max-fps', type=float, default=5.0, help='Upper fps bound when following rate hints')
+    parser.add_argument('--local-inference', choices=['hog', 'yolo'],
+                        help='Run person detection on the device and upload detections instead of frames')
+    parser.add_argument('--local-model', default='yolov8n.pt', help='Model file for --local-inference yolo')
+    parser.add_argument('--local-threshold', type=float, default=0.5, help='Local detection confidence threshold')
+    parser.add_argument('--frame-interval', type=float, default=30.0,
+                        help='While persons are present, attach a frame at most this often (seconds)')
+    parser.add_argument('--replay', metavar='PATH', help='Replay a video file or image directory instead of a camera')
+    parser.add_argument('--replay-pacing', choices=ReplaySource.PACINGS, default='realtime',
+                        help='realtime, accelerated (speed) or as fast as possible (fast)')
+    parser.add_argument('--replay-speed', type=float, default=1.0, help='Playback speed for --replay-pacing speed')
+    parser.add_argument('--replay-loop', action='store_true', help='Loop the recording')
+    parser.add_argument('--replay-seek', type=float, default=0.0, help='Start position in seconds')
+    parser.add_argument('--source-fps', type=float, help='Frame rate of an image directory (default: 10)')
+    parser.add_argument('--replay-epoch', default='2025-01-01T00:00:00',
+                        help='Capture timestamp of the first replayed frame (ISO format)')
+    parser.add_argument('--spool-dir', help='Store frames on disk while the server is unreachable and replay later')
+    parser.add_argument('--spool-max-mb', type=float, default=512, help='Spool size cap (oldest frames evicted)')
+    parser.add_argument('--replay-fps', type=float, default=2.0, help='Max replay rate for spooled frames')
     
     args = parser.parse_args()
+    if args.pipeline and args.local_inference:
+        # パイプラインモードはフレームをそのまま /ingest へ送るため、エッジ側推論とは併用できない
+        parser.error("--local-inference cannot be combined with --pipeline")
+    if args.pipeline and args.transport == 'websocket':
+        # パイプラインモードは複数の送信スレッドから HTTP で並行送信するため、WebSocket 送信には対応しない
+        parser.error("--transport websocket cannot be combined with --pipeline")
     
-    client = EdgeClient(args.device_id, args.server_url, args.api_key)
+    client = EdgeClient(args.device_id, args.server_url, args.api_key, transport=args.transport)
+    client.fps = args.fps
+    if args.spool_dir:
+        client.spool = FrameSpool(args.spool_dir, max_total_bytes=int(args.spool_max_mb * 1024 * 1024))
+        client.replay_fps = args.replay_fps
+    if args.adaptive:
+        client.adaptive = AdaptiveController(
+            client.capture_width, client.capture_height, client.jpeg_quality, args.fps,
+            min_fps=args.min_fps,
+            min_quality=args.min_quality,
+            target_rtt_ms=args.target_rtt_ms,
+            target_processing_ms=args.target_processing_ms
+        )
+    if args.replay:
+        client.replay_source = ReplaySource(
+            args.replay,
+            pacing=args.replay_pacing,
+            speed=args.replay_speed,
+            loop=args.replay_loop,
+            seek_seconds=args.replay_seek,
+            fps=args.source_fps,
+            base_time=datetime.fromisoformat(args.replay_epoch).timestamp()
+        )
+    if args.local_inference:
+        client.local_detector = LocalDetector(args.local_inference, args.local_model, args.local_threshold)
+        client.frame_upload_interval = args.frame_interval
+    if args.follow_hints:
+        client.enable_rate_hints(args.max_fps)
+    if args.motion:
+        client.change_detector = ChangeDetector(
+            pixel_threshold=args.motion_threshold,
+            min_changed_ratio=args.motion_ratio,
+            keepalive_seconds=args.motion_keepalive,
+            mask_path=args.motion_mask,
+            ignore_regions=[tuple(float(v) for v in region.split(',')) for region in args.ignore_region]
+        )
     
     if args.mode == 'test' and args.test_image:
         client.send_test_image(args.test_image)
+    elif args.mode == 'continuous' and args.pipeline:
+        client.run_pipelined(max_inflight=args.max_inflight)
     elif args.mode == 'continuous':
         client.run_continuous()
     else:
@@ -0,0 +1,167 @@
+import time
+import logging
+from pathlib import Path
+from typing import Optional
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+class ReplaySource:
+    """録画ファイル・画像ディレクトリを cv2.VideoCapture と同じ read() で返す再生ソース
+
+    pacing:
+      - 'realtime': 実時間で再生（カメラと同様、read() は再生位置の最新フレームを返し途中は読み飛ばす）
+      - 'speed': speed 倍速で再生（読み飛ばしは realtime と同じ）
+      - 'fast': 待たずに全フレームを順番に返す（スループット計測用）
+
+    各フレームの撮影時刻は base_time + フレーム番号 / fps で決まるため、同じ入力なら毎回同じ時刻になる。
+    """
+
+    PACINGS = ('realtime', 'speed', 'fast')
+
+    def __init__(self, path: str, pacing: str = 'realtime', speed: float = 1.0, loop: bool = False,
+                 seek_seconds: float = 0.0, fps: Optional[float] = None, base_time: float = 0.0):
+        if pacing not in self.PACINGS:
+            raise ValueError(f"Unknown pacing: {pacing}")
+        self.path = Path(path)
+        self.pacing = pacing
+        self.speed = speed if pacing == 'speed' else 1.0
+        self.loop = loop
+        self.base_time = base_time
+        self.finished = False
+        self.loops = 0
+
+        self._capture = None
+        self._images = None
+        if self.path.is_dir():
+            self._images = sorted(p for p in self.path.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+            if not self._images:
+                raise FileNotFoundError(f"No images found in {self.path}")
+            self.fps = fps or 10.0
+            self.frame_count = len(self._images)
+        else:
+            self._capture = cv2.VideoCapture(str(self.path))
+            if not self._capture.isOpened():
+                raise FileNotFoundError(f"Cannot open video: {self.path}")
+            self.fps = fps or self._capture.get(cv2.CAP_PROP_FPS) or 30.0
+            self.frame_count = int(self._capture.get(cv2.CAP_PROP_FRAME_COUNT)) or 0
+
+        self.start_index = self._clamp(int(seek_seconds * self.fps))
+        self.index = self.start_index - 1  # 最後に返したフレーム番号
+        self._position = self.start_index  # 次に読むフレーム番号（動画の読み出し位置）
+        self._started_at = None
+        self._seek_index(self.start_index)
+
+    @property
+    def timestamp(self) -> float:
+        """最後に返したフレームの撮影時刻（epoch秒、ループしても単調増加）"""
+        frames = self.loops * (self.frame_count - self.start_index) + self.index - self.start_index
+        return self.base_time + frames / self.fps
+
+    def isOpened(self) -> bool:
+        return not self.finished
+
+    def set(self, prop_id: int, value) -> bool:
+        """カメラ設定（解像度など）は再生ソースでは無視"""
+        return False
+
+    def get(self, prop_id: int) -> float:
+        if prop_id == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop_id == cv2.CAP_PROP_FRAME_COUNT:
+            return float(self.frame_count)
+        if prop_id == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.index + 1)
+        return 0.0
+
+    def _clamp(self, index: int) -> int:
+        return min(max(index, 0), self.frame_count - 1) if self.frame_count else max(index, 0)
+
+    def seek(self, seconds: float):
+        """再生位置を移動（ペース計算もこの位置から始め直す）"""
+        self._seek_index(self._clamp(int(seconds * self.fps)))
+
+    def _seek_index(self, index: int):
+        if self._capture is not None:
+            self._capture.set(cv2.CAP_PROP_POS_FRAMES, index)
+        self._position = index
+        self.index = index - 1
+        self._started_at = None
+
+    def _due_index(self) -> int:
+        """ペースに従って今返すべきフレーム番号（次のフレームまで待つ）"""
+        next_index = self.index + 1
+        if self.pacing == 'fast':
+            return next_index
+        now = time.monotonic()
+        if self._started_at is None:
+            self._started_at = now - (next_index - self.start_index) / (self.fps * self.speed)
+        due_at = self._started_at + (next_index - self.start_index) / (self.fps * self.speed)
+        if due_at > now:
+            time.sleep(due_at - now)
+            return next_index
+        # 遅れている分は読み飛ばす（カメラと同様に最新フレームを返す）
+        return self.start_index + int((now - self._started_at) * self.fps * self.speed)
+
+    def _rewind(self) -> bool:
+        if not self.loop:
+            self.finished = True
+            return False
+        self.loops += 1
+        started_at = self._started_at
+        self._seek_index(self.start_index)
+        if started_at is not None:
+            # 経過時間を引き継いでペースを保つ
+            self._started_at = started_at + (self.frame_count - self.start_index) / (self.fps * self.speed)
+        return True
+
+    def read(self):
+        """次のフレームを (ret, frame) で返す（終端でloopしなければ (False, None)）
+
+        画像ディレクトリで読めない画像はログに残して次の画像へ進む（全画像が読めなければ終了）。
+        """
+        unreadable = 0
+        while not self.finished:
+            target = self._due_index()
+            while self.frame_count and target >= self.frame_count:
+                if not self._rewind():
+                    return False, None
+                target -= self.frame_count - self.start_index
+
+            if self._images is not None:
+                frame = cv2.imread(str(self._images[target]))
+                if frame is None:
+                    logger.warning(f"Skipping unreadable image: {self._images[target]}")
+                    self.index = target
+                    unreadable += 1
+                    if unreadable >= self.frame_count:
+                        break
+                    continue
+                ok = True
+            else:
+                # 読み飛ばすフレームはデコードしない
+                while self._position < target:
+                    if not self._capture.grab():
+                        break
+                    self._position += 1
+                ok, frame = self._capture.read()
+                self._position += 1
+                if not ok:
+                    if self._rewind():
+                        continue
+                    break
+
+            self.index = target
+            return True, frame
+
+        self.finished = True
+        return False, None
+
+    def release(self):
+        if self._capture is not None:
+            self._capture.release()
+        self.finished = True
@@ -0,0 +1,143 @@
+import os
+import struct
+import logging
+import threading
+from pathlib import Path
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class FrameSpool:
+    """オフライン時のフレームを保存するディスクスプール（セグメントファイル + 容量上限）
+
+    各セグメントは「ヘッダー(撮影時刻 float64, 長さ uint32) + JPEG」のレコードを追記したファイル。
+    合計サイズが上限を超えると最も古いセグメントから削除する。読み出し位置は
+    セグメントごとの .pos ファイルに保存し、再起動後も続きから再送できる。
+    """
+
+    RECORD_HEADER = struct.Struct('!dI')
+    SEGMENT_SUFFIX = '.seg'
+
+    def __init__(self, directory: str, segment_max_bytes: int = 8 * 1024 * 1024,
+                 max_total_bytes: int = 512 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_max_bytes = segment_max_bytes
+        self.max_total_bytes = max(max_total_bytes, segment_max_bytes)
+        self.evicted_frames = 0
+        self._lock = threading.Lock()
+        self._active = None  # 書き込み中のセグメント
+
+        segments = self._segments()
+        self._next_index = int(segments[-1].stem) + 1 if segments else 1
+        if segments:
+            logger.info(f"Spool opened with {len(segments)} segments ({self.total_bytes() / 1024:.0f}KB pending)")
+
+    def _segments(self) -> List[Path]:
+        return sorted(self.directory.glob(f'*{self.SEGMENT_SUFFIX}'))
+
+    def _pos_path(self, segment: Path) -> Path:
+        return segment.with_suffix('.pos')
+
+    def _read_pos(self, segment: Path) -> int:
+        try:
+            return int(self._pos_path(segment).read_text())
+        except (OSError, ValueError):
+            return 0
+
+    def _remove(self, segment: Path):
+        segment.unlink(missing_ok=True)
+        self._pos_path(segment).unlink(missing_ok=True)
+        if segment == self._active:
+            self._active = None
+
+    def total_bytes(self) -> int:
+        """未送信のバイト数（走査中に削除されたセグメントは数えない）"""
+        with self._lock:
+            total = 0
+            for segment in self._segments():
+                try:
+                    total += segment.stat().st_size - self._read_pos(segment)
+                except FileNotFoundError:
+                    continue
+            return total
+
+    def __len__(self) -> int:
+        """未送信のフレーム数（セグメントを走査して数える）"""
+        with self._lock:
+            return sum(len(self._scan(segment, self._read_pos(segment))) for segment in self._segments())
+
+    def append(self, image_data: bytes, captured_at: float):
+        """フレームを追記（容量超過時は古いセグメントから削除）"""
+        record = self.RECORD_HEADER.pack(captured_at, len(image_data)) + image_data
+        with self._lock:
+            if self._active is None or self._active.stat().st_size + len(record) > self.segment_max_bytes:
+                self._active = self.directory / f'{self._next_index:012d}{self.SEGMENT_SUFFIX}'
+                self._next_index += 1
+            with open(self._active, 'ab') as f:
+                f.write(record)
+                f.flush()
+            self._enforce_limit()
+
+    def _enforce_limit(self):
+        segments = self._segments()
+        total = sum(segment.stat().st_size for segment in segments)
+        while total > self.max_total_bytes and len(segments) > 1:
+            oldest = segments.pop(0)
+            dropped = len(self._scan(oldest, self._read_pos(oldest)))
+            total -= oldest.stat().st_size
+            self._remove(oldest)
+            self.evicted_frames += dropped
+            logger.warning(f"Spool full: evicted segment {oldest.name} ({dropped} frames)")
+
+    def _scan(self, segment: Path, offset: int, limit: int = None) -> List[Tuple[int, float, int]]:
+        """セグメント内のレコード位置 (offset, captured_at, length) を列挙（途中で切れたレコードは無視）"""
+        records = []
+        try:
+            with open(segment, 'rb') as f:
+                f.seek(offset)
+                while limit is None or len(records) < limit:
+                    header = f.read(self.RECORD_HEADER.size)
+                    if len(header) < self.RECORD_HEADER.size:
+                        break
+                    captured_at, length = self.RECORD_HEADER.unpack(header)
+                    f.seek(length, os.SEEK_CUR)
+                    if f.tell() > os.fstat(f.fileno()).st_size:
+                        break
+                    records.append((offset, captured_at, length))
+                    offset += self.RECORD_HEADER.size + length
+        except FileNotFoundError:
+            pass
+        return records
+
+    def read_batch(self, max_frames: int) -> Tuple[List[Tuple[bytes, float]], tuple]:
+        """最も古いフレームから最大max_frames件を読み出す。送信成功後に ack(cursor) を呼ぶ"""
+        with self._lock:
+            for segment in self._segments():
+                start = self._read_pos(segment)
+                records = self._scan(segment, start, max_frames)
+                if not records:
+                    if segment != self._active:
+                        self._remove(segment)  # 読み終わったセグメント
+                    continue
+
+                frames = []
+                with open(segment, 'rb') as f:
+                    for offset, captured_at, length in records:
+                        f.seek(offset + self.RECORD_HEADER.size)
+                        frames.append((f.read(length), captured_at))
+                last_offset, _, last_length = records[-1]
+                return frames, (segment, last_offset + self.RECORD_HEADER.size + last_length)
+        return [], None
+
+    def ack(self, cursor: tuple):
+        """read_batchで読み出したフレームを送信済みとして記録"""
+        segment, offset = cursor
+        with self._lock:
+            if not segment.exists():
+                return
+            if segment != self._active and offset >= segment.stat().st_size:
+                self._remove(segment)
+            else:
+                self._pos_path(segment).write_text(str(offset))
@@ -0,0 +1,104 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+from event_hub import EventHub
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache:
+    """TTL・件数上限付きの処理結果キャッシュ（デバイス別の結果配信を含む）"""
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 300, subscriber_buffer: int = 32):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # event_id -> (有効期限, レコード)。期限は一律なので先頭ほど古い
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        # 完了・失敗した結果のデバイス別配信
+        self.hub = EventHub(buffer_size=subscriber_buffer)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _expire(self, now: float):
+        while self._entries:
+            event_id, (expires_at, _) = next(iter(self._entries.items()))
+            if expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            self._entries.popitem(last=False)
+
+    def _store(self, event_id: str, record: dict):
+        now = time.time()
+        self._entries[event_id] = (now + self.ttl_seconds, record)
+        self._entries.move_to_end(event_id)
+        self._expire(now)
+
+    def put_pending(self, event_id: str, device_id: str):
+        """受付済み（処理待ち）として登録"""
+        self._store(event_id, {'status': 'queued', 'event_id': event_id, 'device_id': device_id})
+
+    def set_result(self, event_id: str, device_id: str, result: dict):
+        """処理結果を登録し、デバイスの購読者へ配信"""
+        self._store(event_id, {'status': 'done', 'event_id': event_id, 'device_id': device_id, 'result': result})
+        self.hub.publish({'status': 'done', **result})
+
+    def set_error(self, event_id: str, device_id: str, detail: str):
+        """処理失敗を登録し、デバイスの購読者へ配信"""
+        record = {'status': 'error', 'event_id': event_id, 'device_id': device_id, 'detail': detail}
+        self._store(event_id, record)
+        self.hub.publish(record)
+
+    def get(self, event_id: str) -> Optional[dict]:
+        self._expire(time.time())
+        entry = self._entries.get(event_id)
+        return entry[1] if entry is not None else None
+
+
+class AsyncIngestQueue:
+    """受付済みフレームの処理キュー（202 Accepted を返した後に非同期で推論）"""
+
+    def __init__(self, process: Callable[..., Awaitable[dict]], results: ResultCache,
+                 max_pending: int = 64, workers: int = 2):
+        self.process = process
+        self.results = results
+        self.workers = workers
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._tasks = []
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    async def start(self):
+        """ワーカータスクを起動"""
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def submit(self, event_id: str, device_id: str, contents: bytes, timestamp, start_time) -> bool:
+        """フレームを処理待ちに追加（満杯ならFalse）"""
+        try:
+            self._queue.put_nowait((event_id, device_id, contents, timestamp, start_time))
+        except asyncio.QueueFull:
+            return False
+        self.results.put_pending(event_id, device_id)
+        return True
+
+    async def _worker(self):
+        while True:
+            event_id, device_id, contents, timestamp, start_time = await self._queue.get()
+            try:
+                result = await self.process(device_id, contents, timestamp, start_time, event_id=event_id)
+                self.results.set_result(event_id, device_id, result)
+            except Exception as e:
+                detail = getattr(e, 'detail', None) or str(e)
+                logger.error(f"Error processing queued frame {event_id} from {device_id}: {detail}")
+                self.results.set_error(event_id, device_id, detail)
+            finally:
+                self._queue.task_done()
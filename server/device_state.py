@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceState:
+    """デバイスごとのアラート状態（1デバイス1レコード）"""
+
+    __slots__ = ('last_alert_at', 'last_event_sig', 'last_seen', 'frame_count', 'alert_count', 'suppressed_count')
+
+    def __init__(self, last_alert_at: Optional[float] = None, last_event_sig: Optional[str] = None,
+                 last_seen: float = 0.0, frame_count: int = 0, alert_count: int = 0, suppressed_count: int = 0):
+        self.last_alert_at = last_alert_at
+        self.last_event_sig = last_event_sig
+        self.last_seen = last_seen
+        self.frame_count = frame_count
+        self.alert_count = alert_count
+        self.suppressed_count = suppressed_count  # エッジ側の変化検出で送信されなかったフレーム数
+
+    def to_dict(self) -> dict:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'DeviceState':
+        return cls(
+            last_alert_at=data.get('last_alert_at'),
+            last_event_sig=data.get('last_event_sig'),
+            last_seen=float(data.get('last_seen') or 0.0),
+            frame_count=int(data.get('frame_count') or 0),
+            alert_count=int(data.get('alert_count') or 0),
+            suppressed_count=int(data.get('suppressed_count') or 0)
+        )
+
+
+class DeviceStateStore:
+    """LRU/アイドル追い出し付きのデバイス状態ストア（JSONスナップショット対応）"""
+
+    def __init__(self, snapshot_path: Path, max_devices: int = 10000,
+                 idle_seconds: float = 86400, max_load_seconds: float = 2.0):
+        self.snapshot_path = Path(snapshot_path)
+        self.max_devices = max_devices
+        self.idle_seconds = idle_seconds
+        self.max_load_seconds = max_load_seconds
+        self._states: 'OrderedDict[str, DeviceState]' = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def __contains__(self, device_id: str) -> bool:
+        return device_id in self._states
+
+    def get(self, device_id: str) -> Optional[DeviceState]:
+        """状態を取得（存在しなければNone）"""
+        with self._lock:
+            state = self._states.get(device_id)
+            if state is not None:
+                self._states.move_to_end(device_id)
+            return state
+
+    def get_or_create(self, device_id: str, now: Optional[float] = None) -> DeviceState:
+        """状態を取得し、なければ作成してLRU末尾に置く"""
+        now = time.time() if now is None else now
+        with self._lock:
+            state = self._states.get(device_id)
+            if state is None:
+                state = DeviceState(last_seen=now)
+                self._states[device_id] = state
+                self._evict_overflow()
+            else:
+                self._states.move_to_end(device_id)
+            return state
+
+    def record_frame(self, device_id: str, now: Optional[float] = None) -> DeviceState:
+        """フレーム受信を記録"""
+        now = time.time() if now is None else now
+        state = self.get_or_create(device_id, now)
+        state.last_seen = now
+        state.frame_count += 1
+        return state
+
+    def record_suppressed(self, device_id: str, count: int) -> DeviceState:
+        """エッジ側で抑制されたフレーム数を加算"""
+        state = self.get_or_create(device_id)
+        state.suppressed_count += count
+        return state
+
+    def record_alert(self, device_id: str, alert_at: float, event_sig: str) -> DeviceState:
+        """アラート送信を記録"""
+        state = self.get_or_create(device_id, alert_at)
+        state.last_alert_at = alert_at
+        state.last_event_sig = event_sig
+        state.last_seen = max(state.last_seen, alert_at)
+        state.alert_count += 1
+        return state
+
+    def try_claim_alert(self, device_id: str, event_sig: str, now: float, cooldown_seconds: float) -> bool:
+        """クールダウンと重複を判定し、送信可能ならその場でアラートを記録"""
+        with self._lock:
+            state = self._states.get(device_id)
+            if state is not None:
+                if state.last_alert_at is not None and now - state.last_alert_at < cooldown_seconds:
+                    return False
+                if state.last_event_sig == event_sig:
+                    return False
+            self.record_alert(device_id, now, event_sig)
+            return True
+
+    def _evict_overflow(self):
+        while len(self._states) > self.max_devices:
+            device_id, _ = self._states.popitem(last=False)
+            logger.debug(f"Evicted device state (LRU): {device_id}")
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """一定時間フレームが来ていないデバイスを削除"""
+        now = time.time() if now is None else now
+        cutoff = now - self.idle_seconds
+        evicted = 0
+        with self._lock:
+            # LRU順なので先頭から古い順に並んでいる
+            while self._states:
+                device_id, state = next(iter(self._states.items()))
+                if state.last_seen >= cutoff:
+                    break
+                self._states.popitem(last=False)
+                evicted += 1
+        if evicted:
+            logger.info(f"Evicted {evicted} idle device states")
+        return evicted
+
+    def snapshot(self) -> Dict[str, dict]:
+        """LRU順のスナップショットを作成"""
+        with self._lock:
+            return {device_id: state.to_dict() for device_id, state in self._states.items()}
+
+    def save(self):
+        """スナップショットをJSONファイルへ書き出し（アトミックに置き換え）"""
+        data = {'saved_at': time.time(), 'devices': self.snapshot()}
+        # 複数ワーカーが同じファイルへ書き出す場合に備え、一時ファイル名にPIDを含める
+        tmp_path = self.snapshot_path.with_suffix(f"{self.snapshot_path.suffix}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.snapshot_path)
+        logger.debug(f"Device state snapshot saved: {len(data['devices'])} devices")
+
+    def load(self) -> int:
+        """起動時にスナップショットを読み込み（件数・時間を制限）"""
+        if not self.snapshot_path.exists():
+            return 0
+
+        start = time.monotonic()
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to read device state snapshot: {e}")
+            return 0
+
+        devices = data.get('devices', {})
+        cutoff = time.time() - self.idle_seconds
+        # 新しいものを優先して最大件数まで読み込む（スナップショットはLRU順）
+        items = list(devices.items())[-self.max_devices:]
+
+        loaded: 'OrderedDict[str, DeviceState]' = OrderedDict()
+        for device_id, raw in items:
+            if time.monotonic() - start > self.max_load_seconds:
+                logger.warning("Device state load time budget exceeded, remaining entries skipped")
+                break
+            try:
+                state = DeviceState.from_dict(raw)
+            except (TypeError, ValueError):
+                continue
+            if state.last_seen < cutoff:
+                continue
+            loaded[device_id] = state
+
+        with self._lock:
+            loaded.update(self._states)
+            self._states = loaded
+            self._evict_overflow()
+
+        logger.info(f"Device state snapshot loaded: {len(loaded)} devices")
+        return len(loaded)
@@ -0,0 +1,83 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class Subscriber:
+    """購読者ごとの有界バッファ（満杯時は古いものから捨てる）"""
+
+    def __init__(self, device_ids: Optional[Set[str]], buffer_size: int):
+        self.device_ids = device_ids  # Noneは全デバイス
+        self.dropped = 0
+        self._buffer: deque = deque(maxlen=buffer_size)
+        self._ready = asyncio.Event()
+
+    def offer(self, event: dict):
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+        self._buffer.append(event)
+        self._ready.set()
+
+    async def get(self, timeout: float) -> List[dict]:
+        """溜まっているイベントをまとめて取り出す（timeout秒来なければ空リスト）"""
+        if not self._buffer:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        events = list(self._buffer)
+        self._buffer.clear()
+        return events
+
+
+class EventHub:
+    """サーバ内のイベント配信ハブ（publishは購読者のバッファに積むだけでブロックしない）"""
+
+    def __init__(self, buffer_size: int = 256, max_subscribers: int = 100):
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self._all: Set[Subscriber] = set()
+        self._by_device: Dict[str, Set[Subscriber]] = {}
+        self.published = 0
+
+    def __len__(self) -> int:
+        return len(self._all) + len({sub for subs in self._by_device.values() for sub in subs})
+
+    def subscribe(self, device_ids: Optional[Iterable[str]] = None) -> Subscriber:
+        """購読を登録（device_idsを指定するとそのデバイスのイベントのみ受け取る）"""
+        if len(self) >= self.max_subscribers:
+            raise RuntimeError("Too many subscribers")
+
+        device_filter = set(device_ids) if device_ids else None
+        subscriber = Subscriber(device_filter, self.buffer_size)
+        if device_filter is None:
+            self._all.add(subscriber)
+        else:
+            for device_id in device_filter:
+                self._by_device.setdefault(device_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        if subscriber.device_ids is None:
+            self._all.discard(subscriber)
+        else:
+            for device_id in subscriber.device_ids:
+                subscribers = self._by_device.get(device_id)
+                if subscribers is not None:
+                    subscribers.discard(subscriber)
+                    if not subscribers:
+                        del self._by_device[device_id]
+        if subscriber.dropped:
+            logger.info(f"Subscriber closed with {subscriber.dropped} dropped events")
+
+    def publish(self, event: dict):
+        """イベントを該当する購読者へ配信"""
+        self.published += 1
+        for subscriber in self._all:
+            subscriber.offer(event)
+        for subscriber in self._by_device.get(event.get('device_id'), ()):
+            subscriber.offer(event)
@@ -4,21 +4,35 @@ import csv
 import uuid
 import asyncio
 import sys
+import struct
 import platform
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 import logging
 
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends, Security
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends, Security, WebSocket, Request, Header, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
-from ultralytics import YOLO
+try:
+    from ultralytics import YOLO
+except ImportError:
+    YOLO = None  # DETECTION_MODEL=stub の場合は不要
 import cv2
 import numpy as np
 from PIL import Image
 import aiofiles
+from device_state import DeviceStateStore
+from shared_state import OwnerLock, SharedAlertState
+from stub_model import StubDetector
+from async_ingest import AsyncIngestQueue, ResultCache
+from event_hub import EventHub
+from rate_control import RateAdvisor
+from stage_stats import StageStats
+from tracker import DeviceTracker, TrackerStore
 # from line_notifier import line_notifier
 
 # ログ設定
@@ -94,16 +108,66 @@ app.add_middleware(
 # セキュリティ
 security = HTTPBearer()
 
+# バッチ受信の最大フレーム数
+BATCH_MAX_FRAMES = int(os.getenv('BATCH_MAX_FRAMES', 16))
+
+# 生ボディ受信（/ingest/raw）の最大サイズ
+RAW_MAX_BYTES = int(os.getenv('RAW_MAX_BYTES', 10 * 1024 * 1024))
+
+# WebSocket受信: バイナリメッセージ先頭のヘッダー（seq: uint32, 撮影時刻: float64 epoch秒, 0=受信時刻）
+WS_FRAME_HEADER = struct.Struct('!Id')
+WS_MAX_PENDING = int(os.getenv('WS_MAX_PENDING', 8))
+
 class DetectionSystem:
     def __init__(self):
         self.model = None
-        self.last_alert_at: Dict[str, datetime] = {}
-        self.last_event_sig: Dict[str, str] = {}
+        # モデル呼び出しは専用スレッド1本に集約（イベントループをブロックせず、モデルを並行呼び出ししない）
+        self.inference_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='inference')
+        self.inference_pending = 0  # 推論スレッドへ投入済みで未完了の呼び出し数
         self.cooldown_seconds = int(os.getenv('COOLDOWN_SECONDS', 30))
         self.threshold = float(os.getenv('PERSON_DETECTION_THRESHOLD', 0.5))
         self.data_dir = Path(os.getenv('DATA_DIR', './data'))
         self.data_dir.mkdir(exist_ok=True)
         
+        # デバイスごとのアラート状態（LRU/アイドル追い出し、定期スナップショット）
+        self.device_states = DeviceStateStore(
+            snapshot_path=self.data_dir / 'device_state.json',
+            max_devices=int(os.getenv('DEVICE_STATE_MAX_DEVICES', 10000)),
+            idle_seconds=float(os.getenv('DEVICE_STATE_IDLE_SECONDS', 86400))
+        )
+        self.state_snapshot_interval = float(os.getenv('DEVICE_STATE_SNAPSHOT_SECONDS', 60))
+        
+        # デバイスごとの人物トラッカー（キーフレームのみ推論し、間のフレームは追跡で補う）
+        self.trackers = None
+        if os.getenv('TRACKING_ENABLED', 'true').lower() in ('1', 'true', 'yes'):
+            self.trackers = TrackerStore(
+                keyframe_interval=int(os.getenv('KEYFRAME_INTERVAL', 1)),
+                motion_threshold=float(os.getenv('KEYFRAME_MOTION_THRESHOLD', 0.05)),
+                max_devices=int(os.getenv('DEVICE_STATE_MAX_DEVICES', 10000)),
+                idle_seconds=float(os.getenv('DEVICE_STATE_IDLE_SECONDS', 86400)),
+                iou_threshold=float(os.getenv('TRACKER_IOU_THRESHOLD', 0.3)),
+                max_age=int(os.getenv('TRACKER_MAX_AGE', 3)),
+                min_hits=int(os.getenv('TRACKER_MIN_HITS', 1))
+            )
+        
+        # 複数ワーカー運用時はクールダウン・重複判定をプロセス間で共有
+        self.shared_alert_state = None
+        if os.getenv('ALERT_STATE_BACKEND', 'local') == 'shared':
+            try:
+                self.shared_alert_state = SharedAlertState(
+                    Path(os.getenv('ALERT_STATE_PATH', str(self.data_dir / 'alert_state.bin'))),
+                    capacity=int(os.getenv('ALERT_STATE_CAPACITY', 4096))
+                )
+            except (RuntimeError, OSError) as e:
+                # 容量の不一致（ValueError）はワーカー間で状態が分かれるため、ここでは捕捉せず起動を止める
+                logger.warning(f"Shared alert state unavailable, falling back to local state: {e}")
+        
+        # 共有モードでは各ワーカーの状態は受信したフレームの分だけなので、スナップショットの
+        # 読み込み・書き出しはロックを取れた1ワーカーだけが行う（同じファイルを上書きし合わない）
+        self.snapshot_lock = None
+        if self.shared_alert_state is not None:
+            self.snapshot_lock = OwnerLock(self.data_dir / 'device_state.lock')
+        
         # CSVファイルの初期化
         self.events_csv = self.data_dir / 'events.csv'
         self.performance_csv = self.data_dir / 'performance_metrics.csv'
@@ -133,78 +197,224 @@ class DetectionSystem:
     async def load_model(self):
         """YOLOモデルを読み込み"""
         if self.model is None:
-            logger.info("Loading YOLOv8n model...")
-            self.model = YOLO('yolov8n.pt')
+            model_name = os.getenv('DETECTION_MODEL', 'yolov8n.pt')
+            if model_name == 'stub':
+                # ベンチマーク・負荷試験用（YOLO不要）
+                self.model = StubDetector(
+                    persons=int(os.getenv('STUB_PERSONS', 1)),
+                    latency_ms=float(os.getenv('STUB_LATENCY_MS', 0))
+                )
+                logger.info("Using stub detector")
+                return
+            if YOLO is None:
+                raise ImportError("ultralytics is not installed (set DETECTION_MODEL=stub to run without it)")
+            logger.info(f"Loading {model_name} model...")
+            self.model = YOLO(model_name)
             logger.info("Model loaded successfully")
     
+    def _extract_persons(self, result) -> tuple:
+        """推論結果から人物クラス（class_id=0）の信頼度とボックス（xyxy）を抽出"""
+        person_detections = []
+        person_boxes = []
+        boxes = result.boxes
+        if boxes is not None:
+            for box in boxes:
+                class_id = int(box.cls[0])
+                if class_id == 0:  # person class
+                    confidence = float(box.conf[0])
+                    person_detections.append(confidence)
+                    person_boxes.append([float(v) for v in box.xyxy[0]])
+        return person_detections, person_boxes
+    
     def detect_persons(self, image: np.ndarray) -> tuple:
-        """人物検出を実行"""
+        """人物検出を実行（信頼度のリスト、ボックスのリスト、推論時間を返す）"""
         start_time = datetime.now()
         
         results = self.model(image, conf=self.threshold)
         
-        # 人物クラス（class_id=0）のみを抽出
-        person_detections = []
+        person_detections, person_boxes = [], []
         for result in results:
-            boxes = result.boxes
-            if boxes is not None:
-                for box in boxes:
-                    class_id = int(box.cls[0])
-                    if class_id == 0:  # person class
-                        confidence = float(box.conf[0])
-                        person_detections.append(confidence)
+            detections, boxes = self._extract_persons(result)
+            person_detections.extend(detections)
+            person_boxes.extend(boxes)
+        
+        inference_time = (datetime.now() - start_time).total_seconds() * 1000
+        return person_detections, person_boxes, inference_time
+    
+    def detect_persons_batch(self, images: List[np.ndarray]) -> tuple:
+        """複数画像の人物検出を1回の推論呼び出しで実行"""
+        start_time = datetime.now()
+        
+        results = self.model(images, conf=self.threshold)
+        extracted = [self._extract_persons(result) for result in results]
+        batch_detections = [detections for detections, _ in extracted]
+        batch_boxes = [boxes for _, boxes in extracted]
         
         inference_time = (datetime.now() - start_time).total_seconds() * 1000
-        return person_detections, inference_time
+        return batch_detections, batch_boxes, inference_time
+    
+    async def detect_persons_async(self, image: np.ndarray) -> tuple:
+        """推論スレッドで人物検出を実行"""
+        loop = asyncio.get_running_loop()
+        self.inference_pending += 1
+        try:
+            return await loop.run_in_executor(self.inference_executor, self.detect_persons, image)
+        finally:
+            self.inference_pending -= 1
     
-    def should_send_alert(self, device_id: str, person_count: int) -> bool:
-        """アラートを送信すべきかチェック"""
-        now = datetime.now()
+    async def detect_persons_batch_async(self, images: List[np.ndarray]) -> tuple:
+        """推論スレッドで複数画像の人物検出を実行"""
+        loop = asyncio.get_running_loop()
+        self.inference_pending += len(images)
+        try:
+            return await loop.run_in_executor(self.inference_executor, self.detect_persons_batch, images)
+        finally:
+            self.inference_pending -= len(images)
+    
+    def should_send_alert(self, device_id: str, person_count: int, now: Optional[datetime] = None,
+                          new_track_ids: Optional[List[int]] = None) -> bool:
+        """アラートを送信すべきかチェック（送信する場合はその場で状態に記録）
+        
+        new_track_ids を渡した場合は人数ではなく、まだ通知していないトラックの出現でアラートを判定する。
+        """
+        if person_count <= 0:
+            return False
+        if new_track_ids is not None and not new_track_ids:
+            return False
         
-        # クールダウンチェック
-        if device_id in self.last_alert_at:
-            time_diff = now - self.last_alert_at[device_id]
-            if time_diff.total_seconds() < self.cooldown_seconds:
-                return False
+        now = now or datetime.now()
         
-        # イベント重複チェック（同じ人数の検出は重複とみなす）
-        event_sig = f"{person_count}"
-        if device_id in self.last_event_sig:
-            if self.last_event_sig[device_id] == event_sig:
-                return False
+        # クールダウン + イベント重複チェック（トラッキング時は新しいトラック、それ以外は同じ人数の検出を重複とみなす）
+        # トラックIDはワーカーごとに1から振られるため、共有状態で他ワーカーのIDと衝突しないようpidを含める
+        event_sig = f"track:{os.getpid()}:{max(new_track_ids)}" if new_track_ids else f"{person_count}"
+        if self.shared_alert_state is not None:
+            claimed = self.shared_alert_state.try_claim_alert(
+                device_id, event_sig, now.timestamp(), self.cooldown_seconds
+            )
+            if claimed:
+                # ワーカー内のカウンタ用
+                self.device_states.record_alert(device_id, now.timestamp(), event_sig)
+            return claimed
         
-        return person_count > 0
+        return self.device_states.try_claim_alert(device_id, event_sig, now.timestamp(), self.cooldown_seconds)
+    
+    def owns_state_snapshot(self) -> bool:
+        """このワーカーがデバイス状態のスナップショットを担当するか"""
+        return self.snapshot_lock is None or self.snapshot_lock.acquire()
+    
+    async def run_state_snapshots(self):
+        """デバイス状態の定期スナップショット"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.state_snapshot_interval)
+            try:
+                self.device_states.evict_idle()
+                if self.trackers is not None:
+                    self.trackers.evict_idle()
+                if self.owns_state_snapshot():
+                    await loop.run_in_executor(None, self.device_states.save)
+            except Exception as e:
+                logger.error(f"Failed to save device state snapshot: {e}")
+    
+    @staticmethod
+    def _event_row(event_data: dict) -> str:
+        return ','.join([
+            str(event_data['event_id']),
+            str(event_data['device_id']),
+            str(event_data['timestamp']),
+            str(event_data['person_count']),
+            str(event_data['anomaly_flag']),
+            str(event_data['confidence_scores']),
+            str(event_data['processing_time_ms']),
+            str(event_data['image_filename'])
+        ]) + '\n'
+    
+    @staticmethod
+    def _metrics_row(metrics: dict) -> str:
+        return ','.join([
+            str(metrics['timestamp']),
+            str(metrics['device_id']),
+            str(metrics['request_size_bytes']),
+            str(metrics['processing_time_ms']),
+            str(metrics['inference_time_ms']),
+            str(metrics['total_response_time_ms'])
+        ]) + '\n'
     
     async def save_event(self, event_data: dict):
         """イベントをCSVに保存"""
         async with aiofiles.open(self.events_csv, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            await f.write(','.join([
-                str(event_data['event_id']),
-                str(event_data['device_id']),
-                str(event_data['timestamp']),
-                str(event_data['person_count']),
-                str(event_data['anomaly_flag']),
-                str(event_data['confidence_scores']),
-                str(event_data['processing_time_ms']),
-                str(event_data['image_filename'])
-            ]) + '\n')
+            await f.write(self._event_row(event_data))
+    
+    async def save_events(self, events: List[dict]):
+        """複数イベントをまとめて1回の書き込みでCSVに保存"""
+        if not events:
+            return
+        async with aiofiles.open(self.events_csv, 'a', newline='', encoding='utf-8') as f:
+            await f.write(''.join(self._event_row(event_data) for event_data in events))
     
     async def save_performance_metrics(self, metrics: dict):
         """パフォーマンスメトリクスをCSVに保存"""
         async with aiofiles.open(self.performance_csv, 'a', newline='', encoding='utf-8') as f:
-            await f.write(','.join([
-                str(metrics['timestamp']),
-                str(metrics['device_id']),
-                str(metrics['request_size_bytes']),
-                str(metrics['processing_time_ms']),
-                str(metrics['inference_time_ms']),
-                str(metrics['total_response_time_ms'])
-            ]) + '\n')
+            await f.write(self._metrics_row(metrics))
+    
+    async def save_performance_metrics_batch(self, metrics_list: List[dict]):
+        """複数のパフォーマンスメトリクスをまとめてCSVに保存"""
+        if not metrics_list:
+            return
+        async with aiofiles.open(self.performance_csv, 'a', newline='', encoding='utf-8') as f:
+            await f.write(''.join(self._metrics_row(metrics) for metrics in metrics_list))
 
 # グローバルインスタンス
 detection_system = DetectionSystem()
 
+# 新規イベントのライブ配信（ダッシュボード向け）
+event_hub = EventHub(
+    buffer_size=int(os.getenv('EVENT_STREAM_BUFFER', 256)),
+    max_subscribers=int(os.getenv('EVENT_STREAM_MAX_SUBSCRIBERS', 100))
+)
+
+# 非同期受信（/ingest/async）の結果キャッシュ
+result_cache = ResultCache(
+    max_entries=int(os.getenv('RESULT_CACHE_MAX', 10000)),
+    ttl_seconds=float(os.getenv('RESULT_TTL_SECONDS', 300))
+)
+
+# 受信処理の段階別処理時間（負荷試験のボトルネック分析用）
+stage_stats = StageStats(window=int(os.getenv('STAGE_STATS_WINDOW', 10000)))
+
+# クライアントへのレートヒント（推奨送信間隔・画質）
+rate_advisor = RateAdvisor(
+    min_interval_ms=float(os.getenv('RATE_MIN_INTERVAL_MS', 200)),
+    max_interval_ms=float(os.getenv('RATE_MAX_INTERVAL_MS', 10000)),
+    target_utilization=float(os.getenv('RATE_TARGET_UTILIZATION', 0.7)),
+    target_latency_ms=float(os.getenv('RATE_TARGET_LATENCY_MS', 500)),
+    active_seconds=float(os.getenv('RATE_ACTIVE_SECONDS', 30)),
+    priority_devices=[d for d in os.getenv('RATE_PRIORITY_DEVICES', '').split(',') if d]
+)
+
+def inference_backlog() -> int:
+    """推論待ちのフレーム数（推論スレッドへ投入済み + 非同期受信キュー）"""
+    return detection_system.inference_pending + ingest_queue.qsize()
+
+def state_sizes() -> dict:
+    """デバイスや接続ごとに増える構造の件数（耐久試験でのリーク検出用、値はこのワーカー分）"""
+    shared = detection_system.shared_alert_state
+    return {
+        'device_states': len(detection_system.device_states),
+        'shared_alert_slots': len(shared) if shared is not None else 0,
+        'trackers': len(detection_system.trackers) if detection_system.trackers is not None else 0,
+        'rate_advisor_devices': len(rate_advisor),
+        'frame_requests': len(frame_requests),
+        'result_cache': len(result_cache),
+        'result_subscribers': len(result_cache.hub),
+        'event_subscribers': len(event_hub)
+    }
+
+def with_rate_hint(response: dict) -> dict:
+    """レスポンスにデバイス向けのレートヒントを付与"""
+    response['rate_hint'] = rate_advisor.hint(response['device_id'], inference_backlog())
+    return response
+
 async def verify_api_key(credentials: HTTPAuthorizationCredentials = Security(security)):
     """API キーの検証"""
     expected_key = os.getenv('API_KEY', 'your_api_key_here')
@@ -216,115 +426,698 @@ async def verify_api_key(credentials: HTTPAuthorizationCredentials = Security(se
 async def startup_event():
     """アプリケーション起動時の処理"""
     check_environment_compatibility()
+    if detection_system.owns_state_snapshot():
+        detection_system.device_states.load()
     await detection_system.load_model()
+    asyncio.create_task(detection_system.run_state_snapshots())
+    await ingest_queue.start()
     logger.info("Server startup completed")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """アプリケーション終了時の処理"""
+    await ingest_queue.stop()
+    try:
+        if detection_system.owns_state_snapshot():
+            detection_system.device_states.save()
+    except Exception as e:
+        logger.error(f"Failed to save device state snapshot: {e}")
+    logger.info("Server shutdown completed")
+
 @app.get("/")
 async def root():
     """ヘルスチェック"""
     return {"status": "ok", "message": "Edge Anomaly Detection Server"}
 
+def parse_timestamp(ts: Optional[str], default: datetime) -> datetime:
+    """ISO形式のタイムスタンプを解釈（未指定ならdefault）"""
+    if ts:
+        return datetime.fromisoformat(ts.replace('Z', '+00:00'))
+    return default
+
+def decode_image(contents: bytes) -> np.ndarray:
+    """JPEG等のバイト列をデコード"""
+    nparr = np.frombuffer(contents, np.uint8)
+    image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    
+    if image is None:
+        raise HTTPException(status_code=400, detail="Invalid image format")
+    return image
+
+def live_tracker(device_id: str, timestamp: datetime) -> Optional[DeviceTracker]:
+    """フレームを追跡するデバイスのトラッカー（トラッキング無効、または追跡済みより古いフレームならNone）
+    
+    スプールの再送など古いフレームでトラックを更新すると、ライブのフレームとの間で対応付けが崩れて
+    古い映像に新しいトラックIDのアラートが出るため、古いフレームは人数によるアラート判定に回す。
+    """
+    if detection_system.trackers is None:
+        return None
+    tracker = detection_system.trackers.get(device_id)
+    return None if tracker.is_stale(timestamp.timestamp()) else tracker
+
+def build_event(device_id: str, image: Optional[np.ndarray], timestamp: datetime, start_time: datetime,
+                person_detections: list, inference_time: float, event_id: Optional[str] = None,
+                encoded_image: Optional[bytes] = None, tracker: Optional[DeviceTracker] = None) -> dict:
+    """検出結果からアラート判定・画像保存を行い、イベントレコードを作成
+    
+    encoded_image を渡すとデコード済み画像の代わりにJPEGをそのまま保存する（画像なしなら保存しない）。
+    tracker を渡すと、まだ通知していないトラックが現れたときだけアラートにする。
+    """
+    person_count = len(person_detections)
+    detection_system.device_states.record_frame(device_id)
+    
+    # アラート判定
+    new_track_ids = tracker.unreported_ids() if tracker is not None else None
+    should_alert = detection_system.should_send_alert(device_id, person_count, start_time, new_track_ids)
+    if should_alert and tracker is not None:
+        tracker.mark_reported()
+    
+    # 画像保存（人が検出された場合のみ）
+    image_filename = None
+    if person_count > 0 and (image is not None or encoded_image is not None):
+        image_filename = f"{device_id}_{timestamp.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.jpg"
+        image_path = detection_system.data_dir / image_filename
+        if encoded_image is not None:
+            image_path.write_bytes(encoded_image)
+        else:
+            cv2.imwrite(str(image_path), image)
+    
+    return {
+        'event_id': event_id or str(uuid.uuid4()),
+        'device_id': device_id,
+        'timestamp': timestamp.isoformat(),
+        'person_count': person_count,
+        'anomaly_flag': should_alert,
+        'confidence_scores': json.dumps(person_detections),
+        'processing_time_ms': inference_time,
+        'image_filename': image_filename or ''
+    }
+
+def notify_alert(event_data: dict, timestamp: datetime, person_detections: list):
+    """アラート通知"""
+    logger.info(f"[ALERT] Device: {event_data['device_id']}, Person count: {event_data['person_count']}")
+    # LINE通知を送信（テスト用に一時無効化）
+    # try:
+    #     line_notifier.send_detection_alert(
+    #         device_id=event_data['device_id'],
+    #         person_count=event_data['person_count'],
+    #         timestamp=timestamp,
+    #         confidence_scores=person_detections
+    #     )
+    # except Exception as e:
+    #     logger.error(f"Failed to send LINE notification: {e}")
+
+def event_response(event_data: dict, person_detections: list, total_time: float) -> dict:
+    """イベントレコードからAPIレスポンスを作成"""
+    return {
+        "event_id": event_data['event_id'],
+        "device_id": event_data['device_id'],
+        "timestamp": event_data['timestamp'],
+        "person_count": event_data['person_count'],
+        "anomaly_detected": event_data['anomaly_flag'],
+        "confidence_scores": person_detections,
+        "processing_time_ms": total_time
+    }
+
+async def process_frame(device_id: str, contents: bytes, timestamp: datetime, start_time: datetime,
+                        event_id: Optional[str] = None) -> dict:
+    """1フレームをデコード・人物検出し、イベント記録と通知を行ってレスポンスを返す
+    
+    トラッキング有効時はキーフレームのみ推論し、それ以外のフレームはトラッカーの予測で人物を求める。
+    """
+    # 画像の読み込み
+    with stage_stats.measure('decode'):
+        image = decode_image(contents)
+    
+    tracker = live_tracker(device_id, timestamp)
+    keyframe = tracker is None or detection_system.trackers.is_keyframe(tracker, image)
+    
+    if keyframe:
+        # 人物検出（推論スレッドの待ち時間と推論時間を分けて記録）
+        detect_start = datetime.now()
+        person_detections, person_boxes, inference_time = await detection_system.detect_persons_async(image)
+        stage_stats.record('inference', inference_time)
+        stage_stats.record('inference_wait', (datetime.now() - detect_start).total_seconds() * 1000 - inference_time)
+        if tracker is not None:
+            with stage_stats.measure('track'):
+                tracker.update(person_boxes, person_detections, timestamp.timestamp())
+    else:
+        # キーフレーム以外は推論を省き、トラックの位置を進める
+        with stage_stats.measure('track'):
+            _, person_detections = tracker.predict(timestamp.timestamp())
+        inference_time = 0.0
+    
+    response = await record_detections(
+        device_id, timestamp, start_time, person_detections, inference_time, len(contents),
+        image=image, event_id=event_id, tracker=tracker, keyframe=keyframe
+    )
+    if tracker is not None:
+        response['track_ids'] = tracker.visible_ids().tolist()
+    return response
+
+async def record_detections(device_id: str, timestamp: datetime, start_time: datetime, person_detections: list,
+                            inference_time: float, request_size: int, image: Optional[np.ndarray] = None,
+                            encoded_image: Optional[bytes] = None, event_id: Optional[str] = None,
+                            tracker: Optional[DeviceTracker] = None, keyframe: bool = True,
+                            server_inference: bool = True) -> dict:
+    """検出結果のアラート判定・イベント記録・メトリクス保存・通知を行ってレスポンスを返す
+    
+    keyframe=False はトラッカーの予測で推論を省いたフレーム（推論時間の統計に含めない）。
+    server_inference=False はエッジ側で推論した結果（推論時間はCSVにのみ記録し、サーバの推論能力の
+    見積もり（レートヒント）には含めない）。
+    """
+    # アラート判定・画像保存・イベント保存
+    with stage_stats.measure('build_event'):
+        event_data = build_event(
+            device_id, image, timestamp, start_time, person_detections, inference_time, event_id, encoded_image,
+            tracker
+        )
+    with stage_stats.measure('save_event'):
+        await detection_system.save_event(event_data)
+    event_hub.publish(event_data)
+    
+    # パフォーマンスメトリクス保存
+    total_time = (datetime.now() - start_time).total_seconds() * 1000
+    metrics = {
+        'timestamp': start_time.isoformat(),
+        'device_id': device_id,
+        'request_size_bytes': request_size,
+        'processing_time_ms': total_time,
+        'inference_time_ms': inference_time,
+        'total_response_time_ms': total_time
+    }
+    
+    with stage_stats.measure('save_metrics'):
+        await detection_system.save_performance_metrics(metrics)
+    stage_stats.record('total', total_time)
+    rate_advisor.record(device_id, event_data['person_count'],
+                        inference_time if keyframe and server_inference else None)
+    
+    # 通知処理
+    if event_data['anomaly_flag']:
+        notify_alert(event_data, timestamp, person_detections)
+    
+    logger.info(f"Processed frame from {device_id}: {event_data['person_count']} persons detected")
+    
+    response = event_response(event_data, person_detections, total_time)
+    response['keyframe'] = keyframe
+    return response
+
 @app.post("/ingest")
 async def ingest_image(
     file: UploadFile = File(...),
     device_id: str = Form(...),
     ts: Optional[str] = Form(None),
+    suppressed_frames: int = Form(0),
     api_key: str = Depends(verify_api_key)
 ):
-    """画像を受信して人物検出を実行"""
+    """画像を受信して人物検出を実行
+    
+    suppressed_frames: 前回の送信以降にエッジ側の変化検出で送信しなかったフレーム数
+    """
     start_time = datetime.now()
     
+    if suppressed_frames > 0:
+        detection_system.device_states.record_suppressed(device_id, suppressed_frames)
+    
     try:
         # タイムスタンプの処理
-        if ts:
-            timestamp = datetime.fromisoformat(ts.replace('Z', '+00:00'))
-        else:
-            timestamp = start_time
+        timestamp = parse_timestamp(ts, start_time)
         
-        # 画像の読み込み
         contents = await file.read()
-        nparr = np.frombuffer(contents, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        return with_rate_hint(await process_frame(device_id, contents, timestamp, start_time))
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing image from {device_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Processing error: {str(e)}")
+
+# エッジ側推論モードで次のメタデータ送信時にフレームを要求するデバイス
+frame_requests = set()
+
+def parse_detections(detections: str) -> tuple:
+    """エッジ側の検出結果JSONから閾値以上の人物の信頼度とボックスを取り出す
+    
+    ボックス（bbox）のない検出が含まれる場合、ボックスは None を返す。
+    """
+    try:
+        items = json.loads(detections)
+        if not isinstance(items, list):
+            raise ValueError("detections must be a list")
+        items = [item for item in items if float(item['confidence']) >= detection_system.threshold]
+        confidences = [float(item['confidence']) for item in items]
+        boxes = None
+        if all(item.get('bbox') is not None for item in items):
+            boxes = [[float(v) for v in item['bbox']] for item in items]
+            if any(len(box) != 4 for box in boxes):
+                raise ValueError("bbox must be [x1, y1, x2, y2]")
+    except (ValueError, TypeError, KeyError, AttributeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid detections: {e}")
+    return confidences, boxes
+
+@app.post("/ingest/metadata")
+async def ingest_metadata(
+    device_id: str = Form(...),
+    detections: str = Form('[]'),
+    ts: Optional[str] = Form(None),
+    inference_time_ms: float = Form(0.0),
+    suppressed_frames: int = Form(0),
+    file: Optional[UploadFile] = File(None),
+    api_key: str = Depends(verify_api_key)
+):
+    """エッジ側で推論した検出結果を受信（サーバではデコード・推論を行わない）
+    
+    detections: [{"confidence": 0.9, "bbox": [x1, y1, x2, y2]}, ...] のJSON
+    file: 人物が映っているフレーム（任意、JPEGのまま保存）
+    レスポンスの frame_requested が true なら、次の送信でフレームを添付する。
+    """
+    start_time = datetime.now()
+    
+    if suppressed_frames > 0:
+        detection_system.device_states.record_suppressed(device_id, suppressed_frames)
+    
+    try:
+        timestamp = parse_timestamp(ts, start_time)
+        person_detections, person_boxes = parse_detections(detections)
+        contents = await file.read() if file is not None else None
         
-        if image is None:
-            raise HTTPException(status_code=400, detail="Invalid image format")
+        # ボックス付きの検出結果ならトラッカーを更新し、トラック単位でアラートを判定
+        tracker = live_tracker(device_id, timestamp) if person_boxes is not None else None
+        if tracker is not None:
+            tracker.update(person_boxes, person_detections, timestamp.timestamp())
         
-        # 人物検出
-        person_detections, inference_time = detection_system.detect_persons(image)
-        person_count = len(person_detections)
+        response = await record_detections(
+            device_id, timestamp, start_time, person_detections, inference_time_ms,
+            len(detections) + len(contents or b''), encoded_image=contents, tracker=tracker,
+            server_inference=False
+        )
+        if tracker is not None:
+            response['track_ids'] = tracker.visible_ids().tolist()
         
-        # アラート判定
-        should_alert = detection_system.should_send_alert(device_id, person_count)
+        # アラートの証跡となるフレームがない場合、または明示的に要求された場合は次の送信でフレームを要求
+        if contents is not None:
+            frame_requests.discard(device_id)
+        response['frame_requested'] = device_id in frame_requests or (contents is None and response['anomaly_detected'])
+        return with_rate_hint(response)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing metadata from {device_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Processing error: {str(e)}")
+
+@app.post("/devices/{device_id}/frame-request")
+async def request_frame(device_id: str, api_key: str = Depends(verify_api_key)):
+    """エッジ側推論モードのデバイスに次回のフレーム送信を要求"""
+    frame_requests.add(device_id)
+    return {"device_id": device_id, "frame_requested": True}
+
+async def read_body_into_buffer(request: Request, max_bytes: int = RAW_MAX_BYTES) -> memoryview:
+    """リクエストボディを1つのバッファへ直接読み込む（チャンク連結のコピーを避ける）"""
+    content_length = request.headers.get('content-length')
+    if content_length is not None:
+        size = int(content_length)
+        if size > max_bytes:
+            raise HTTPException(status_code=413, detail=f"Body too large (max {max_bytes} bytes)")
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        offset = 0
+        async for chunk in request.stream():
+            end = offset + len(chunk)
+            if end > size:
+                raise HTTPException(status_code=400, detail="Body longer than Content-Length")
+            view[offset:end] = chunk
+            offset = end
+        return view[:offset]
+    
+    # chunked転送の場合は伸長バッファに追記
+    buffer = bytearray()
+    async for chunk in request.stream():
+        buffer += chunk
+        if len(buffer) > max_bytes:
+            raise HTTPException(status_code=413, detail=f"Body too large (max {max_bytes} bytes)")
+    return memoryview(buffer)
+
+@app.post("/ingest/raw")
+async def ingest_raw(
+    request: Request,
+    x_device_id: str = Header(...),
+    x_timestamp: Optional[str] = Header(None),
+    x_suppressed_frames: int = Header(0),
+    api_key: str = Depends(verify_api_key)
+):
+    """JPEGの生ボディを受信して人物検出を実行（マルチパート解析なし）
+    
+    Content-Type: image/jpeg、デバイスIDは X-Device-Id、タイムスタンプは X-Timestamp ヘッダーで指定。
+    """
+    start_time = datetime.now()
+    device_id = x_device_id
+    
+    content_type = request.headers.get('content-type', '')
+    if content_type.split(';')[0].strip() != 'image/jpeg':
+        raise HTTPException(status_code=415, detail="Content-Type must be image/jpeg")
+    
+    if x_suppressed_frames > 0:
+        detection_system.device_states.record_suppressed(device_id, x_suppressed_frames)
+    
+    try:
+        timestamp = parse_timestamp(x_timestamp, start_time)
         
-        if should_alert:
-            detection_system.last_alert_at[device_id] = start_time
-            detection_system.last_event_sig[device_id] = str(person_count)
+        # np.frombuffer/cv2.imdecode がそのまま参照できるバッファへ読み込む
+        contents = await read_body_into_buffer(request)
+        return with_rate_hint(await process_frame(device_id, contents, timestamp, start_time))
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing image from {device_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Processing error: {str(e)}")
+
+@app.post("/ingest/batch")
+async def ingest_batch(
+    files: List[UploadFile] = File(...),
+    device_ids: List[str] = Form(...),
+    ts: Optional[List[str]] = Form(None),
+    api_key: str = Depends(verify_api_key)
+):
+    """複数フレームをまとめて受信し、1回の推論でまとめて人物検出を実行
+    
+    files / device_ids / ts はそれぞれ同じ順序で並べる（tsは省略可、空文字は受信時刻）。
+    """
+    start_time = datetime.now()
+    
+    if len(files) > BATCH_MAX_FRAMES:
+        raise HTTPException(status_code=413, detail=f"Too many frames (max {BATCH_MAX_FRAMES})")
+    if len(device_ids) != len(files):
+        raise HTTPException(status_code=400, detail="device_ids must match files")
+    timestamps = ts or [''] * len(files)
+    if len(timestamps) != len(files):
+        raise HTTPException(status_code=400, detail="ts must match files")
+    
+    try:
+        # デコード（失敗したフレームはそのフレームのみエラーとして返す）
+        results: List[Optional[dict]] = [None] * len(files)
+        frames = []
+        for index, (upload, device_id, frame_ts) in enumerate(zip(files, device_ids, timestamps)):
+            contents = await upload.read()
+            try:
+                timestamp = parse_timestamp(frame_ts, start_time)
+                image = decode_image(contents)
+            except (HTTPException, ValueError) as e:
+                detail = e.detail if isinstance(e, HTTPException) else str(e)
+                results[index] = {"device_id": device_id, "error": detail}
+                continue
+            frames.append((index, device_id, timestamp, image, len(contents)))
         
-        # 画像保存（人が検出された場合のみ）
-        image_filename = None
-        if person_count > 0:
-            image_filename = f"{device_id}_{timestamp.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.jpg"
-            image_path = detection_system.data_dir / image_filename
-            cv2.imwrite(str(image_path), image)
+        # まとめて推論
+        batch_detections, batch_boxes, inference_time = [], [], 0.0
+        if frames:
+            batch_detections, batch_boxes, inference_time = await detection_system.detect_persons_batch_async(
+                [image for _, _, _, image, _ in frames]
+            )
+        per_frame_inference = inference_time / len(frames) if frames else 0.0
         
-        # イベント保存
-        event_id = str(uuid.uuid4())
-        event_data = {
-            'event_id': event_id,
-            'device_id': device_id,
-            'timestamp': timestamp.isoformat(),
-            'person_count': person_count,
-            'anomaly_flag': should_alert,
-            'confidence_scores': json.dumps(person_detections),
-            'processing_time_ms': inference_time,
-            'image_filename': image_filename or ''
-        }
+        events = []
+        for (index, device_id, timestamp, image, _), person_detections, person_boxes in zip(
+                frames, batch_detections, batch_boxes):
+            # バッチ内のフレームはすべて推論済みなのでトラッカーの更新のみ行う
+            # （スプールの再送で届く古いフレームは live_tracker が除外する）
+            tracker = live_tracker(device_id, timestamp)
+            if tracker is not None:
+                tracker.update(person_boxes, person_detections, timestamp.timestamp())
+            event_data = build_event(
+                device_id, image, timestamp, start_time, person_detections, per_frame_inference, tracker=tracker
+            )
+            events.append((index, event_data, timestamp, person_detections))
         
-        await detection_system.save_event(event_data)
+        # イベントをまとめて書き込み
+        await detection_system.save_events([event_data for _, event_data, _, _ in events])
+        for _, event_data, _, _ in events:
+            event_hub.publish(event_data)
         
-        # パフォーマンスメトリクス保存
         total_time = (datetime.now() - start_time).total_seconds() * 1000
-        metrics = {
-            'timestamp': start_time.isoformat(),
-            'device_id': device_id,
-            'request_size_bytes': len(contents),
-            'processing_time_ms': total_time,
-            'inference_time_ms': inference_time,
-            'total_response_time_ms': total_time
-        }
-        
-        await detection_system.save_performance_metrics(metrics)
+        await detection_system.save_performance_metrics_batch([
+            {
+                'timestamp': start_time.isoformat(),
+                'device_id': device_id,
+                'request_size_bytes': size,
+                'processing_time_ms': total_time,
+                'inference_time_ms': per_frame_inference,
+                'total_response_time_ms': total_time
+            }
+            for _, device_id, _, _, size in frames
+        ])
         
-        # 通知処理
-        if should_alert:
-            logger.info(f"[ALERT] Device: {device_id}, Person count: {person_count}")
-            # LINE通知を送信（テスト用に一時無効化）
-            # try:
-            #     line_notifier.send_detection_alert(
-            #         device_id=device_id,
-            #         person_count=person_count,
-            #         timestamp=timestamp,
-            #         confidence_scores=person_detections
-            #     )
-            # except Exception as e:
-            #     logger.error(f"Failed to send LINE notification: {e}")
+        for index, event_data, timestamp, person_detections in events:
+            rate_advisor.record(event_data['device_id'], event_data['person_count'], per_frame_inference)
+            if event_data['anomaly_flag']:
+                notify_alert(event_data, timestamp, person_detections)
+            results[index] = event_response(event_data, person_detections, total_time)
         
-        logger.info(f"Processed image from {device_id}: {person_count} persons detected")
+        logger.info(f"Processed batch of {len(files)} frames ({len(frames)} decoded) in {total_time:.1f}ms")
         
         return {
-            "event_id": event_id,
-            "device_id": device_id,
-            "timestamp": timestamp.isoformat(),
-            "person_count": person_count,
-            "anomaly_detected": should_alert,
-            "confidence_scores": person_detections,
+            "results": results,
+            "frame_count": len(files),
+            "inference_time_ms": inference_time,
             "processing_time_ms": total_time
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error processing image from {device_id}: {str(e)}")
+        logger.error(f"Error processing batch: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Processing error: {str(e)}")
 
+# 非同期受信の処理キュー（process_frame を使うためここで生成）
+ingest_queue = AsyncIngestQueue(
+    process_frame,
+    result_cache,
+    max_pending=int(os.getenv('ASYNC_MAX_PENDING', 64)),
+    workers=int(os.getenv('ASYNC_WORKERS', 2))
+)
+
+@app.post("/ingest/async", status_code=202)
+async def ingest_async(
+    file: UploadFile = File(...),
+    device_id: str = Form(...),
+    ts: Optional[str] = Form(None),
+    suppressed_frames: int = Form(0),
+    api_key: str = Depends(verify_api_key)
+):
+    """画像を受け付けて即座に202を返し、人物検出は非同期に実行
+    
+    結果は /results/{event_id} または /results/stream/{device_id}（SSE）で取得する。
+    suppressed_frames: 前回の送信以降にエッジ側の変化検出で送信しなかったフレーム数
+    """
+    start_time = datetime.now()
+    
+    try:
+        timestamp = parse_timestamp(ts, start_time)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid timestamp: {str(e)}")
+    
+    contents = await file.read()
+    event_id = str(uuid.uuid4())
+    
+    if not ingest_queue.submit(event_id, device_id, contents, timestamp, start_time):
+        # 処理待ちが上限に達している場合は受け付けない（クライアントは後で再送）
+        raise HTTPException(status_code=503, detail="Ingest queue is full", headers={"Retry-After": "1"})
+    
+    # 503で再送されるフレームの分を二重に数えないよう、受け付けた時点で記録
+    if suppressed_frames > 0:
+        detection_system.device_states.record_suppressed(device_id, suppressed_frames)
+    
+    return {
+        "event_id": event_id,
+        "device_id": device_id,
+        "status": "queued",
+        "queue_depth": ingest_queue.qsize(),
+        "result_url": f"/results/{event_id}"
+    }
+
+def sse_response(hub: EventHub, device_ids: Optional[List[str]], request: Request,
+                 event_name: str) -> StreamingResponse:
+    """ハブの購読をServer-Sent Eventsとして返す"""
+    try:
+        subscriber = hub.subscribe(device_ids)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    async def event_stream():
+        try:
+            while not await request.is_disconnected():
+                events = await subscriber.get(timeout=15)
+                if not events:
+                    yield ": keepalive\n\n"
+                    continue
+                for event in events:
+                    yield f"event: {event_name}\nid: {event['event_id']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            hub.unsubscribe(subscriber)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/results/stream/{device_id}")
+async def stream_results(device_id: str, request: Request, api_key: str = Depends(verify_api_key)):
+    """デバイスの処理結果をServer-Sent Eventsで配信"""
+    return sse_response(result_cache.hub, [device_id], request, 'result')
+
+@app.get("/results/{event_id}")
+async def get_result(event_id: str, api_key: str = Depends(verify_api_key)):
+    """非同期受信した画像の処理結果を取得（処理中は202）"""
+    record = result_cache.get(event_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Result not found or expired")
+    if record['status'] == 'queued':
+        return JSONResponse(status_code=202, content=record)
+    return record
+
+def verify_ws_api_key(websocket: WebSocket, token: Optional[str]) -> bool:
+    """WebSocket接続のAPIキー検証（Authorizationヘッダーまたはtokenクエリ）"""
+    expected_key = os.getenv('API_KEY', 'your_api_key_here')
+    authorization = websocket.headers.get('authorization', '')
+    if authorization.lower().startswith('bearer '):
+        token = authorization[7:]
+    return token == expected_key
+
+@app.websocket("/ws/ingest")
+async def ws_ingest(websocket: WebSocket, device_id: str, token: Optional[str] = None):
+    """WebSocketでフレームを連続受信して人物検出を実行
+    
+    バイナリメッセージ = WS_FRAME_HEADER + JPEG。結果は seq 付きJSONで非同期に返す。
+    テキストメッセージ {"type": "suppressed", "count": N} でエッジ側で抑制したフレーム数を受け取る。
+    処理待ちが溜まると throttle（推奨送信間隔付き）、解消すると resume を送る。
+    処理待ちが上限に達したフレームは dropped を返して破棄する。
+    """
+    if not verify_ws_api_key(websocket, token):
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    logger.info(f"WebSocket ingest connected: {device_id}")
+    
+    pending: asyncio.Queue = asyncio.Queue(maxsize=WS_MAX_PENDING)
+    high_water = max(1, WS_MAX_PENDING // 2)
+    send_lock = asyncio.Lock()
+    flow = {'throttled': False, 'avg_ms': 0.0}
+    
+    async def send(message: dict):
+        async with send_lock:
+            await websocket.send_json(message)
+    
+    async def worker():
+        while True:
+            seq, contents, timestamp, start_time = await pending.get()
+            try:
+                result = await process_frame(device_id, contents, timestamp, start_time)
+                # 処理時間の指数移動平均（推奨送信間隔の算出用）
+                flow['avg_ms'] = 0.8 * flow['avg_ms'] + 0.2 * result['processing_time_ms'] if flow['avg_ms'] else result['processing_time_ms']
+                await send({"type": "result", "seq": seq, **result})
+            except HTTPException as e:
+                await send({"type": "error", "seq": seq, "detail": e.detail})
+            except Exception as e:
+                logger.error(f"Error processing WebSocket frame from {device_id}: {str(e)}")
+                await send({"type": "error", "seq": seq, "detail": f"Processing error: {str(e)}"})
+            
+            if flow['throttled'] and pending.empty():
+                flow['throttled'] = False
+                await send({"type": "resume"})
+    
+    worker_task = asyncio.create_task(worker())
+    try:
+        while True:
+            message = await websocket.receive()
+            if message['type'] == 'websocket.disconnect':
+                break
+            if message.get('text') is not None:
+                # 制御メッセージ: {"type": "suppressed", "count": N}（エッジ側の変化検出で送信しなかったフレーム数）
+                try:
+                    control = json.loads(message['text'])
+                    if control.get('type') != 'suppressed':
+                        raise ValueError(f"Unknown control message: {control.get('type')}")
+                    count = int(control.get('count', 0))
+                except (ValueError, TypeError, AttributeError) as e:
+                    await send({"type": "error", "seq": None, "detail": f"Invalid control message: {e}"})
+                    continue
+                if count > 0:
+                    detection_system.device_states.record_suppressed(device_id, count)
+                continue
+            data = message.get('bytes')
+            if not data or len(data) <= WS_FRAME_HEADER.size:
+                await send({"type": "error", "seq": None, "detail": "Expected binary frame with header"})
+                continue
+            
+            start_time = datetime.now()
+            seq, ts = WS_FRAME_HEADER.unpack_from(data)
+            timestamp = datetime.fromtimestamp(ts) if ts > 0 else start_time
+            contents = memoryview(data)[WS_FRAME_HEADER.size:]
+            
+            if pending.full():
+                await send({"type": "dropped", "seq": seq, "pending": pending.qsize()})
+                continue
+            pending.put_nowait((seq, contents, timestamp, start_time))
+            
+            if not flow['throttled'] and pending.qsize() >= high_water:
+                flow['throttled'] = True
+                await send({
+                    "type": "throttle",
+                    "pending": pending.qsize(),
+                    "min_interval_ms": round(flow['avg_ms'] * 1.5, 1)
+                })
+    except Exception as e:
+        logger.error(f"WebSocket ingest error ({device_id}): {str(e)}")
+    finally:
+        worker_task.cancel()
+        logger.info(f"WebSocket ingest disconnected: {device_id}")
+
+@app.get("/events/stream")
+async def stream_events(
+    request: Request,
+    device_id: Optional[List[str]] = Query(None),
+    api_key: str = Depends(verify_api_key)
+):
+    """新規イベントをServer-Sent Eventsで配信（device_idは複数指定可）"""
+    return sse_response(event_hub, device_id, request, 'event')
+
+@app.websocket("/ws/events")
+async def ws_events(websocket: WebSocket, device_id: Optional[List[str]] = Query(None), token: Optional[str] = None):
+    """新規イベントをWebSocketで配信（device_idは複数指定可）"""
+    if not verify_ws_api_key(websocket, token):
+        await websocket.close(code=1008)
+        return
+    try:
+        subscriber = event_hub.subscribe(device_id)
+    except RuntimeError:
+        await websocket.close(code=1013)
+        return
+    await websocket.accept()
+    
+    async def watch_disconnect():
+        while (await websocket.receive())['type'] != 'websocket.disconnect':
+            pass
+    
+    disconnect_task = asyncio.create_task(watch_disconnect())
+    try:
+        while True:
+            get_task = asyncio.create_task(subscriber.get(timeout=15))
+            done, _ = await asyncio.wait({get_task, disconnect_task}, return_when=asyncio.FIRST_COMPLETED)
+            if disconnect_task in done:
+                get_task.cancel()
+                break
+            events = get_task.result()
+            if events:
+                await websocket.send_json({"events": events, "dropped": subscriber.dropped})
+    except Exception as e:
+        logger.info(f"Event stream WebSocket closed: {str(e)}")
+    finally:
+        disconnect_task.cancel()
+        event_hub.unsubscribe(subscriber)
+
 @app.get("/events")
 async def get_events(device_id: Optional[str] = None, limit: int = 100):
     """イベント履歴を取得"""
@@ -341,6 +1134,29 @@ async def get_events(device_id: Optional[str] = None, limit: int = 100):
     
     return {"events": events[::-1]}  # 最新順
 
+@app.get("/devices")
+async def get_devices(device_id: Optional[str] = None, api_key: str = Depends(verify_api_key)):
+    """デバイスごとの状態（受信数・アラート数・エッジ側で抑制されたフレーム数など）を取得
+    
+    状態はワーカープロセスごとに持つため、SERVER_WORKERS>1 では応答したワーカーが受信した分のみ。
+    """
+    devices = detection_system.device_states.snapshot()
+    if device_id is not None:
+        devices = {device_id: devices[device_id]} if device_id in devices else {}
+    return {"devices": devices}
+
+@app.get("/stats/stages")
+async def get_stage_stats(reset: bool = False, api_key: str = Depends(verify_api_key)):
+    """受信処理の段階別処理時間（reset=trueで取得後にリセット）と、デバイス・接続ごとの状態の件数"""
+    snapshot = stage_stats.snapshot()
+    snapshot['inference_backlog'] = inference_backlog()
+    snapshot['state_sizes'] = state_sizes()
+    if detection_system.trackers is not None:
+        snapshot['tracking'] = detection_system.trackers.stats()
+    if reset:
+        stage_stats.reset()
+    return snapshot
+
 @app.get("/metrics")
 async def get_metrics(device_id: Optional[str] = None, limit: int = 100):
     """パフォーマンスメトリクスを取得"""
@@ -358,9 +1174,14 @@ async def get_metrics(device_id: Optional[str] = None, limit: int = 100):
     return {"metrics": metrics[::-1]}  # 最新順
 
 if __name__ == "__main__":
+    workers = int(os.getenv('SERVER_WORKERS', 1))
+    if workers > 1:
+        # ワーカー間でアラート状態を共有（子プロセスは環境変数を引き継ぐ）
+        os.environ.setdefault('ALERT_STATE_BACKEND', 'shared')
     uvicorn.run(
         "main:app",
         host=os.getenv('SERVER_HOST', '0.0.0.0'),
         port=int(os.getenv('SERVER_PORT', 8000)),
-        reload=True
+        reload=workers == 1,
+        workers=workers
     )
@@ -0,0 +1,107 @@
+import time
+import logging
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RateAdvisor:
+    """サーバ負荷と検出状況からデバイスごとの送信間隔・画質の推奨値（レートヒント）を計算
+
+    推論1回あたりの時間（指数移動平均）から推論スレッドが処理できるfpsを見積もり、
+    直近に送信してきたデバイスへ重みに応じて配分する。直近に人物を検出したデバイスと
+    優先デバイスは重みを大きくし、より短い間隔を割り当てる。推論待ちが目標遅延を超えたら
+    全体の間隔を延ばし、画質段階を下げる。
+    """
+
+    QUALITY_TIERS = ('high', 'medium', 'low')
+
+    def __init__(self, min_interval_ms: float = 200.0, max_interval_ms: float = 10000.0,
+                 target_utilization: float = 0.7, target_latency_ms: float = 500.0,
+                 active_seconds: float = 30.0, active_weight: float = 4.0,
+                 priority_devices: Optional[Iterable[str]] = None, priority_weight: float = 2.0,
+                 window_seconds: float = 30.0):
+        self.min_interval_ms = min_interval_ms
+        self.max_interval_ms = max_interval_ms
+        self.target_utilization = target_utilization
+        self.target_latency_ms = target_latency_ms
+        self.active_seconds = active_seconds
+        self.active_weight = active_weight
+        self.priority_devices = set(priority_devices or ())
+        self.priority_weight = priority_weight
+        self.window_seconds = window_seconds
+
+        self.inference_ms = 50.0  # 推論時間の指数移動平均（初期値は控えめな見積もり）
+        # device_id -> [最終受信時刻, 最終人物検出時刻, 重み]。受信順なので先頭ほど古い
+        self._devices: 'OrderedDict[str, list]' = OrderedDict()
+        self._total_weight = 0.0
+
+    def __len__(self) -> int:
+        """送信間隔の配分対象になっているデバイス数"""
+        return len(self._devices)
+
+    def _weight(self, device_id: str, last_person_at: float, now: float) -> float:
+        weight = self.priority_weight if device_id in self.priority_devices else 1.0
+        if now - last_person_at < self.active_seconds:
+            weight *= self.active_weight
+        return weight
+
+    def _expire(self, now: float):
+        while self._devices:
+            device_id, (last_seen, _, weight) = next(iter(self._devices.items()))
+            if now - last_seen < self.window_seconds:
+                break
+            self._devices.popitem(last=False)
+            self._total_weight -= weight
+
+    def record(self, device_id: str, person_count: int, inference_time_ms: Optional[float],
+               now: Optional[float] = None):
+        """処理済みフレームを記録（推論時間と検出状況を更新、推論を省いたフレームは inference_time_ms=None）"""
+        now = time.time() if now is None else now
+        if inference_time_ms is not None:
+            self.inference_ms += 0.1 * (inference_time_ms - self.inference_ms)
+
+        entry = self._devices.pop(device_id, None)
+        if entry is None:
+            entry = [now, float('-inf'), 0.0]
+        self._total_weight -= entry[2]
+        entry[0] = now
+        if person_count > 0:
+            entry[1] = now
+        entry[2] = self._weight(device_id, entry[1], now)
+        self._devices[device_id] = entry
+        self._total_weight += entry[2]
+        self._expire(now)
+
+    def load(self, backlog: int) -> float:
+        """推論待ちの見込み時間 / 目標遅延（1.0を超えると過負荷）"""
+        return backlog * self.inference_ms / self.target_latency_ms
+
+    def hint(self, device_id: str, backlog: int, now: Optional[float] = None) -> dict:
+        """デバイスへの推奨送信間隔と画質段階"""
+        now = time.time() if now is None else now
+        entry = self._devices.get(device_id)
+        weight = entry[2] if entry is not None else self._weight(device_id, float('-inf'), now)
+        total_weight = max(self._total_weight, weight)
+
+        # 処理可能なfpsのうちこのデバイスの取り分
+        capacity_fps = 1000.0 / max(self.inference_ms, 1e-3) * self.target_utilization
+        interval_ms = 1000.0 * total_weight / (capacity_fps * weight)
+
+        load = self.load(backlog)
+        if load > 1.0:
+            interval_ms *= load
+        interval_ms = min(max(interval_ms, self.min_interval_ms), self.max_interval_ms)
+
+        tier = 0 if load < 0.5 else 1 if load < 1.0 else 2
+        active = entry is not None and now - entry[1] < self.active_seconds
+        if active:
+            tier = max(tier - 1, 0)  # 人物を検出中のデバイスは画質を優先
+
+        return {
+            'next_interval_ms': round(interval_ms),
+            'quality': self.QUALITY_TIERS[tier],
+            'load': round(load, 3),
+            'active': active
+        }
@@ -0,0 +1,182 @@
+import os
+import mmap
+import struct
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class SharedAlertState:
+    """複数ワーカープロセス間で共有するアラート状態（ファイルロック付きmmapテーブル）
+
+    固定長スロットのオープンアドレス法ハッシュテーブル。キーはdevice_idのハッシュ値で、
+    満杯時はプローブ範囲内で最も古いスロットを置き換える。
+
+    使用中のプロセスは隣の .lock ファイルに共有ロックを持ち続ける。容量の異なる既存ファイルを
+    作り直すのは、他に使用中のプロセスがない（排他ロックを取れた）場合だけ。
+    """
+
+    MAGIC = b'EADS'
+    VERSION = 1
+    HEADER = struct.Struct('<4sII')  # magic, version, capacity
+    SLOT = struct.Struct('<16sd32sd')  # key, last_alert_at, last_event_sig, last_seen
+    EMPTY_KEY = b'\x00' * 16
+    PROBE_LIMIT = 32
+
+    def __init__(self, path: Path, capacity: int = 4096):
+        if fcntl is None:
+            raise RuntimeError("Shared alert state requires fcntl (POSIX only)")
+
+        self.path = Path(path)
+        self.capacity = capacity
+        self.size = self.HEADER.size + capacity * self.SLOT.size
+        self._thread_lock = threading.Lock()
+
+        # 使用中の印（共有ロック）。排他ロックを取れれば他にファイルをmmapしているプロセスはない
+        self._holder_fd = os.open(str(self.path.with_name(self.path.name + '.lock')), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(self._holder_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            sole_user = True
+        except BlockingIOError:
+            fcntl.flock(self._holder_fd, fcntl.LOCK_SH)
+            sole_user = False
+
+        self._fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            with self._locked():
+                self._ensure_layout(sole_user)
+            self._mm = mmap.mmap(self._fd, self.size)
+        except BaseException:
+            os.close(self._fd)
+            os.close(self._holder_fd)
+            raise
+        if sole_user:
+            fcntl.flock(self._holder_fd, fcntl.LOCK_SH)
+
+        logger.info(f"Shared alert state opened: {self.path} (capacity={capacity})")
+
+    @contextmanager
+    def _locked(self):
+        # flockはプロセス間、threading.Lockは同一プロセス内のスレッド間の排他
+        with self._thread_lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _ensure_layout(self, sole_user: bool):
+        """ファイルサイズとヘッダーを検証し、空のファイルは初期化する
+
+        使用中の他プロセスがいる状態で作り直すとmmap中のファイルを切り詰めてしまう
+        （SIGBUSや状態の消失）ため、その場合は不一致をエラーにする。
+        """
+        header = os.pread(self._fd, self.HEADER.size, 0)
+        expected = self.HEADER.pack(self.MAGIC, self.VERSION, self.capacity)
+        file_size = os.fstat(self._fd).st_size
+        if file_size == self.size and header == expected:
+            return
+
+        if file_size > 0:
+            if not sole_user:
+                raise ValueError(
+                    f"Shared alert state file {self.path} is in use with a different layout "
+                    f"(expected capacity={self.capacity}); use the same ALERT_STATE_CAPACITY for all workers"
+                )
+            logger.warning(f"Shared alert state file has a different layout, reinitializing: {self.path}")
+        logger.info(f"Initializing shared alert state file: {self.path}")
+        os.ftruncate(self._fd, 0)
+        os.ftruncate(self._fd, self.size)
+        os.pwrite(self._fd, expected, 0)
+
+    def _key(self, device_id: str) -> bytes:
+        return hashlib.blake2b(device_id.encode('utf-8'), digest_size=16).digest()
+
+    def _offset(self, index: int) -> int:
+        return self.HEADER.size + index * self.SLOT.size
+
+    def _find_slot(self, key: bytes):
+        """キーのスロットを探す。なければ空きまたは最古のスロットを返す"""
+        start = int.from_bytes(key[:8], 'little') % self.capacity
+        free_index = None
+        oldest_index, oldest_seen = None, None
+
+        for i in range(min(self.PROBE_LIMIT, self.capacity)):
+            index = (start + i) % self.capacity
+            slot_key, _, _, last_seen = self.SLOT.unpack_from(self._mm, self._offset(index))
+            if slot_key == key:
+                return index, True
+            if slot_key == self.EMPTY_KEY:
+                if free_index is None:
+                    free_index = index
+            elif oldest_seen is None or last_seen < oldest_seen:
+                oldest_index, oldest_seen = index, last_seen
+
+        return (free_index if free_index is not None else oldest_index), False
+
+    def try_claim_alert(self, device_id: str, event_sig: str, now: float, cooldown_seconds: float) -> bool:
+        """クールダウンと重複を判定し、送信可能ならアラートを記録（全ワーカーで不可分）"""
+        key = self._key(device_id)
+        sig = event_sig.encode('utf-8')[:32]
+
+        with self._locked():
+            index, found = self._find_slot(key)
+            offset = self._offset(index)
+            if found:
+                _, last_alert_at, stored_sig, _ = self.SLOT.unpack_from(self._mm, offset)
+                if (last_alert_at and now - last_alert_at < cooldown_seconds) or stored_sig.rstrip(b'\x00') == sig:
+                    self.SLOT.pack_into(self._mm, offset, key, last_alert_at, stored_sig, now)
+                    return False
+            self.SLOT.pack_into(self._mm, offset, key, now, sig, now)
+            return True
+
+    def __len__(self) -> int:
+        """使用中のスロット数"""
+        with self._locked():
+            return sum(
+                1 for index in range(self.capacity)
+                if self._mm[self._offset(index):self._offset(index) + 16] != self.EMPTY_KEY
+            )
+
+    def close(self):
+        self._mm.close()
+        os.close(self._fd)
+        os.close(self._holder_fd)
+
+
+class OwnerLock:
+    """複数ワーカーのうち1プロセスだけが担当する処理のための排他ロック（ファイルロックを保持し続ける）
+
+    acquire() はロックを取れていなければ非ブロッキングで取得を試みる。担当のワーカーが
+    終了するとロックが解放され、次に acquire() を呼んだワーカーが引き継ぐ。
+    """
+
+    def __init__(self, path: Path):
+        if fcntl is None:
+            raise RuntimeError("Owner lock requires fcntl (POSIX only)")
+        self.path = Path(path)
+        self._fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o644)
+        self.owned = False
+
+    def acquire(self) -> bool:
+        if not self.owned:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            self.owned = True
+            logger.info(f"Acquired owner lock: {self.path} (pid={os.getpid()})")
+        return True
+
+    def close(self):
+        os.close(self._fd)
+        self.owned = False
@@ -0,0 +1,58 @@
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict
+
+
+class StageStats:
+    """受信処理の段階別（デコード・推論・イベント保存など）の処理時間を集計
+
+    段階ごとに直近 window 件の処理時間を保持し、件数・平均・パーセンタイルを返す。
+    """
+
+    def __init__(self, window: int = 10000):
+        self.window = window
+        self._samples: Dict[str, deque] = {}
+        self._counts: Dict[str, int] = {}
+        self._totals: Dict[str, float] = {}
+        self.started_at = time.time()
+
+    def record(self, stage: str, elapsed_ms: float):
+        samples = self._samples.get(stage)
+        if samples is None:
+            samples = self._samples[stage] = deque(maxlen=self.window)
+            self._counts[stage] = 0
+            self._totals[stage] = 0.0
+        samples.append(elapsed_ms)
+        self._counts[stage] += 1
+        self._totals[stage] += elapsed_ms
+
+    @contextmanager
+    def measure(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, (time.perf_counter() - start) * 1000)
+
+    def reset(self):
+        self._samples.clear()
+        self._counts.clear()
+        self._totals.clear()
+        self.started_at = time.time()
+
+    def snapshot(self) -> dict:
+        """段階ごとの件数・平均・p50/p95/p99・最大（ms）"""
+        stages = {}
+        for stage, samples in self._samples.items():
+            ordered = sorted(samples)
+            pick = lambda pct: ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+            stages[stage] = {
+                'count': self._counts[stage],
+                'mean_ms': self._totals[stage] / self._counts[stage],
+                'p50_ms': pick(50),
+                'p95_ms': pick(95),
+                'p99_ms': pick(99),
+                'max_ms': ordered[-1]
+            }
+        return {'since': self.started_at, 'stages': stages}
@@ -0,0 +1,46 @@
+import time
+from typing import List
+
+import numpy as np
+
+
+class _StubBox:
+    """ultralyticsのBoxes要素と同じ属性（cls, conf, xyxy）を持つ検出ボックス"""
+
+    def __init__(self, class_id: int, confidence: float, xyxy: np.ndarray):
+        self.cls = np.array([class_id], dtype=np.float32)
+        self.conf = np.array([confidence], dtype=np.float32)
+        self.xyxy = xyxy.reshape(1, 4).astype(np.float32)
+
+
+class _StubResult:
+    def __init__(self, boxes: List[_StubBox]):
+        self.boxes = boxes
+
+
+class StubDetector:
+    """ultralytics.YOLO互換の推論スタブ（ベンチマーク・負荷試験用）
+
+    画像サイズに応じた固定位置に persons 人分の人物ボックスを返す。
+    latency_ms を指定すると1画像あたりその時間だけ推論時間を模擬する。
+    """
+
+    def __init__(self, persons: int = 1, latency_ms: float = 0.0):
+        self.persons = persons
+        self.latency_ms = latency_ms
+
+    def _result(self, image: np.ndarray) -> _StubResult:
+        height, width = image.shape[:2]
+        box_width = width / (self.persons * 2 + 1)
+        boxes = []
+        for i in range(self.persons):
+            x1 = box_width * (i * 2 + 1)
+            xyxy = np.array([x1, height * 0.2, x1 + box_width, height * 0.9])
+            boxes.append(_StubBox(0, 0.9 - 0.05 * (i % 5), xyxy))
+        return _StubResult(boxes)
+
+    def __call__(self, source, conf: float = 0.5, **kwargs):
+        images = source if isinstance(source, list) else [source]
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms * len(images) / 1000)
+        return [self._result(image) for image in images]
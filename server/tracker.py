@@ -0,0 +1,256 @@
+import time
+import threading
+import logging
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """2組のボックス（xyxy, 形状 (n, 4) と (m, 4)）の IoU 行列 (n, m)"""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0).astype(np.float32)
+
+
+def match_greedy(iou: np.ndarray, threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+    """IoU の大きい組から順に1対1で対応付け（閾値未満は対応させない）
+
+    戻り値は対応した (トラックの添字, 検出の添字)。
+    """
+    rows, cols = np.nonzero(iou >= threshold)
+    if len(rows) == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    order = np.argsort(-iou[rows, cols], kind='stable')
+    used_rows, used_cols = set(), set()
+    matched_rows, matched_cols = [], []
+    for row, col in zip(rows[order], cols[order]):
+        if row in used_rows or col in used_cols:
+            continue
+        used_rows.add(row)
+        used_cols.add(col)
+        matched_rows.append(row)
+        matched_cols.append(col)
+    return np.array(matched_rows, dtype=np.intp), np.array(matched_cols, dtype=np.intp)
+
+
+def motion_thumbnail(image: np.ndarray, size: Tuple[int, int] = (64, 48)) -> np.ndarray:
+    """動き判定用の縮小グレースケール画像"""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA).astype(np.int16)
+
+
+class DeviceTracker:
+    """1デバイス分の人物トラッカー（SORT方式の IoU 対応付け + 等速度モデル）
+
+    トラックの状態はすべて NumPy 配列で持ち、予測・対応付け・更新をまとめて計算する。
+    位置と速度は α-β フィルタ（等速度モデルの定常カルマンフィルタに相当）で平滑化する。
+    キーフレーム（推論したフレーム）で update、その間のフレームでは predict で位置を進める。
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, max_age: int = 3, min_hits: int = 1,
+                 alpha: float = 0.7, beta: float = 0.3):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age  # 対応する検出がないまま残すキーフレーム数
+        self.min_hits = min_hits  # トラックを確定させるまでの検出回数
+        self.alpha = alpha
+        self.beta = beta
+
+        self.boxes = np.empty((0, 4), dtype=np.float64)  # xyxy
+        self.velocity = np.empty((0, 4), dtype=np.float64)  # 1フレームあたりの移動量
+        self.ids = np.empty(0, dtype=np.int64)
+        self.confidences = np.empty(0, dtype=np.float64)
+        self.hits = np.empty(0, dtype=np.int32)
+        self.misses = np.empty(0, dtype=np.int32)  # 連続して対応しなかったキーフレーム数
+        self.since_update = np.empty(0, dtype=np.int32)  # 最後に観測してからのフレーム数
+        self.reported = np.empty(0, dtype=bool)  # アラートで通知済みか
+
+        self.next_id = 1
+        self.frames_since_keyframe = 0
+        self.keyframe_thumbnail: Optional[np.ndarray] = None
+        self.last_seen = 0.0
+        self.last_frame_at: Optional[float] = None  # 最後に追跡したフレームの撮影時刻（epoch秒）
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def _visible(self) -> np.ndarray:
+        """直近のキーフレームで観測された確定トラック"""
+        return (self.hits >= self.min_hits) & (self.misses == 0)
+
+    def _advance(self):
+        self.boxes += self.velocity
+        self.since_update += 1
+
+    def is_stale(self, frame_at: float) -> bool:
+        """最後に追跡したフレームより古いフレームか（スプールの再送など、追跡の対象外）"""
+        return self.last_frame_at is not None and frame_at < self.last_frame_at
+
+    def predict(self, frame_at: Optional[float] = None) -> Tuple[np.ndarray, list]:
+        """推論しないフレームでトラックを1フレーム進め、見えているトラックのボックスと信頼度を返す"""
+        if frame_at is not None:
+            self.last_frame_at = frame_at
+        self._advance()
+        self.frames_since_keyframe += 1
+        visible = self._visible
+        return self.boxes[visible].copy(), self.confidences[visible].tolist()
+
+    def update(self, boxes: np.ndarray, confidences: List[float], frame_at: Optional[float] = None) -> np.ndarray:
+        """キーフレームの検出結果でトラックを更新し、見えている確定トラックのIDを返す"""
+        if frame_at is not None:
+            self.last_frame_at = frame_at
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        confidences = np.asarray(confidences, dtype=np.float64)
+        self._advance()
+        self.frames_since_keyframe = 0
+
+        track_index, detection_index = match_greedy(iou_matrix(self.boxes, boxes), self.iou_threshold)
+
+        # 対応したトラック: 予測との差（残差）で位置と速度を補正
+        if len(track_index):
+            residual = boxes[detection_index] - self.boxes[track_index]
+            steps = np.maximum(self.since_update[track_index], 1)[:, None]
+            self.boxes[track_index] += self.alpha * residual
+            self.velocity[track_index] += self.beta * residual / steps
+            self.confidences[track_index] = confidences[detection_index]
+            self.hits[track_index] += 1
+        matched = np.zeros(len(self.ids), dtype=bool)
+        matched[track_index] = True
+        self.misses = np.where(matched, 0, self.misses + 1)
+        self.since_update[matched] = 0
+        # 見失ったトラックは速度を止めて位置だけ保持する
+        self.velocity[~matched] = 0.0
+
+        # 古いトラックを削除
+        keep = self.misses <= self.max_age
+        if not keep.all():
+            self._select(keep)
+
+        # 対応しなかった検出から新しいトラックを作成
+        new = np.ones(len(boxes), dtype=bool)
+        new[detection_index] = False
+        count = int(new.sum())
+        if count:
+            self.boxes = np.vstack([self.boxes, boxes[new]])
+            self.velocity = np.vstack([self.velocity, np.zeros((count, 4))])
+            self.ids = np.concatenate([self.ids, np.arange(self.next_id, self.next_id + count)])
+            self.confidences = np.concatenate([self.confidences, confidences[new]])
+            self.hits = np.concatenate([self.hits, np.ones(count, dtype=np.int32)])
+            self.misses = np.concatenate([self.misses, np.zeros(count, dtype=np.int32)])
+            self.since_update = np.concatenate([self.since_update, np.zeros(count, dtype=np.int32)])
+            self.reported = np.concatenate([self.reported, np.zeros(count, dtype=bool)])
+            self.next_id += count
+
+        return self.ids[self._visible].copy()
+
+    def _select(self, mask: np.ndarray):
+        for name in ('boxes', 'velocity', 'ids', 'confidences', 'hits', 'misses', 'since_update', 'reported'):
+            setattr(self, name, getattr(self, name)[mask])
+
+    def visible_ids(self) -> np.ndarray:
+        return self.ids[self._visible].copy()
+
+    def unreported_ids(self) -> List[int]:
+        """見えている確定トラックのうち、まだアラートで通知していないもののID"""
+        return self.ids[self._visible & ~self.reported].tolist()
+
+    def mark_reported(self):
+        """見えている確定トラックを通知済みにする"""
+        self.reported |= self._visible
+
+
+class TrackerStore:
+    """デバイスごとのトラッカーとキーフレーム判定（LRU/アイドル追い出し付き）
+
+    keyframe_interval フレームごと、または直前のキーフレームからの画素変化量（0〜1）が
+    motion_threshold を超えたフレームをキーフレームとし、それ以外のフレームは推論を省いて
+    トラッカーの予測で置き換える。keyframe_interval=1 なら全フレームで推論する。
+    """
+
+    def __init__(self, keyframe_interval: int = 1, motion_threshold: float = 0.05, max_devices: int = 10000,
+                 idle_seconds: float = 86400, **tracker_options):
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.motion_threshold = motion_threshold
+        self.max_devices = max_devices
+        self.idle_seconds = idle_seconds
+        self.tracker_options = tracker_options
+        self._trackers: 'OrderedDict[str, DeviceTracker]' = OrderedDict()
+        self._lock = threading.RLock()
+        self.keyframes = 0
+        self.propagated = 0
+
+    def __len__(self) -> int:
+        return len(self._trackers)
+
+    def __contains__(self, device_id: str) -> bool:
+        return device_id in self._trackers
+
+    def get(self, device_id: str, now: Optional[float] = None) -> DeviceTracker:
+        """デバイスのトラッカーを取得し、なければ作成してLRU末尾に置く"""
+        now = time.time() if now is None else now
+        with self._lock:
+            tracker = self._trackers.get(device_id)
+            if tracker is None:
+                tracker = self._trackers[device_id] = DeviceTracker(**self.tracker_options)
+                while len(self._trackers) > self.max_devices:
+                    evicted, _ = self._trackers.popitem(last=False)
+                    logger.debug(f"Evicted tracker (LRU): {evicted}")
+            else:
+                self._trackers.move_to_end(device_id)
+            tracker.last_seen = now
+            return tracker
+
+    def is_keyframe(self, tracker: DeviceTracker, image: np.ndarray) -> bool:
+        """このフレームで推論すべきか判定（キーフレームなら動き判定用の縮小画像を保持）"""
+        if self.keyframe_interval == 1:
+            self.keyframes += 1
+            return True
+        thumbnail = motion_thumbnail(image)
+        keyframe = bool(
+            tracker.keyframe_thumbnail is None
+            or tracker.keyframe_thumbnail.shape != thumbnail.shape
+            or tracker.frames_since_keyframe + 1 >= self.keyframe_interval
+            or np.abs(thumbnail - tracker.keyframe_thumbnail).mean() / 255 > self.motion_threshold
+        )
+        if keyframe:
+            tracker.keyframe_thumbnail = thumbnail
+            self.keyframes += 1
+        else:
+            self.propagated += 1
+        return keyframe
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """一定時間フレームが来ていないデバイスのトラッカーを削除"""
+        now = time.time() if now is None else now
+        cutoff = now - self.idle_seconds
+        evicted = 0
+        with self._lock:
+            while self._trackers:
+                tracker = next(iter(self._trackers.values()))
+                if tracker.last_seen >= cutoff:
+                    break
+                self._trackers.popitem(last=False)
+                evicted += 1
+        return evicted
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'devices': len(self._trackers),
+                'tracks': sum(len(tracker) for tracker in self._trackers.values()),
+                'keyframes': self.keyframes,
+                'propagated_frames': self.propagated
+            }
@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# edge/ と server/ のモジュールはそれぞれのディレクトリから直接 import される
+ROOT = Path(__file__).resolve().parent.parent
+for directory in ('edge', 'server'):
+    sys.path.insert(0, str(ROOT / directory))
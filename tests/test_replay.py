@@ -0,0 +1,44 @@
+import cv2
+import numpy as np
+
+from replay import ReplaySource
+
+
+def write_images(directory, count: int, broken: tuple = ()):
+    for i in range(count):
+        path = directory / f'{i:03d}.jpg'
+        if i in broken:
+            path.write_bytes(b'not a jpeg')
+        else:
+            cv2.imwrite(str(path), np.full((8, 8, 3), i * 10, dtype=np.uint8))
+
+
+def read_all(source: ReplaySource, limit: int = 100) -> list:
+    indexes = []
+    for _ in range(limit):
+        ok, _ = source.read()
+        if not ok:
+            break
+        indexes.append(source.index)
+    return indexes
+
+
+def test_skips_unreadable_images(tmp_path):
+    write_images(tmp_path, 5, broken=(1, 3))
+    source = ReplaySource(str(tmp_path), pacing='fast')
+    assert read_all(source) == [0, 2, 4]
+    assert source.finished
+
+
+def test_loop_continues_past_unreadable_images(tmp_path):
+    write_images(tmp_path, 3, broken=(2,))
+    source = ReplaySource(str(tmp_path), pacing='fast', loop=True)
+    assert read_all(source, limit=5) == [0, 1, 0, 1, 0]
+    assert not source.finished
+
+
+def test_stops_when_no_image_is_readable(tmp_path):
+    write_images(tmp_path, 3, broken=(0, 1, 2))
+    source = ReplaySource(str(tmp_path), pacing='fast', loop=True)
+    assert read_all(source) == []
+    assert source.finished
@@ -0,0 +1,34 @@
+import pytest
+
+shared_state = pytest.importorskip('shared_state')
+pytest.importorskip('fcntl')
+
+
+def test_owner_lock_is_held_by_one_worker(tmp_path):
+    path = tmp_path / 'device_state.lock'
+    first, second = shared_state.OwnerLock(path), shared_state.OwnerLock(path)
+    assert first.acquire()
+    assert first.acquire()
+    assert not second.acquire()
+    # 担当のワーカーが終了すると引き継がれる
+    first.close()
+    assert second.acquire()
+    second.close()
+
+
+def test_capacity_mismatch_is_rejected_while_in_use(tmp_path):
+    path = tmp_path / 'alert_state.bin'
+    first = shared_state.SharedAlertState(path, capacity=64)
+    assert first.try_claim_alert('cam-1', '1', now=100.0, cooldown_seconds=60)
+
+    # 使用中のファイルは切り詰めずにエラーにする
+    with pytest.raises(ValueError):
+        shared_state.SharedAlertState(path, capacity=128)
+    assert not first.try_claim_alert('cam-1', '2', now=110.0, cooldown_seconds=60)
+    assert len(first) == 1
+
+    # 使用中のプロセスがいなくなれば新しい容量で作り直せる
+    first.close()
+    second = shared_state.SharedAlertState(path, capacity=128)
+    assert len(second) == 0
+    second.close()
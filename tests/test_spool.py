@@ -0,0 +1,48 @@
+from spool import FrameSpool
+
+FRAME = b'x' * 1000
+
+
+def fill(spool: FrameSpool, count: int, start: int = 0):
+    for i in range(start, start + count):
+        spool.append(FRAME, float(i))
+
+
+def captured_times(spool: FrameSpool) -> list:
+    """全フレームを読み出して送信済みにし、撮影時刻を返す"""
+    times = []
+    while True:
+        frames, cursor = spool.read_batch(4)
+        if not frames:
+            return times
+        times.extend(captured_at for _, captured_at in frames)
+        spool.ack(cursor)
+
+
+def test_evicts_oldest_segments_over_cap(tmp_path):
+    record = FrameSpool.RECORD_HEADER.size + len(FRAME)
+    spool = FrameSpool(tmp_path, segment_max_bytes=record * 5, max_total_bytes=record * 15)
+    fill(spool, 30)
+
+    assert spool.total_bytes() <= record * 15
+    assert spool.evicted_frames == 15
+    # 残っているのは新しい側のフレームだけで、古い順に読み出される
+    assert captured_times(spool) == [float(i) for i in range(15, 30)]
+
+
+def test_acked_replay_resumes_after_restart(tmp_path):
+    record = FrameSpool.RECORD_HEADER.size + len(FRAME)
+    spool = FrameSpool(tmp_path, segment_max_bytes=record * 5, max_total_bytes=record * 100)
+    fill(spool, 12)
+
+    frames, cursor = spool.read_batch(3)
+    assert [captured_at for _, captured_at in frames] == [0.0, 1.0, 2.0]
+    spool.ack(cursor)
+    # 読み出したが ack していないバッチは再起動後にもう一度送る
+    spool.read_batch(3)
+
+    reopened = FrameSpool(tmp_path, segment_max_bytes=record * 5, max_total_bytes=record * 100)
+    assert len(reopened) == 9
+    fill(reopened, 2, start=12)
+    assert captured_times(reopened) == [float(i) for i in range(3, 14)]
+    assert len(reopened) == 0
@@ -0,0 +1,105 @@
+import numpy as np
+
+from tracker import DeviceTracker, TrackerStore, iou_matrix
+
+
+def person(x: float) -> list:
+    return [x, 50.0, x + 60.0, 200.0]
+
+
+def test_iou_matrix():
+    iou = iou_matrix(np.array([person(0)]), np.array([person(0), person(30), person(500)]))
+    assert iou.shape == (1, 3)
+    assert iou[0, 0] == 1.0
+    assert 0.3 < iou[0, 1] < 0.4
+    assert iou[0, 2] == 0.0
+
+
+def test_keeps_id_and_assigns_new_id_on_entry():
+    tracker = DeviceTracker()
+    assert tracker.update([person(100)], [0.9]).tolist() == [1]
+    # 少しずつ動いても同じID
+    for step in range(1, 5):
+        assert tracker.update([person(100 + 8 * step)], [0.9]).tolist() == [1]
+    # 2人目が入ってきたら新しいID
+    ids = tracker.update([person(140), person(400)], [0.9, 0.8])
+    assert ids.tolist() == [1, 2]
+
+
+def test_predict_follows_velocity_between_keyframes():
+    tracker = DeviceTracker()
+    for step in range(8):
+        tracker.update([person(100 + 10 * step)], [0.9])
+    boxes, confidences = tracker.predict()
+    assert confidences == [0.9]
+    assert abs(boxes[0, 0] - 180) < 5
+
+
+def test_unreported_ids_gate_alerts():
+    tracker = DeviceTracker()
+    tracker.update([person(100)], [0.9])
+    assert tracker.unreported_ids() == [1]
+    tracker.mark_reported()
+    assert tracker.unreported_ids() == []
+    # 同じ人物が残っている間は通知しない
+    tracker.update([person(105)], [0.9])
+    assert tracker.unreported_ids() == []
+    # 新しい人物だけが未通知になる
+    tracker.update([person(105), person(400)], [0.9, 0.8])
+    assert tracker.unreported_ids() == [2]
+
+
+def test_lost_track_is_removed_after_max_age():
+    tracker = DeviceTracker(max_age=2)
+    tracker.update([person(100)], [0.9])
+    for _ in range(2):
+        assert tracker.update([], []).tolist() == []
+        assert len(tracker) == 1
+    tracker.update([], [])
+    assert len(tracker) == 0
+    # 戻ってきた人物は新しいトラックになる
+    assert tracker.update([person(100)], [0.9]).tolist() == [2]
+
+
+def test_min_hits_delays_confirmation():
+    tracker = DeviceTracker(min_hits=2)
+    assert tracker.update([person(100)], [0.9]).tolist() == []
+    assert tracker.unreported_ids() == []
+    assert tracker.update([person(102)], [0.9]).tolist() == [1]
+
+
+def test_older_frames_are_stale():
+    tracker = DeviceTracker()
+    assert not tracker.is_stale(100.0)
+    tracker.update([person(100)], [0.9], frame_at=100.0)
+    assert tracker.is_stale(50.0)
+    assert not tracker.is_stale(101.0)
+
+
+def test_store_keyframe_schedule_and_motion():
+    store = TrackerStore(keyframe_interval=3, motion_threshold=0.05)
+    tracker = store.get('cam1')
+    assert store.get('cam1') is tracker
+    still = np.full((120, 160, 3), 80, dtype=np.uint8)
+    keyframes = []
+    for _ in range(6):
+        keyframe = store.is_keyframe(tracker, still)
+        keyframes.append(keyframe)
+        if keyframe:
+            tracker.update([], [])
+        else:
+            tracker.predict()
+    assert keyframes == [True, False, False, True, False, False]
+    # 大きな変化があれば間隔を待たずにキーフレーム
+    assert store.is_keyframe(tracker, np.full_like(still, 255))
+
+
+def test_store_evicts_least_recently_used():
+    store = TrackerStore(max_devices=2)
+    store.get('a')
+    store.get('b')
+    store.get('a')
+    store.get('c')
+    assert len(store) == 2
+    assert store.stats()['devices'] == 2
+    assert 'b' not in store and 'a' in store
@@ -0,0 +1,145 @@
+"""
+分析チャートの描画。
+
+描画に必要な小さな集計（時間別合計・ヒストグラムのビン・箱ひげ図の統計量・散布図の点）を
+親プロセスで NumPy / pandas により計算し、描画だけをプロセスプールで並列に行う。
+プレビューモードでは解像度を下げ、散布図の点を間引き、箱ひげ図の外れ値を省略する。
+デバイス別の箱ひげ図は devices_per_chart 台ずつ別ファイルに分割する。
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+FULL_DPI = 300
+PREVIEW_DPI = 100
+
+
+def _pyplot():
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    plt.style.use('seaborn-v0_8')
+    sns.set_palette("husl")
+    return plt
+
+
+def timeline_task(events_df: pd.DataFrame) -> dict:
+    hourly = events_df.set_index('timestamp')['person_count'].resample('h').sum()
+    return {'kind': 'timeline', 'filename': 'detection_timeline.png', 'index': hourly.index, 'values': hourly.to_numpy()}
+
+
+def histogram_task(perf_df: pd.DataFrame, bins: int = 50) -> dict:
+    values = perf_df['total_response_time_ms'].dropna().to_numpy()
+    counts, edges = np.histogram(values, bins=bins)
+    return {
+        'kind': 'histogram', 'filename': 'response_time_distribution.png', 'counts': counts, 'edges': edges,
+        'mean': float(values.mean()), 'p95': float(np.quantile(values, 0.95))
+    }
+
+
+def boxplot_stats(perf_df: pd.DataFrame, column: str = 'total_response_time_ms', fliers: bool = True) -> list:
+    """デバイスごとの箱ひげ図の統計量（matplotlib の Axes.bxp 形式、ひげは 1.5×IQR）をまとめて計算"""
+    data = perf_df[['device_id', column]].dropna()
+    grouped = data.groupby('device_id', observed=True)[column]
+    quartiles = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+    quartiles.columns = ['q1', 'med', 'q3']
+    iqr = quartiles['q3'] - quartiles['q1']
+    quartiles['low'] = quartiles['q1'] - 1.5 * iqr
+    quartiles['high'] = quartiles['q3'] + 1.5 * iqr
+
+    bounds = quartiles[['low', 'high']].reindex(data['device_id']).to_numpy()
+    values = data[column].to_numpy()
+    inside = (values >= bounds[:, 0]) & (values <= bounds[:, 1])
+    whiskers = data[inside].groupby('device_id', observed=True)[column].agg(['min', 'max'])
+    outliers = data[~inside].groupby('device_id', observed=True)[column] if fliers else None
+    outlier_groups = dict(list(outliers)) if fliers else {}
+
+    stats = []
+    for device, row in quartiles.iterrows():
+        stats.append({
+            'label': str(device), 'q1': row['q1'], 'med': row['med'], 'q3': row['q3'],
+            'whislo': whiskers['min'].get(device, row['q1']), 'whishi': whiskers['max'].get(device, row['q3']),
+            'fliers': outlier_groups[device].to_numpy() if device in outlier_groups else np.array([])
+        })
+    return stats
+
+
+def boxplot_tasks(perf_df: pd.DataFrame, devices_per_chart: int, fliers: bool = True) -> list:
+    """デバイス別の箱ひげ図を devices_per_chart 台ずつのチャートに分割"""
+    stats = boxplot_stats(perf_df, fliers=fliers)
+    shards = [stats[i:i + devices_per_chart] for i in range(0, len(stats), devices_per_chart)]
+    tasks = []
+    for number, shard in enumerate(shards, 1):
+        filename = ('device_performance_comparison.png' if len(shards) == 1
+                    else f'device_performance_comparison_{number:03d}.png')
+        title = 'Response Time by Device' if len(shards) == 1 else f'Response Time by Device ({number}/{len(shards)})'
+        tasks.append({'kind': 'boxplot', 'filename': filename, 'stats': shard, 'title': title})
+    return tasks
+
+
+def scatter_task(perf_df: pd.DataFrame, max_points: int = None, seed: int = 0) -> dict:
+    data = perf_df[['inference_time_ms', 'total_response_time_ms']].dropna().to_numpy()
+    if max_points and len(data) > max_points:
+        data = data[np.random.default_rng(seed).choice(len(data), max_points, replace=False)]
+    return {'kind': 'scatter', 'filename': 'inference_vs_total_time.png', 'x': data[:, 0], 'y': data[:, 1]}
+
+
+def render(task: dict, output_dir: str, dpi: int) -> str:
+    """1枚のチャートを描画して保存（プロセスプールのワーカーで実行される）
+
+    プレビュー解像度では bbox_inches='tight' による再描画を省く（余白の調整は tight_layout のみ）。
+    """
+    plt = _pyplot()
+    kind = task['kind']
+
+    if kind == 'timeline':
+        plt.figure(figsize=(12, 6))
+        plt.plot(task['index'], task['values'])
+        plt.title('Person Detection Count Over Time')
+        plt.xlabel('Time')
+        plt.ylabel('Total Person Count')
+        plt.xticks(rotation=45)
+    elif kind == 'histogram':
+        plt.figure(figsize=(10, 6))
+        edges = task['edges']
+        plt.hist(edges[:-1], bins=edges, weights=task['counts'], alpha=0.7, edgecolor='black')
+        plt.title('Response Time Distribution')
+        plt.xlabel('Response Time (ms)')
+        plt.ylabel('Frequency')
+        plt.axvline(task['mean'], color='red', linestyle='--', label='Mean')
+        plt.axvline(task['p95'], color='orange', linestyle='--', label='95th percentile')
+        plt.legend()
+    elif kind == 'boxplot':
+        plt.figure(figsize=(max(12, len(task['stats']) * 0.3), 8))
+        plt.gca().bxp(task['stats'], showfliers=any(len(s['fliers']) for s in task['stats']))
+        plt.title(task['title'])
+        plt.xlabel('Device ID')
+        plt.ylabel('Response Time (ms)')
+        plt.xticks(rotation=45)
+    elif kind == 'scatter':
+        plt.figure(figsize=(10, 6))
+        plt.scatter(task['x'], task['y'], alpha=0.6)
+        plt.title('Inference Time vs Total Response Time')
+        plt.xlabel('Inference Time (ms)')
+        plt.ylabel('Total Response Time (ms)')
+    else:
+        raise ValueError(f"Unknown chart kind: {kind}")
+
+    path = Path(output_dir) / task['filename']
+    plt.tight_layout()
+    plt.savefig(path, dpi=dpi, bbox_inches='tight' if dpi > PREVIEW_DPI else None)
+    plt.close()
+    return str(path)
+
+
+def render_all(tasks: list, output_dir: str, dpi: int, jobs: int = None) -> list:
+    """チャートを並列に描画（jobs=1 ではこのプロセスで順に描画）"""
+    jobs = jobs or min(len(tasks), os.cpu_count() or 1)
+    if jobs <= 1 or len(tasks) <= 1:
+        return [render(task, output_dir, dpi) for task in tasks]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(render, tasks, [output_dir] * len(tasks), [dpi] * len(tasks)))
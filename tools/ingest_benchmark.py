@@ -0,0 +1,167 @@
+"""
+受信経路のベンチマーク: /ingest（マルチパート）と /ingest/raw（生ボディ）の
+1リクエストあたりのCPU時間・経過時間を比較する。
+
+サーバアプリをプロセス内で起動し（httpx.ASGITransport）、推論はスタブモデルで代替するため
+YOLO・GPUなしで実行できる。リクエストボディは事前に組み立てて使い回すので、
+両経路の差はサーバ側のボディ解析コストの差になる。
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+from pathlib import Path
+
+import cv2
+import numpy as np
+import httpx
+
+SERVER_DIR = Path(__file__).resolve().parent.parent / 'server'
+BOUNDARY = 'ingest-benchmark-boundary'
+
+
+def load_server_app(data_dir: str, persons: int):
+    """スタブモデル設定でサーバアプリを読み込む"""
+    os.environ['DATA_DIR'] = data_dir
+    os.environ['DETECTION_MODEL'] = 'stub'
+    os.environ['STUB_PERSONS'] = str(persons)
+    Path('logs').mkdir(exist_ok=True)
+    sys.path.insert(0, str(SERVER_DIR))
+    import main
+    logging.getLogger().setLevel(logging.WARNING)
+    return main
+
+
+def make_jpeg(width: int, height: int, quality: int = 80) -> bytes:
+    """ノイズ入りのテスト画像（実写に近いサイズになるように）"""
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    image = cv2.GaussianBlur(image, (7, 7), 0)
+    _, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return encoded.tobytes()
+
+
+def build_multipart(jpeg: bytes, device_id: str) -> bytes:
+    head = (
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="device_id"\r\n\r\n{device_id}\r\n'
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="image.jpg"\r\n'
+        f'Content-Type: image/jpeg\r\n\r\n'
+    ).encode()
+    return head + jpeg + f'\r\n--{BOUNDARY}--\r\n'.encode()
+
+
+class IngestBenchmark:
+    def __init__(self, app, api_key: str, requests_per_case: int = 200, warmup: int = 20):
+        self.app = app
+        self.api_key = api_key
+        self.requests_per_case = requests_per_case
+        self.warmup = warmup
+
+    async def _run_case(self, client: httpx.AsyncClient, url: str, body: bytes, headers: dict) -> dict:
+        for _ in range(self.warmup):
+            response = await client.post(url, content=body, headers=headers)
+            response.raise_for_status()
+
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        for _ in range(self.requests_per_case):
+            response = await client.post(url, content=body, headers=headers)
+            response.raise_for_status()
+        cpu_ms = (time.process_time() - cpu_start) * 1000
+        wall_ms = (time.perf_counter() - wall_start) * 1000
+
+        return {
+            'requests': self.requests_per_case,
+            'cpu_ms_per_request': cpu_ms / self.requests_per_case,
+            'wall_ms_per_request': wall_ms / self.requests_per_case
+        }
+
+    def _decode_cost(self, jpeg: bytes) -> float:
+        """両経路共通のJPEGデコードのCPU時間（ms/枚）"""
+        cpu_start = time.process_time()
+        for _ in range(self.requests_per_case):
+            cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+        return (time.process_time() - cpu_start) * 1000 / self.requests_per_case
+
+    async def run(self, resolutions: list) -> dict:
+        auth = {'Authorization': f'Bearer {self.api_key}'}
+        results = {}
+
+        transport = httpx.ASGITransport(app=self.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+            for width, height in resolutions:
+                jpeg = make_jpeg(width, height)
+                multipart_headers = dict(auth, **{'Content-Type': f'multipart/form-data; boundary={BOUNDARY}'})
+                raw_headers = dict(auth, **{'Content-Type': 'image/jpeg', 'X-Device-Id': 'bench-device'})
+
+                multipart = await self._run_case(
+                    client, '/ingest', build_multipart(jpeg, 'bench-device'), multipart_headers
+                )
+                raw = await self._run_case(client, '/ingest/raw', jpeg, raw_headers)
+                decode_ms = self._decode_cost(jpeg)
+
+                results[f'{width}x{height}'] = {
+                    'jpeg_bytes': len(jpeg),
+                    'decode_cpu_ms': decode_ms,
+                    'multipart': multipart,
+                    'raw': raw,
+                    'cpu_saving_pct': (1 - raw['cpu_ms_per_request'] / multipart['cpu_ms_per_request']) * 100,
+                    # デコードを除いた受信・解析部分のみの比較
+                    'overhead_saving_pct': (
+                        1 - (raw['cpu_ms_per_request'] - decode_ms)
+                        / max(multipart['cpu_ms_per_request'] - decode_ms, 1e-9)
+                    ) * 100
+                }
+        return results
+
+
+def parse_resolution(value: str) -> tuple:
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ingest path benchmark (multipart vs raw body)')
+    parser.add_argument('--requests', type=int, default=200, help='Measured requests per case')
+    parser.add_argument('--warmup', type=int, default=20, help='Warmup requests per case')
+    parser.add_argument('--resolutions', nargs='+', type=parse_resolution,
+                        default=[(640, 360), (1280, 720), (1920, 1080)], help='Frame sizes, e.g. 640x360')
+    parser.add_argument('--persons', type=int, default=0,
+                        help='Persons returned by the stub model (0 skips image saving)')
+    parser.add_argument('--data-dir', help='Server data directory (default: temporary directory)')
+    parser.add_argument('--output', help='Output JSON file')
+
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='ingest-bench-')
+    server = load_server_app(data_dir, args.persons)
+    asyncio.run(server.detection_system.load_model())
+
+    benchmark = IngestBenchmark(
+        server.app, os.getenv('API_KEY', 'your_api_key_here'), args.requests, args.warmup
+    )
+    results = asyncio.run(benchmark.run(args.resolutions))
+
+    print("\n=== Ingest Path Benchmark (per request) ===")
+    print(f"{'size':>10} {'jpeg KB':>8} {'multipart CPU':>14} {'raw CPU':>9} {'decode':>8} "
+          f"{'saving':>7} {'excl. decode':>13}")
+    for size, result in results.items():
+        print(f"{size:>10} {result['jpeg_bytes'] / 1024:>8.1f} "
+              f"{result['multipart']['cpu_ms_per_request']:>12.2f}ms "
+              f"{result['raw']['cpu_ms_per_request']:>7.2f}ms "
+              f"{result['decode_cpu_ms']:>6.2f}ms "
+              f"{result['cpu_saving_pct']:>6.1f}% "
+              f"{result['overhead_saving_pct']:>12.1f}%")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+負荷生成ツール: 多数の仮想デバイスから /ingest へオープンループでフレームを送信し、
+スループット・レイテンシ分布・エラー率・破棄率とサーバ側の段階別処理時間をJSONレポートにまとめる。
+
+到着パターン:
+  - steady: 一定レートのポアソン到着
+  - bursty: burst_period 秒ごとに burst_seconds 秒間だけ burst_factor 倍のレート
+  - diurnal: 1日の変動を diurnal_period 秒に縮めた正弦波（rate × (1 ± amplitude)）
+
+オープンループなので応答を待たずに予定時刻で送信する。同時送信数が --max-inflight を超える場合は
+送信せずに「破棄（client_shed）」として数える。サーバが 429/503 を返した場合は server_shed。
+レポートはキーを整列して出力するので、リリース間で diff できる。
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import platform
+from pathlib import Path
+
+import httpx
+
+from ingest_benchmark import BOUNDARY, build_multipart, make_jpeg, load_server_app, parse_resolution
+
+SHED_STATUSES = (429, 503)
+
+
+def load_corpus(corpus_dir: str = None, resolutions: list = None) -> list:
+    """送信するJPEGの一覧（ディレクトリ指定がなければ合成画像）"""
+    if corpus_dir:
+        paths = sorted(p for p in Path(corpus_dir).iterdir() if p.suffix.lower() in ('.jpg', '.jpeg'))
+        if not paths:
+            raise FileNotFoundError(f"No JPEG files found in {corpus_dir}")
+        return [p.read_bytes() for p in paths]
+    return [make_jpeg(width, height) for width, height in resolutions]
+
+
+class ArrivalPattern:
+    """時刻 t（秒）における到着レート（フレーム/秒）"""
+
+    def __init__(self, kind: str, rate: float, burst_factor: float = 5.0, burst_seconds: float = 5.0,
+                 burst_period: float = 30.0, diurnal_period: float = 300.0, amplitude: float = 0.8):
+        self.kind = kind
+        self.rate = rate
+        self.burst_factor = burst_factor
+        self.burst_seconds = burst_seconds
+        self.burst_period = burst_period
+        self.diurnal_period = diurnal_period
+        self.amplitude = amplitude
+
+    def rate_at(self, t: float) -> float:
+        if self.kind == 'bursty':
+            return self.rate * (self.burst_factor if t % self.burst_period < self.burst_seconds else 1.0)
+        if self.kind == 'diurnal':
+            # 開始時を谷として1周期で1日分の変動
+            return self.rate * (1 - self.amplitude * math.cos(2 * math.pi * t / self.diurnal_period))
+        return self.rate
+
+    @property
+    def peak_rate(self) -> float:
+        if self.kind == 'bursty':
+            return self.rate * max(self.burst_factor, 1.0)
+        if self.kind == 'diurnal':
+            return self.rate * (1 + self.amplitude)
+        return self.rate
+
+    def schedule(self, duration: float, seed: int) -> list:
+        """到着時刻の列（非一様ポアソン過程を間引き法で生成、シード固定で再現可能）"""
+        rng = random.Random(seed)
+        arrivals = []
+        t = 0.0
+        peak = self.peak_rate
+        while peak > 0:
+            t += rng.expovariate(peak)
+            if t >= duration:
+                break
+            if rng.random() * peak <= self.rate_at(t):
+                arrivals.append(t)
+        return arrivals
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {}
+    ordered = sorted(values)
+    pick = lambda pct: ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+    return {
+        'p50_ms': pick(50), 'p90_ms': pick(90), 'p95_ms': pick(95), 'p99_ms': pick(99),
+        'max_ms': ordered[-1], 'mean_ms': sum(ordered) / len(ordered)
+    }
+
+
+class LoadGenerator:
+    def __init__(self, client: httpx.AsyncClient, api_key: str, corpus: list, devices: int,
+                 max_inflight: int, seed: int = 0):
+        self.client = client
+        self.api_key = api_key
+        self.devices = [f'load-{i:04d}' for i in range(devices)]
+        self.bodies = corpus
+        self.max_inflight = max_inflight
+        self.rng = random.Random(seed)
+        self.inflight = 0
+        self.results = []  # (予定時刻, 状態, レイテンシms)
+        self.status_counts = {}
+
+    async def _send(self, scheduled_at: float, device_id: str, jpeg: bytes):
+        headers = {
+            'Authorization': f'Bearer {self.api_key}',
+            'Content-Type': f'multipart/form-data; boundary={BOUNDARY}'
+        }
+        self.inflight += 1
+        send_start = time.perf_counter()
+        try:
+            response = await self.client.post('/ingest', content=build_multipart(jpeg, device_id), headers=headers)
+            status = response.status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        finally:
+            self.inflight -= 1
+        latency_ms = (time.perf_counter() - send_start) * 1000
+        self.status_counts[str(status)] = self.status_counts.get(str(status), 0) + 1
+        if status == 200:
+            outcome = 'ok'
+        elif status in SHED_STATUSES:
+            outcome = 'server_shed'
+        else:
+            outcome = 'error'
+        self.results.append((scheduled_at, outcome, latency_ms))
+
+    async def run(self, arrivals: list) -> float:
+        """予定時刻どおりに送信（応答を待たない）。実際の所要時間を返す"""
+        tasks = []
+        start = time.monotonic()
+        for i, offset in enumerate(arrivals):
+            delay = start + offset - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if self.inflight >= self.max_inflight:
+                self.results.append((offset, 'client_shed', None))
+                continue
+            device_id = self.rng.choice(self.devices)
+            tasks.append(asyncio.create_task(self._send(offset, device_id, self.bodies[i % len(self.bodies)])))
+        await asyncio.gather(*tasks)
+        return time.monotonic() - start
+
+    def report(self, duration: float, elapsed: float) -> dict:
+        offered = len(self.results)
+        ok_latencies = [latency for _, outcome, latency in self.results if outcome == 'ok']
+        counts = {'ok': 0, 'error': 0, 'server_shed': 0, 'client_shed': 0}
+        for _, outcome, _ in self.results:
+            counts[outcome] += 1
+
+        # 1秒ごとの推移
+        timeline = {}
+        for scheduled_at, outcome, latency in self.results:
+            bucket = timeline.setdefault(int(scheduled_at), {'offered': 0, 'ok': 0, 'latencies': []})
+            bucket['offered'] += 1
+            if outcome == 'ok':
+                bucket['ok'] += 1
+                bucket['latencies'].append(latency)
+        seconds = [
+            {
+                'second': second,
+                'offered': bucket['offered'],
+                'ok': bucket['ok'],
+                'p95_ms': percentiles(bucket['latencies']).get('p95_ms')
+            }
+            for second, bucket in sorted(timeline.items())
+        ]
+
+        return {
+            'offered': offered,
+            'offered_rate_fps': offered / duration,
+            'throughput_fps': counts['ok'] / elapsed if elapsed else 0.0,
+            'outcomes': counts,
+            'error_rate': counts['error'] / offered if offered else 0.0,
+            'shed_rate': (counts['server_shed'] + counts['client_shed']) / offered if offered else 0.0,
+            'status_counts': self.status_counts,
+            'latency': percentiles(ok_latencies),
+            'timeline': seconds
+        }
+
+
+async def run_load(args, base_url: str, transport=None) -> dict:
+    corpus = load_corpus(args.corpus, args.resolutions)
+    pattern = ArrivalPattern(args.pattern, args.rate, args.burst_factor, args.burst_seconds,
+                             args.burst_period, args.diurnal_period, args.amplitude)
+    arrivals = pattern.schedule(args.duration, args.seed)
+    api_key = args.api_key
+    auth = {'Authorization': f'Bearer {api_key}'}
+
+    limits = httpx.Limits(max_connections=args.max_inflight, max_keepalive_connections=args.max_inflight)
+    async with httpx.AsyncClient(base_url=base_url, transport=transport, timeout=args.timeout, limits=limits) as client:
+        # サーバ側の段階別統計をリセットしてから開始
+        stages_available = (await client.get('/stats/stages', params={'reset': 'true'}, headers=auth)).status_code == 200
+
+        generator = LoadGenerator(client, api_key, corpus, args.devices, args.max_inflight, args.seed)
+        elapsed = await generator.run(arrivals)
+
+        server_stages = None
+        if stages_available:
+            server_stages = (await client.get('/stats/stages', headers=auth)).json()
+
+    return {
+        'config': {
+            'pattern': args.pattern,
+            'rate_fps': args.rate,
+            'duration_s': args.duration,
+            'devices': args.devices,
+            'max_inflight': args.max_inflight,
+            'seed': args.seed,
+            'corpus_frames': len(corpus),
+            'corpus_bytes_mean': sum(len(body) for body in corpus) / len(corpus),
+            'target': 'in-process' if transport is not None else base_url
+        },
+        'environment': {'python': platform.python_version(), 'platform': platform.platform()},
+        'client': generator.report(args.duration, elapsed),
+        'server_stages': server_stages
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Open-loop multi-device load generator for /ingest')
+    parser.add_argument('--server-url', default='http://localhost:8000', help='Server URL')
+    parser.add_argument('--api-key', default=os.getenv('API_KEY', 'your_api_key_here'), help='API Key')
+    parser.add_argument('--in-process', action='store_true',
+                        help='Run the server in-process with the stub model (no GPU/YOLO needed)')
+    parser.add_argument('--stub-latency-ms', type=float, default=20.0, help='Stub inference time (--in-process)')
+    parser.add_argument('--devices', type=int, default=200, help='Virtual devices')
+    parser.add_argument('--rate', type=float, default=20.0, help='Mean offered frames per second (all devices)')
+    parser.add_argument('--duration', type=float, default=60.0, help='Test duration (seconds)')
+    parser.add_argument('--pattern', choices=['steady', 'bursty', 'diurnal'], default='steady', help='Arrival pattern')
+    parser.add_argument('--burst-factor', type=float, default=5.0, help='Rate multiplier during bursts')
+    parser.add_argument('--burst-seconds', type=float, default=5.0, help='Burst length (seconds)')
+    parser.add_argument('--burst-period', type=float, default=30.0, help='Burst period (seconds)')
+    parser.add_argument('--diurnal-period', type=float, default=300.0, help='Length of one simulated day (seconds)')
+    parser.add_argument('--amplitude', type=float, default=0.8, help='Diurnal rate swing (0-1)')
+    parser.add_argument('--max-inflight', type=int, default=256, help='Concurrent requests before shedding')
+    parser.add_argument('--timeout', type=float, default=30.0, help='Request timeout (seconds)')
+    parser.add_argument('--corpus', help='Directory of JPEG frames to send (default: synthetic frames)')
+    parser.add_argument('--resolutions', nargs='+', type=parse_resolution, default=[(640, 360)],
+                        help='Synthetic frame sizes, e.g. 640x360 1280x720')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for arrivals and device choice')
+    parser.add_argument('--output', help='Output JSON report')
+
+    args = parser.parse_args()
+
+    transport = None
+    if args.in_process:
+        os.environ['STUB_LATENCY_MS'] = str(args.stub_latency_ms)
+        server = load_server_app(tempfile.mkdtemp(prefix='load-generator-'), persons=0)
+        asyncio.run(server.detection_system.load_model())
+        transport = httpx.ASGITransport(app=server.app)
+
+    report = asyncio.run(run_load(args, 'http://load' if args.in_process else args.server_url, transport))
+
+    client = report['client']
+    latency = client['latency']
+    print(f"\n=== Load Test ({args.pattern}, {args.rate:.1f} fps offered, {args.devices} devices, {args.duration:.0f}s) ===")
+    print(f"Throughput: {client['throughput_fps']:.1f} fps  offered: {client['offered']}  outcomes: {client['outcomes']}")
+    print(f"Error rate: {client['error_rate'] * 100:.2f}%  shed rate: {client['shed_rate'] * 100:.2f}%")
+    if latency:
+        print(f"Latency: p50={latency['p50_ms']:.1f}ms p95={latency['p95_ms']:.1f}ms "
+              f"p99={latency['p99_ms']:.1f}ms max={latency['max_ms']:.1f}ms")
+    if report['server_stages']:
+        print("Server stages (mean / p95):")
+        for stage, stats in report['server_stages']['stages'].items():
+            print(f"  {stage:>15}: {stats['mean_ms']:8.2f}ms / {stats['p95_ms']:8.2f}ms")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+        print(f"Report saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
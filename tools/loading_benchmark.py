@@ -0,0 +1,96 @@
+"""
+ログ読み込みの比較: 型指定なしの pd.read_csv（従来の読み込み）と、スキーマによる型付き読み込み・
+列の限定（usecols）・pyarrow エンジンの処理時間とメモリ使用量を比べる。
+
+合成ログ（既定300万行）を作成して計測する。--data-dir で既存のログも計測できる。
+メモリは DataFrame のサイズ（memory_usage(deep=True)）と読み込み中のピーク（tracemalloc）を記録する。
+"""
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+import pandas as pd
+
+import log_schema
+from microbench import write_synthetic_logs
+from performance_analyzer import PerformanceAnalyzer
+
+
+def load_untyped(path: Path) -> pd.DataFrame:
+    df = pd.read_csv(path)
+    df['timestamp'] = pd.to_datetime(df['timestamp'], format='ISO8601')
+    return df
+
+
+def load_typed(path: Path, schema: log_schema.LogSchema, columns: list = None, engine: str = 'c') -> pd.DataFrame:
+    with open(path, 'rb') as f:
+        return schema.read(f, columns, engine=engine)
+
+
+def measure(loader) -> dict:
+    start = time.perf_counter()
+    df = loader()
+    elapsed = time.perf_counter() - start
+    frame_bytes = int(df.memory_usage(deep=True).sum())
+    rows = len(df)
+    del df
+
+    # ピークメモリは計測のオーバーヘッドがあるため時間とは別に計測
+    tracemalloc.start()
+    df = loader()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del df
+    return {'seconds': elapsed, 'frame_mb': frame_bytes / 1048576, 'peak_mb': peak / 1048576, 'rows': rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare untyped and typed log loading (time and memory)')
+    parser.add_argument('--rows', type=int, default=3000000, help='Rows in the generated logs')
+    parser.add_argument('--devices', type=int, default=500, help='Devices in the generated logs')
+    parser.add_argument('--data-dir', help='Measure existing logs instead of generating them')
+    parser.add_argument('--output', help='Output JSON file')
+
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='loading-') as work_dir:
+        data_dir = Path(args.data_dir) if args.data_dir else Path(work_dir)
+        if not args.data_dir:
+            print(f"Generating {args.rows} rows...", flush=True)
+            write_synthetic_logs(data_dir, args.rows, args.devices)
+
+        events, metrics = data_dir / 'events.csv', data_dir / 'performance_metrics.csv'
+        cases = {
+            'events_untyped': lambda: load_untyped(events),
+            'events_typed': lambda: load_typed(events, log_schema.EVENTS),
+            'events_typed_detection_columns': lambda: load_typed(
+                events, log_schema.EVENTS, PerformanceAnalyzer.DETECTION_COLUMNS),
+            'metrics_untyped': lambda: load_untyped(metrics),
+            'metrics_typed': lambda: load_typed(metrics, log_schema.METRICS),
+            'metrics_typed_communication_columns': lambda: load_typed(
+                metrics, log_schema.METRICS, PerformanceAnalyzer.COMMUNICATION_COLUMNS)
+        }
+        if log_schema.pyarrow_available():
+            cases['events_typed_pyarrow'] = lambda: load_typed(events, log_schema.EVENTS, engine='pyarrow')
+            cases['metrics_typed_pyarrow'] = lambda: load_typed(metrics, log_schema.METRICS, engine='pyarrow')
+        else:
+            print("pyarrow not available, skipping the pyarrow engine")
+
+        results = {}
+        print(f"\n{'case':<38} {'rows':>10} {'time':>9} {'frame':>10} {'peak':>10}")
+        for name, loader in cases.items():
+            result = results[name] = measure(loader)
+            print(f"{name:<38} {result['rows']:>10} {result['seconds']:>8.2f}s "
+                  f"{result['frame_mb']:>8.1f}MB {result['peak_mb']:>8.1f}MB", flush=True)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'rows': args.rows, 'devices': args.devices, 'results': results}, f, indent=2)
+        print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""
+ログ分析用のマージ可能な集計（件数・合計・平均・標準偏差・最小/最大・分位点スケッチ）。
+
+CSVをチャンク単位で読みながら集計するため、メモリ使用量はログの行数ではなく
+グループ数（デバイス数・時間帯の数）とスケッチのバケット数だけで決まる。
+集計状態は to_state() / from_state() でJSONに変換でき、同じ種類の集計どうしは merge() で結合できる。
+"""
+import math
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+MOMENT_FIELDS = ('count', 'sum', 'm2', 'min', 'max')
+
+
+class GroupedMoments:
+    """グループ（デバイス・時間帯など）ごと・列ごとの件数・合計・偏差平方和・最小・最大
+
+    平均と標準偏差は Chan らの並列アルゴリズムでチャンク間を結合するため、
+    全件を一度に集計した場合と数値誤差の範囲で一致する。
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.integral = {column: True for column in self.columns}
+        self._stats = {column: self._empty() for column in self.columns}
+
+    @staticmethod
+    def _empty(index=None) -> pd.DataFrame:
+        return pd.DataFrame({field: pd.Series(dtype='float64') for field in MOMENT_FIELDS}, index=index)
+
+    @staticmethod
+    def _combine(a: pd.DataFrame, b: pd.DataFrame) -> pd.DataFrame:
+        index = a.index.union(b.index)
+        a, b = a.reindex(index), b.reindex(index)
+        na, nb = a['count'].fillna(0), b['count'].fillna(0)
+        sa, sb = a['sum'].fillna(0), b['sum'].fillna(0)
+        n = na + nb
+        with np.errstate(divide='ignore', invalid='ignore'):
+            delta = sb / nb - sa / na
+            cross = (delta ** 2 * na * nb / n).where((na > 0) & (nb > 0), 0.0)
+        return pd.DataFrame({
+            'count': n,
+            'sum': sa + sb,
+            'm2': a['m2'].fillna(0) + b['m2'].fillna(0) + cross,
+            'min': np.fmin(a['min'], b['min']),
+            'max': np.fmax(a['max'], b['max'])
+        }, index=index)
+
+    def update(self, chunk: pd.DataFrame, keys):
+        """chunk の各列を keys（列名または行ごとのグループ値）でグループ化して加算"""
+        if isinstance(keys, str):
+            keys = chunk[keys]
+        if isinstance(getattr(keys, 'dtype', None), pd.CategoricalDtype):
+            # カテゴリはチャンクごとに異なるため値で集計する
+            keys = keys.astype(str)
+        for column in self.columns:
+            values = chunk[column]
+            if not (pd.api.types.is_integer_dtype(values) or pd.api.types.is_bool_dtype(values)):
+                self.integral[column] = False
+            values = values.astype('float64')
+            grouped = values.groupby(keys, sort=False)
+            count = grouped.count()
+            total = grouped.sum()
+            partial = pd.DataFrame({
+                'count': count.astype('float64'),
+                'sum': total,
+                'm2': grouped.var(ddof=0).fillna(0) * count,
+                'min': grouped.min(),
+                'max': grouped.max()
+            })
+            self._stats[column] = self._combine(self._stats[column], partial)
+
+    def merge(self, other: 'GroupedMoments'):
+        for column in self.columns:
+            self.integral[column] = self.integral[column] and other.integral[column]
+            self._stats[column] = self._combine(self._stats[column], other._stats[column])
+
+    @property
+    def groups(self) -> pd.Index:
+        index = pd.Index([])
+        for stats in self._stats.values():
+            index = index.union(stats.index)
+        return index
+
+    def stat(self, column: str, name: str) -> pd.Series:
+        """グループごとの count / sum / mean / std（不偏）/ min / max"""
+        stats = self._stats[column]
+        if name == 'count':
+            return stats['count'].astype('int64')
+        if name == 'sum':
+            return stats['sum'].round().astype('int64') if self.integral[column] else stats['sum']
+        if name == 'mean':
+            return stats['sum'] / stats['count']
+        if name == 'std':
+            return np.sqrt(stats['m2'] / (stats['count'] - 1)).where(stats['count'] > 1)
+        return stats[name]
+
+    def to_state(self) -> dict:
+        return {
+            'columns': self.columns,
+            'integral': self.integral,
+            'stats': {
+                column: {'index': stats.index.tolist(),
+                         **{field: [None if pd.isna(v) else float(v) for v in stats[field]] for field in MOMENT_FIELDS}}
+                for column, stats in self._stats.items()
+            }
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> 'GroupedMoments':
+        moments = cls(state['columns'])
+        moments.integral = dict(state['integral'])
+        for column, stats in state['stats'].items():
+            moments._stats[column] = pd.DataFrame(
+                {field: pd.Series(stats[field], dtype='float64') for field in MOMENT_FIELDS}
+            ).set_axis(pd.Index(stats['index']))
+        return moments
+
+
+class QuantileSketch:
+    """相対誤差 relative_accuracy 以内で分位点を返す対数バケットのヒストグラム（DDSketch方式）
+
+    バケット数は値の範囲の対数にしか比例しないため、件数によらずメモリは一定。
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = Counter()
+        self.zero_count = 0
+        self.count = 0
+
+    def update(self, values):
+        values = np.asarray(values, dtype='float64')
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return
+        positive = values[values > 0]
+        self.zero_count += int(values.size - positive.size)
+        self.count += int(values.size)
+        if positive.size:
+            indexes, counts = np.unique(np.ceil(np.log(positive) / self._log_gamma).astype('int64'),
+                                        return_counts=True)
+            self.buckets.update(dict(zip(indexes.tolist(), counts.tolist())))
+
+    def merge(self, other: 'QuantileSketch'):
+        self.buckets.update(other.buckets)
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def quantile(self, q: float) -> float:
+        if self.count == 0:
+            return float('nan')
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        seen = self.zero_count
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    def to_state(self) -> dict:
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'buckets': {str(index): count for index, count in self.buckets.items()},
+            'zero_count': self.zero_count,
+            'count': self.count
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> 'QuantileSketch':
+        sketch = cls(state['relative_accuracy'])
+        sketch.buckets = Counter({int(index): count for index, count in state['buckets'].items()})
+        sketch.zero_count = state['zero_count']
+        sketch.count = state['count']
+        return sketch
+
+
+class DetectionAggregate:
+    """events.csv の集計（PerformanceAnalyzer.analyze_detection_performance と同じ結果を返す）"""
+
+    def __init__(self):
+        self.total_events = 0
+        self.anomaly_events = 0
+        self.by_device = GroupedMoments(['person_count', 'anomaly_flag', 'processing_time_ms'])
+        self.by_hour = GroupedMoments(['person_count', 'anomaly_flag'])
+
+    def update(self, chunk: pd.DataFrame):
+        if chunk.empty:
+            return
+        self.total_events += len(chunk)
+        self.anomaly_events += int((chunk['anomaly_flag'] == True).sum())
+        self.by_device.update(chunk, 'device_id')
+        self.by_hour.update(chunk, chunk['timestamp'].dt.hour)
+
+    def merge(self, other: 'DetectionAggregate'):
+        self.total_events += other.total_events
+        self.anomaly_events += other.anomaly_events
+        self.by_device.merge(other.by_device)
+        self.by_hour.merge(other.by_hour)
+
+    def to_report(self) -> dict:
+        if self.total_events == 0:
+            return {"error": "No event data found"}
+
+        device = self.by_device
+        device_stats = pd.DataFrame({
+            ('person_count', 'count'): device.stat('person_count', 'count'),
+            ('person_count', 'sum'): device.stat('person_count', 'sum'),
+            ('person_count', 'mean'): device.stat('person_count', 'mean'),
+            ('anomaly_flag', 'sum'): device.stat('anomaly_flag', 'sum'),
+            ('processing_time_ms', 'mean'): device.stat('processing_time_ms', 'mean')
+        }).sort_index().round(2)
+        hourly_stats = pd.DataFrame({
+            'person_count': self.by_hour.stat('person_count', 'sum'),
+            'anomaly_flag': self.by_hour.stat('anomaly_flag', 'sum')
+        }).sort_index()
+
+        return {
+            "total_events": self.total_events,
+            "anomaly_events": self.anomaly_events,
+            "anomaly_rate": self.anomaly_events / self.total_events,
+            "device_statistics": device_stats.to_dict(),
+            "hourly_statistics": hourly_stats.to_dict()
+        }
+
+    def to_state(self) -> dict:
+        return {
+            'total_events': self.total_events,
+            'anomaly_events': self.anomaly_events,
+            'by_device': self.by_device.to_state(),
+            'by_hour': self.by_hour.to_state()
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> 'DetectionAggregate':
+        aggregate = cls()
+        aggregate.total_events = state['total_events']
+        aggregate.anomaly_events = state['anomaly_events']
+        aggregate.by_device = GroupedMoments.from_state(state['by_device'])
+        aggregate.by_hour = GroupedMoments.from_state(state['by_hour'])
+        return aggregate
+
+
+class CommunicationAggregate:
+    """performance_metrics.csv の集計（analyze_communication_performance と同じ結果を返す）
+
+    p95/p99 は QuantileSketch による近似値（相対誤差 relative_accuracy 以内）。
+    """
+
+    COLUMNS = ['total_response_time_ms', 'inference_time_ms', 'request_size_bytes']
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.overall = GroupedMoments(self.COLUMNS)
+        self.by_device = GroupedMoments(self.COLUMNS)
+        self.response_sketch = QuantileSketch(relative_accuracy)
+
+    def update(self, chunk: pd.DataFrame):
+        if chunk.empty:
+            return
+        self.overall.update(chunk, np.zeros(len(chunk), dtype='int64'))
+        self.by_device.update(chunk, 'device_id')
+        self.response_sketch.update(chunk['total_response_time_ms'].to_numpy())
+
+    def merge(self, other: 'CommunicationAggregate'):
+        self.overall.merge(other.overall)
+        self.by_device.merge(other.by_device)
+        self.response_sketch.merge(other.response_sketch)
+
+    @property
+    def total_requests(self) -> int:
+        return self.response_sketch.count
+
+    def to_report(self) -> dict:
+        if self.overall.groups.empty:
+            return {"error": "No performance data found"}
+
+        mean = lambda column: float(self.overall.stat(column, 'mean').iloc[0])
+        overall_stats = {
+            "total_requests": int(self.overall.stat('total_response_time_ms', 'count').iloc[0]),
+            "avg_response_time_ms": mean('total_response_time_ms'),
+            "avg_inference_time_ms": mean('inference_time_ms'),
+            "avg_request_size_kb": mean('request_size_bytes') / 1024,
+            "p95_response_time_ms": self.response_sketch.quantile(0.95),
+            "p99_response_time_ms": self.response_sketch.quantile(0.99)
+        }
+
+        device = self.by_device
+        device_perf = pd.DataFrame({
+            ('total_response_time_ms', 'mean'): device.stat('total_response_time_ms', 'mean'),
+            ('total_response_time_ms', 'std'): device.stat('total_response_time_ms', 'std'),
+            ('total_response_time_ms', 'min'): device.stat('total_response_time_ms', 'min'),
+            ('total_response_time_ms', 'max'): device.stat('total_response_time_ms', 'max'),
+            ('inference_time_ms', 'mean'): device.stat('inference_time_ms', 'mean'),
+            ('inference_time_ms', 'std'): device.stat('inference_time_ms', 'std'),
+            ('request_size_bytes', 'mean'): device.stat('request_size_bytes', 'mean'),
+            ('request_size_bytes', 'std'): device.stat('request_size_bytes', 'std')
+        }).sort_index().round(2)
+
+        return {
+            "overall_statistics": overall_stats,
+            "device_performance": device_perf.to_dict()
+        }
+
+    def to_state(self) -> dict:
+        return {
+            'overall': self.overall.to_state(),
+            'by_device': self.by_device.to_state(),
+            'response_sketch': self.response_sketch.to_state()
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> 'CommunicationAggregate':
+        aggregate = cls(state['response_sketch']['relative_accuracy'])
+        aggregate.overall = GroupedMoments.from_state(state['overall'])
+        aggregate.by_device = GroupedMoments.from_state(state['by_device'])
+        aggregate.response_sketch = QuantileSketch.from_state(state['response_sketch'])
+        return aggregate
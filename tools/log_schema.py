@@ -0,0 +1,138 @@
+"""
+サーバが出力するログCSV（events.csv / performance_metrics.csv）のスキーマと型付き読み込み。
+
+- device_id はカテゴリ型、数値は必要な精度まで縮小（int16 / int32 / float32）、anomaly_flag は bool
+- usecols で分析に必要な列だけを読み込む
+- pyarrow がインストールされていれば pyarrow のCSVエンジンを使える（engine='pyarrow'、チャンク読み込みは不可）
+
+サーバは confidence_scores のJSONを引用符で囲まずに書き込むため、人物を検出した行は
+列数が多くなる。読み込み時にこの列を引用符で囲み直してから解析する。
+"""
+import pandas as pd
+
+ENGINES = ('c', 'pyarrow')
+
+
+def pyarrow_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class _RepairingReader:
+    """引用符のない自由記述の列（JSON）を含む行を、正しいCSVの行に直しながら読ませる"""
+
+    def __init__(self, stream, field_count: int, free_index: int, block_size: int = 1 << 20):
+        self.stream = stream
+        self.separators = field_count - 1
+        self.free_index = free_index
+        self.after_free = field_count - free_index - 1
+        self.block_size = block_size
+        self._pending = b''
+        self._buffer = b''
+        self._eof = False
+
+    def _repair(self, line: bytes) -> bytes:
+        if line.count(b',') <= self.separators:
+            return line
+        head = line.split(b',', self.free_index)
+        rest = head.pop().rsplit(b',', self.after_free)
+        free = rest[0]
+        if free.startswith(b'"') and free.endswith(b'"'):
+            return line
+        quoted = b'"' + free.replace(b'"', b'""') + b'"'
+        return b','.join(head + [quoted] + rest[1:])
+
+    def _fill(self, size: int):
+        while not self._eof and len(self._buffer) < size:
+            block = self.stream.read(self.block_size)
+            if not block:
+                self._eof = True
+                lines = [self._pending] if self._pending else []
+                self._pending = b''
+            else:
+                data = self._pending + block
+                end = data.rfind(b'\n') + 1
+                complete, self._pending = data[:end], data[end:]
+                # 列数の多い行がなければ行ごとの処理を省く
+                if complete.count(b',') == complete.count(b'\n') * self.separators:
+                    self._buffer += complete
+                    continue
+                lines = [line + b'\n' for line in complete.split(b'\n')[:-1]]
+            self._buffer += b''.join([self._repair(line) for line in lines])
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            self._fill(float('inf'))
+            size = len(self._buffer)
+        else:
+            self._fill(size)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+class LogSchema:
+    """ログCSVの列と型"""
+
+    def __init__(self, dtypes: dict, free_column: str = None):
+        self.dtypes = dtypes
+        self.free_column = free_column
+
+    @property
+    def columns(self) -> list:
+        return list(self.dtypes)
+
+    def read(self, stream, columns: list = None, chunksize: int = None, names: list = None, engine: str = 'c'):
+        """バイナリのストリームから型付きで読み込む（chunksize 指定時はチャンクのイテレータ）
+
+        names を渡すとストリームにヘッダー行がないものとして扱う。
+        """
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown CSV engine: {engine}")
+        if engine == 'pyarrow' and chunksize:
+            raise ValueError("The pyarrow engine does not support chunked reading")
+        has_header = names is None
+        names = names or self.columns
+        columns = [column for column in (columns or names) if column in names]
+        if self.free_column and self.free_column in names:
+            stream = _RepairingReader(stream, len(names), names.index(self.free_column))
+
+        options = {
+            'usecols': columns,
+            'dtype': {column: self.dtypes[column] for column in columns if column in self.dtypes},
+            'engine': engine
+        }
+        if not has_header:
+            options.update(names=names, header=None)
+        if chunksize:
+            return (self._finish(chunk) for chunk in pd.read_csv(stream, chunksize=chunksize, **options))
+        return self._finish(pd.read_csv(stream, **options))
+
+    @staticmethod
+    def _finish(df: pd.DataFrame) -> pd.DataFrame:
+        if 'timestamp' in df.columns:
+            df['timestamp'] = pd.to_datetime(df['timestamp'], format='ISO8601')
+        return df
+
+
+EVENTS = LogSchema({
+    'event_id': 'str',
+    'device_id': 'category',
+    'timestamp': 'object',  # 読み込み後に datetime64 へ変換
+    'person_count': 'int16',
+    'anomaly_flag': 'bool',
+    'confidence_scores': 'str',
+    'processing_time_ms': 'float32',
+    'image_filename': 'str'
+}, free_column='confidence_scores')
+
+METRICS = LogSchema({
+    'timestamp': 'object',  # 読み込み後に datetime64 へ変換
+    'device_id': 'category',
+    'request_size_bytes': 'int32',
+    'processing_time_ms': 'float32',
+    'inference_time_ms': 'float32',
+    'total_response_time_ms': 'float32'
+})
@@ -0,0 +1,314 @@
+"""
+コンポーネント単位のマイクロベンチマーク: 受信処理・ログ書き込み・ログ検索・分析ツールの
+ホットパスを個別に計測し、ベースラインとの比較で性能の劣化を検出する。
+
+推論はスタブモデルで代替するため、YOLO・GPUなしで実行できる。
+ベースラインは実行環境ごとに保存する（--save-baseline）。--compare で比較し、
+最小値が threshold を超えて遅く、かつベースラインの最大値も上回った（ばらつきの範囲外の）
+ベンチマークがあれば終了コード1で終了する。共有VMなどで実行環境そのものの速度が変わる分は、
+各グループの前に計測する固定の基準処理（calibration）の比で補正する。
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+from ingest_benchmark import make_jpeg, load_server_app
+
+
+def write_synthetic_logs(data_dir: Path, rows: int, devices: int = 50, seed: int = 0):
+    """分析・検索用の合成ログ（events.csv / performance_metrics.csv）を作成"""
+    rng = np.random.default_rng(seed)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    start = datetime(2025, 1, 1)
+    device_ids = rng.integers(0, devices, rows)
+    person_counts = rng.choice([0, 0, 0, 1], rows)
+    offsets = np.sort(rng.integers(0, 30 * 86400, rows))
+    processing = rng.gamma(4.0, 12.0, rows)
+    sizes = rng.integers(20000, 120000, rows)
+
+    with open(data_dir / 'events.csv', 'w', encoding='utf-8') as f:
+        f.write('event_id,device_id,timestamp,person_count,anomaly_flag,confidence_scores,'
+                'processing_time_ms,image_filename\n')
+        for i in range(rows):
+            persons = int(person_counts[i])
+            timestamp = (start + timedelta(seconds=int(offsets[i]))).isoformat()
+            f.write(f"evt-{i:08d},device-{device_ids[i]:03d},{timestamp},{persons},{persons > 0 and i % 7 == 0},"
+                    f"{'[0.87]' if persons else '[]'},{processing[i]:.3f},\n")
+
+    with open(data_dir / 'performance_metrics.csv', 'w', encoding='utf-8') as f:
+        f.write('timestamp,device_id,request_size_bytes,processing_time_ms,inference_time_ms,total_response_time_ms\n')
+        for i in range(rows):
+            timestamp = (start + timedelta(seconds=int(offsets[i]))).isoformat()
+            f.write(f"{timestamp},device-{device_ids[i]:03d},{sizes[i]},{processing[i]:.3f},"
+                    f"{processing[i] * 0.6:.3f},{processing[i] * 1.1:.3f}\n")
+
+
+def summarize(times: list, number: int) -> dict:
+    per_op = [t / number for t in times]
+    median = statistics.median(per_op)
+    return {
+        'median_us': median * 1e6,
+        'min_us': min(per_op) * 1e6,
+        'max_us': max(per_op) * 1e6,
+        'ops_per_sec': 1 / median if median > 0 else float('inf'),
+        'number': number,
+        'repeat': len(times)
+    }
+
+
+def measure(fn, number: int, repeat: int) -> dict:
+    fn()  # ウォームアップ（初回のみのキャッシュ・遅延初期化を計測に含めない）
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append(time.perf_counter() - start)
+    return summarize(times, number)
+
+
+def measure_async(loop: asyncio.AbstractEventLoop, coro_fn, number: int, repeat: int) -> dict:
+    async def batch():
+        start = time.perf_counter()
+        for _ in range(number):
+            await coro_fn()
+        return time.perf_counter() - start
+
+    loop.run_until_complete(coro_fn())  # ウォームアップ
+    return summarize([loop.run_until_complete(batch()) for _ in range(repeat)], number)
+
+
+def calibrate() -> float:
+    """実行環境の速度の基準: 固定の純Python処理1回あたりの最小時間（us）"""
+    return measure(lambda: sum(i * i for i in range(2000)), 50, 5)['min_us']
+
+
+def rescale(result: dict, calibration_us: float) -> dict:
+    """計測値を、基準処理が calibration_us だった実行環境の速度に換算"""
+    if not calibration_us or not result.get('calibration_us'):
+        return result
+    factor = calibration_us / result['calibration_us']
+    return dict(result, calibration_us=calibration_us,
+                **{key: result[key] * factor for key in ('median_us', 'min_us', 'max_us') if key in result})
+
+
+class MicroBenchmarks:
+    def __init__(self, work_dir: Path, log_rows: int, scale: float = 1.0):
+        self.work_dir = work_dir
+        self.log_rows = log_rows
+        self.scale = scale
+        self.loop = asyncio.new_event_loop()
+        self.groups = {}  # ベンチマーク名 -> グループ名（再計測用）
+
+        self.server = load_server_app(str(work_dir / 'server-data'), persons=2)
+        self.loop.run_until_complete(self.server.detection_system.load_model())
+        self.logs_dir = work_dir / 'logs-data'
+        write_synthetic_logs(self.logs_dir, log_rows)
+
+        from performance_analyzer import PerformanceAnalyzer
+        self.analyzer = PerformanceAnalyzer(str(self.logs_dir))
+
+    def _n(self, number: int) -> int:
+        return max(1, int(number * self.scale))
+
+    def bench_decode(self) -> dict:
+        results = {}
+        for width, height in [(640, 360), (1280, 720)]:
+            jpeg = make_jpeg(width, height)
+            results[f'decode_jpeg_{width}x{height}'] = measure(
+                lambda: self.server.decode_image(jpeg), self._n(50), 7
+            )
+        return results
+
+    def bench_detect(self) -> dict:
+        image = self.server.decode_image(make_jpeg(640, 360))
+        detection_system = self.server.detection_system
+        return {'detect_persons_stub': measure(lambda: detection_system.detect_persons(image), self._n(200), 7)}
+
+    def bench_append(self) -> dict:
+        detection_system = self.server.detection_system
+        event = {
+            'event_id': 'bench', 'device_id': 'bench-device', 'timestamp': datetime.now().isoformat(),
+            'person_count': 1, 'anomaly_flag': False, 'confidence_scores': '[0.9]',
+            'processing_time_ms': 12.5, 'image_filename': ''
+        }
+        metrics = {
+            'timestamp': datetime.now().isoformat(), 'device_id': 'bench-device', 'request_size_bytes': 50000,
+            'processing_time_ms': 20.0, 'inference_time_ms': 12.5, 'total_response_time_ms': 20.0
+        }
+        return {
+            'save_event_append': measure_async(
+                self.loop, lambda: detection_system.save_event(event), self._n(200), 5
+            ),
+            'save_metrics_append': measure_async(
+                self.loop, lambda: detection_system.save_performance_metrics(metrics), self._n(200), 5
+            )
+        }
+
+    def bench_events_query(self) -> dict:
+        detection_system = self.server.detection_system
+        original = detection_system.events_csv
+        detection_system.events_csv = self.logs_dir / 'events.csv'
+        try:
+            return {
+                'events_query_limit100': measure_async(
+                    self.loop, lambda: self.server.get_events(None, 100), self._n(50), 5
+                ),
+                # 該当しないデバイスで全件走査
+                'events_query_device_scan': measure_async(
+                    self.loop, lambda: self.server.get_events('missing-device', 100), 1, 5
+                )
+            }
+        finally:
+            detection_system.events_csv = original
+
+    def bench_analyzer(self) -> dict:
+        analyzer = self.analyzer
+        return {
+            'analyzer_load_events': measure(analyzer.load_events, 1, 5),
+            'analyzer_load_metrics': measure(analyzer.load_performance_metrics, 1, 5),
+            'analyzer_detection_aggregate': measure(analyzer.analyze_detection_performance, 1, 5),
+            'analyzer_communication_aggregate': measure(analyzer.analyze_communication_performance, 1, 5)
+        }
+
+    def run(self, name_filter: str = None) -> dict:
+        results = {}
+        for bench in (self.bench_decode, self.bench_detect, self.bench_append,
+                      self.bench_events_query, self.bench_analyzer):
+            group = bench.__name__[len('bench_'):]
+            if name_filter and name_filter not in group:
+                continue
+            print(f"Running {group}...", flush=True)
+            calibration_us = calibrate()
+            group_results = {name: dict(result, calibration_us=calibration_us) for name, result in bench().items()}
+            self.groups.update(dict.fromkeys(group_results, group))
+            results.update(group_results)
+        return results
+
+    def confirm(self, results: dict, names: list) -> dict:
+        """劣化の疑いがあるベンチマークのグループを再計測し、計測値を合わせる（一時的なノイズの除外）"""
+        for group in sorted({self.groups[name] for name in names}):
+            print(f"Re-running {group} to confirm...", flush=True)
+            for name, rerun in self.run(group).items():
+                first = results[name]
+                rerun = rescale(rerun, first.get('calibration_us'))
+                results[name] = dict(
+                    first,
+                    min_us=min(first['min_us'], rerun['min_us']),
+                    max_us=max(first['max_us'], rerun['max_us']),
+                    repeat=first['repeat'] + rerun['repeat']
+                )
+        return results
+
+
+def is_regression(current: dict, base: dict, threshold: float) -> bool:
+    """ノイズは遅くなる方向にしか乗らないため最小値同士を比べ、さらに今回の最小値が
+    ベースラインの最大値を上回った場合（計測のばらつきでは説明できない場合）だけ劣化とみなす
+
+    今回の計測値はベースライン計測時の実行環境の速度に換算してから比べる。
+    """
+    current = rescale(current, base.get('calibration_us'))
+    # max_us のない古いベースラインは中央値を上限として扱う
+    base_max = base.get('max_us', base['median_us'])
+    return current['min_us'] / base['min_us'] - 1 > threshold and current['min_us'] > base_max
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """ベースラインより threshold を超えて遅くなったベンチマーク名の一覧"""
+    regressions = []
+    print(f"\n{'benchmark':<34} {'baseline min..max':>24} {'current min..max':>24} {'change':>8}")
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is not None:
+            current = rescale(current, base.get('calibration_us'))
+        current_range = f"{current['min_us']:.1f}..{current['max_us']:.1f}us"
+        if base is None:
+            print(f"{name:<34} {'-':>24} {current_range:>24} {'new':>8}")
+            continue
+        base_max = base.get('max_us', base['median_us'])
+        change = current['min_us'] / base['min_us'] - 1
+        flag = ' REGRESSION' if is_regression(current, base, threshold) else ''
+        if flag:
+            regressions.append(name)
+        base_range = f"{base['min_us']:.1f}..{base_max:.1f}us"
+        print(f"{name:<34} {base_range:>24} {current_range:>24} {change * 100:>+7.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Component micro-benchmarks with regression baselines')
+    parser.add_argument('--log-rows', type=int, default=100000, help='Rows in the synthetic event/metrics logs')
+    parser.add_argument('--scale', type=float, default=1.0, help='Scale iteration counts (e.g. 0.2 for a quick run)')
+    parser.add_argument('--filter', help='Run only groups containing this string (decode, detect, append, ...)')
+    parser.add_argument('--output', help='Write results to a JSON file')
+    parser.add_argument('--save-baseline', metavar='PATH', help='Store results as the baseline')
+    parser.add_argument('--compare', metavar='PATH', help='Compare against a stored baseline')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Relative slowdown of the min that counts as a regression '
+                             '(the new min must also exceed the baseline max)')
+    parser.add_argument('--confirm-runs', type=int, default=1,
+                        help='Re-run suspected regressions this many times before reporting them')
+
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    with tempfile.TemporaryDirectory(prefix='microbench-') as work_dir:
+        benchmarks = MicroBenchmarks(Path(work_dir), args.log_rows, args.scale)
+        results = benchmarks.run(args.filter)
+        base_results = baseline.get('benchmarks', {}) if baseline else {}
+        for _ in range(args.confirm_runs if baseline else 0):
+            suspected = [name for name, result in results.items()
+                         if name in base_results and is_regression(result, base_results[name], args.threshold)]
+            if not suspected:
+                break
+            results = benchmarks.confirm(results, suspected)
+        benchmarks.loop.close()
+
+    report = {
+        'created_at': datetime.now().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count()
+        },
+        'config': {'log_rows': args.log_rows, 'scale': args.scale},
+        'benchmarks': results
+    }
+
+    print(f"\n{'benchmark':<34} {'median':>12} {'min':>12} {'ops/s':>10}")
+    for name, result in results.items():
+        print(f"{name:<34} {result['median_us']:>10.1f}us {result['min_us']:>10.1f}us {result['ops_per_sec']:>10.1f}")
+
+    for path in filter(None, [args.output, args.save_baseline]):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+        print(f"Results saved to {path}")
+
+    if baseline:
+        if baseline.get('environment', {}).get('platform') != report['environment']['platform']:
+            print("Warning: baseline was recorded on a different platform")
+        regressions = compare(results, baseline.get('benchmarks', {}), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print("\nNo regressions")
+
+
+if __name__ == "__main__":
+    main()
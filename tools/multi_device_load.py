@@ -0,0 +1,185 @@
+"""
+複数デバイスの負荷試験: 固定間隔で送信する場合と、サーバのレートヒント（rate_hint）に
+従って送信する場合とで、サーバの推論待ち・応答時間・デバイスごとの送信数を比較する。
+
+サーバアプリをプロセス内で起動し（httpx.ASGITransport）、推論はスタブモデルで代替する。
+「人物が映っている」デバイスは明るい画像、それ以外は暗い画像を送り、スタブは明るい画像にだけ
+人物ボックスを返すので、検出状況に応じたヒントの違いも確認できる。
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+
+import numpy as np
+import cv2
+import httpx
+
+from ingest_benchmark import BOUNDARY, build_multipart, load_server_app
+
+
+def make_scene_jpeg(width: int, height: int, bright: bool) -> bytes:
+    level = 200 if bright else 40
+    rng = np.random.default_rng(1 if bright else 0)
+    image = np.clip(rng.normal(level, 10, (height, width, 3)), 0, 255).astype(np.uint8)
+    _, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 80])
+    return encoded.tobytes()
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+class MultiDeviceLoadTest:
+    def __init__(self, server, api_key: str, devices: int, active_devices: int, fps: float,
+                 max_fps: float, duration: float, frame_size: tuple):
+        self.server = server
+        self.api_key = api_key
+        self.devices = devices
+        self.active_devices = active_devices
+        self.fps = fps
+        self.max_fps = max_fps
+        self.duration = duration
+        self.frames = {
+            bright: build_multipart(make_scene_jpeg(*frame_size, bright), '{device_id}')
+            for bright in (True, False)
+        }
+
+    def _body(self, device_id: str, active: bool) -> bytes:
+        return self.frames[active].replace(b'{device_id}', device_id.encode())
+
+    async def _device(self, client: httpx.AsyncClient, device_id: str, active: bool, follow_hints: bool,
+                      end_at: float, samples: dict):
+        headers = {
+            'Authorization': f'Bearer {self.api_key}',
+            'Content-Type': f'multipart/form-data; boundary={BOUNDARY}'
+        }
+        body = self._body(device_id, active)
+        interval = 1.0 / self.fps
+        while time.monotonic() < end_at:
+            send_start = time.monotonic()
+            response = await client.post('/ingest', content=body, headers=headers)
+            latency_ms = (time.monotonic() - send_start) * 1000
+            if response.status_code == 200:
+                samples['latency_ms'].append(latency_ms)
+                samples['completed_at'].append(time.monotonic())
+                samples['frames'][device_id] = samples['frames'].get(device_id, 0) + 1
+                hint = response.json().get('rate_hint')
+                if follow_hints and hint:
+                    interval = max(hint['next_interval_ms'] / 1000, 1.0 / self.max_fps)
+            else:
+                samples['errors'] += 1
+            await asyncio.sleep(max(0.0, interval - (time.monotonic() - send_start)))
+
+    async def _sample_backlog(self, end_at: float, samples: dict):
+        while time.monotonic() < end_at:
+            samples['backlog'].append(self.server.inference_backlog())
+            await asyncio.sleep(0.1)
+
+    async def run_case(self, follow_hints: bool) -> dict:
+        # 前のケースの検出状況を持ち越さない
+        self.server.rate_advisor = self.server.RateAdvisor()
+        samples = {'latency_ms': [], 'completed_at': [], 'frames': {}, 'backlog': [], 'errors': 0}
+
+        transport = httpx.ASGITransport(app=self.server.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://load', timeout=60) as client:
+            start = time.monotonic()
+            end_at = start + self.duration
+            tasks = [
+                self._device(client, f'load-{i:03d}', i < self.active_devices, follow_hints, end_at, samples)
+                for i in range(self.devices)
+            ]
+            await asyncio.gather(self._sample_backlog(end_at, samples), *tasks)
+
+        # 1秒ごとの処理数（ばらつきが小さいほど負荷が均一）
+        per_second = [0] * (int(self.duration) + 1)
+        for completed_at in samples['completed_at']:
+            per_second[min(int(completed_at - start), len(per_second) - 1)] += 1
+        per_second = per_second[:-1] or per_second
+
+        active_ids = {f'load-{i:03d}' for i in range(self.active_devices)}
+        active_frames = [n for device_id, n in samples['frames'].items() if device_id in active_ids]
+        idle_frames = [n for device_id, n in samples['frames'].items() if device_id not in active_ids]
+        return {
+            'frames': len(samples['latency_ms']),
+            'errors': samples['errors'],
+            'throughput_fps': len(samples['latency_ms']) / self.duration,
+            'latency_p50_ms': percentile(samples['latency_ms'], 50),
+            'latency_p95_ms': percentile(samples['latency_ms'], 95),
+            'backlog_mean': statistics.fmean(samples['backlog']) if samples['backlog'] else 0.0,
+            'backlog_max': max(samples['backlog'], default=0),
+            'per_second_cv': (
+                statistics.pstdev(per_second) / statistics.fmean(per_second) if sum(per_second) else 0.0
+            ),
+            'active_device_fps': statistics.fmean(active_frames) / self.duration if active_frames else 0.0,
+            'idle_device_fps': statistics.fmean(idle_frames) / self.duration if idle_frames else 0.0
+        }
+
+    async def run(self) -> dict:
+        return {
+            'fixed': await self.run_case(follow_hints=False),
+            'hints': await self.run_case(follow_hints=True)
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Multi-device load test (fixed interval vs server rate hints)')
+    parser.add_argument('--devices', type=int, default=20, help='Simulated devices')
+    parser.add_argument('--active-devices', type=int, default=3, help='Devices that see a person')
+    parser.add_argument('--fps', type=float, default=2.0, help='Fixed-interval fps per device')
+    parser.add_argument('--max-fps', type=float, default=5.0, help='Upper fps bound when following hints')
+    parser.add_argument('--duration', type=float, default=20.0, help='Seconds per case')
+    parser.add_argument('--inference-ms', type=float, default=30.0, help='Simulated inference time per frame')
+    parser.add_argument('--frame-size', default='640x360', help='Frame size, e.g. 640x360')
+    parser.add_argument('--data-dir', help='Server data directory (default: temporary directory)')
+    parser.add_argument('--output', help='Output JSON file')
+
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='multi-device-load-')
+    server = load_server_app(data_dir, persons=1)
+    from stub_model import StubDetector
+
+    class SceneStub(StubDetector):
+        """明るい画像にだけ人物を返すスタブ（デバイスごとの検出状況を模擬）"""
+
+        def _result(self, image):
+            result = super()._result(image)
+            if image[::16, ::16].mean() < 128:
+                result.boxes = []
+            return result
+
+    server.detection_system.model = SceneStub(persons=1, latency_ms=args.inference_ms)
+
+    width, height = (int(v) for v in args.frame_size.lower().split('x'))
+    load_test = MultiDeviceLoadTest(
+        server, os.getenv('API_KEY', 'your_api_key_here'), args.devices, args.active_devices,
+        args.fps, args.max_fps, args.duration, (width, height)
+    )
+    results = asyncio.run(load_test.run())
+
+    print(f"\n=== Multi-device Load Test ({args.devices} devices, {args.active_devices} active, "
+          f"{args.inference_ms:.0f}ms inference) ===")
+    print(f"{'case':>6} {'fps':>6} {'p50':>8} {'p95':>8} {'backlog':>8} {'max':>4} {'cv/s':>5} "
+          f"{'active fps':>10} {'idle fps':>9}")
+    for case, result in results.items():
+        print(f"{case:>6} {result['throughput_fps']:>6.1f} {result['latency_p50_ms']:>6.0f}ms "
+              f"{result['latency_p95_ms']:>6.0f}ms {result['backlog_mean']:>8.1f} {result['backlog_max']:>4} "
+              f"{result['per_second_cv']:>5.2f} {result['active_device_fps']:>10.2f} "
+              f"{result['idle_device_fps']:>9.2f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 import csv
 import json
+import time
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
@@ -8,33 +9,225 @@ from datetime import datetime, timedelta
 import argparse
 import numpy as np
 
+import chart_rendering
+import log_schema
+from log_aggregates import DetectionAggregate, CommunicationAggregate
+
+
+def json_ready(value):
+    """レポートをJSONに変換できる形にする（集計表の列 ('列名', '統計量') は '列名.統計量' に変換）"""
+    if isinstance(value, dict):
+        return {
+            '.'.join(map(str, key)) if isinstance(key, tuple) else (key.item() if isinstance(key, np.generic) else key):
+                json_ready(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [json_ready(item) for item in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+class _BoundedReader:
+    """ファイルの現在位置から length バイトだけを読ませる（書き込み途中の行を渡さないため）"""
+
+    def __init__(self, f, length: int):
+        self.f = f
+        self.remaining = length
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+class CsvCursor:
+    """追記されていくCSVの読み込み位置
+
+    前回読み終えた行末のバイト位置を覚え、read_new() では追記された完全な行だけを読み込む。
+    ファイルが置き換えられた（inodeが変わった）り切り詰められた場合は、新しいファイルを先頭から読む。
+    """
+
+    def __init__(self, path: Path, schema: log_schema.LogSchema, columns: list = None, offset: int = 0,
+                 inode: int = None, header: list = None):
+        self.path = Path(path)
+        self.schema = schema
+        self.columns = columns
+        self.offset = offset
+        self.inode = inode
+        self.header = header
+        self.rotations = 0
+        self.rows_read = 0
+
+    @staticmethod
+    def _last_line_end(f, start: int, size: int) -> int:
+        """start 以降で最後の改行の直後の位置（改行がなければ start）"""
+        position = size
+        while position > start:
+            block = min(65536, position - start)
+            f.seek(position - block)
+            data = f.read(block)
+            newline = data.rfind(b'\n')
+            if newline >= 0:
+                return position - block + newline + 1
+            position -= block
+        return start
+
+    def read_new(self, chunksize: int):
+        """前回の位置以降に追記された行を chunksize 行ずつ返す（全て読み終えた時点で位置を進める）"""
+        if not self.path.exists():
+            return
+        stat = self.path.stat()
+        if self.inode is not None and (stat.st_ino != self.inode or stat.st_size < self.offset):
+            self.offset = 0
+            self.rotations += 1
+        self.inode = stat.st_ino
+
+        with open(self.path, 'rb') as f:
+            if self.offset == 0:
+                header = f.readline()
+                if not header.endswith(b'\n'):
+                    return
+                self.header = header.decode('utf-8').strip().split(',')
+                self.offset = f.tell()
+            end = self._last_line_end(f, self.offset, stat.st_size)
+            if end <= self.offset:
+                return
+            f.seek(self.offset)
+            reader = self.schema.read(_BoundedReader(f, end - self.offset), self.columns, chunksize,
+                                      names=self.header)
+            for chunk in reader:
+                self.rows_read += len(chunk)
+                yield chunk
+            self.offset = end
+
+    def seek_end(self):
+        """既存の行を読まずにファイルの末尾から追跡を始める"""
+        if not self.path.exists():
+            return
+        stat = self.path.stat()
+        with open(self.path, 'rb') as f:
+            header = f.readline()
+            if not header.endswith(b'\n'):
+                return
+            self.header = header.decode('utf-8').strip().split(',')
+            self.offset = self._last_line_end(f, f.tell(), stat.st_size)
+        self.inode = stat.st_ino
+
+    def to_state(self) -> dict:
+        return {'offset': self.offset, 'inode': self.inode, 'header': self.header}
+
+    @classmethod
+    def from_state(cls, path: Path, schema: log_schema.LogSchema, state: dict, columns: list = None) -> 'CsvCursor':
+        return cls(path, schema, columns, state['offset'], state['inode'], state['header'])
+
 class PerformanceAnalyzer:
-    def __init__(self, data_dir: str = "./data"):
+    CHECKPOINT_VERSION = 1
+
+    # 分析ごとに読み込む列
+    DETECTION_COLUMNS = ['device_id', 'timestamp', 'person_count', 'anomaly_flag', 'processing_time_ms']
+    COMMUNICATION_COLUMNS = ['device_id', 'request_size_bytes', 'inference_time_ms', 'total_response_time_ms']
+    SUMMARY_METRICS_COLUMNS = ['timestamp', 'device_id', 'request_size_bytes', 'total_response_time_ms']
+    CHART_EVENTS_COLUMNS = ['timestamp', 'person_count']
+    CHART_METRICS_COLUMNS = ['device_id', 'inference_time_ms', 'total_response_time_ms']
+
+    def __init__(self, data_dir: str = "./data", chunksize: int = 200000, engine: str = 'c'):
         self.data_dir = Path(data_dir)
         self.events_csv = self.data_dir / "events.csv"
         self.performance_csv = self.data_dir / "performance_metrics.csv"
-    
-    def load_events(self) -> pd.DataFrame:
-        """イベントデータを読み込み"""
-        if not self.events_csv.exists():
-            return pd.DataFrame()
-        
-        df = pd.read_csv(self.events_csv)
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        return df
-    
-    def load_performance_metrics(self) -> pd.DataFrame:
-        """パフォーマンスメトリクスを読み込み"""
-        if not self.performance_csv.exists():
+        self.chunksize = chunksize
+        self.engine = engine
+
+    def _load(self, path: Path, schema: log_schema.LogSchema, columns: list = None) -> pd.DataFrame:
+        if not path.exists():
             return pd.DataFrame()
-        
-        df = pd.read_csv(self.performance_csv)
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        return df
+        with open(path, 'rb') as f:
+            return schema.read(f, columns, engine=self.engine)
+
+    def load_events(self, columns: list = None) -> pd.DataFrame:
+        """イベントデータを読み込み（columns で読み込む列を限定）"""
+        return self._load(self.events_csv, log_schema.EVENTS, columns)
     
+    def load_performance_metrics(self, columns: list = None) -> pd.DataFrame:
+        """パフォーマンスメトリクスを読み込み（columns で読み込む列を限定）"""
+        return self._load(self.performance_csv, log_schema.METRICS, columns)
+
+    def events_cursor(self, state: dict = None) -> CsvCursor:
+        if state is not None:
+            return CsvCursor.from_state(self.events_csv, log_schema.EVENTS, state, self.DETECTION_COLUMNS)
+        return CsvCursor(self.events_csv, log_schema.EVENTS, self.DETECTION_COLUMNS)
+
+    def performance_cursor(self, state: dict = None, columns: list = None) -> CsvCursor:
+        columns = columns or self.COMMUNICATION_COLUMNS
+        if state is not None:
+            return CsvCursor.from_state(self.performance_csv, log_schema.METRICS, state, columns)
+        return CsvCursor(self.performance_csv, log_schema.METRICS, columns)
+
+    def aggregate_events(self) -> DetectionAggregate:
+        """events.csv を chunksize 行ずつ集計（メモリ使用量はログの大きさによらない）"""
+        aggregate = DetectionAggregate()
+        for chunk in self.events_cursor().read_new(self.chunksize):
+            aggregate.update(chunk)
+        return aggregate
+
+    def aggregate_performance_metrics(self) -> CommunicationAggregate:
+        """performance_metrics.csv を chunksize 行ずつ集計"""
+        aggregate = CommunicationAggregate()
+        for chunk in self.performance_cursor().read_new(self.chunksize):
+            aggregate.update(chunk)
+        return aggregate
+
+    def _load_checkpoint(self, checkpoint_path: Path):
+        data_dir = str(self.data_dir.resolve())
+        if checkpoint_path.exists():
+            with open(checkpoint_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get('version') == self.CHECKPOINT_VERSION and state.get('data_dir') == data_dir:
+                return (
+                    self.events_cursor(state['events']['cursor']),
+                    DetectionAggregate.from_state(state['events']['aggregate']),
+                    self.performance_cursor(state['performance']['cursor']),
+                    CommunicationAggregate.from_state(state['performance']['aggregate'])
+                )
+            print(f"Checkpoint {checkpoint_path} is for another data directory or version, starting over")
+        return self.events_cursor(), DetectionAggregate(), self.performance_cursor(), CommunicationAggregate()
+
+    def update_checkpoint(self, checkpoint_path: str):
+        """チェックポイント以降に追記された行だけを集計に加え、チェックポイントを更新
+
+        チェックポイントには集計状態と各CSVの読み込み位置を保存する。
+        戻り値は (DetectionAggregate, CommunicationAggregate)。
+        """
+        checkpoint_path = Path(checkpoint_path)
+        events_cursor, detection, performance_cursor, communication = self._load_checkpoint(checkpoint_path)
+
+        for chunk in events_cursor.read_new(self.chunksize):
+            detection.update(chunk)
+        for chunk in performance_cursor.read_new(self.chunksize):
+            communication.update(chunk)
+
+        state = {
+            'version': self.CHECKPOINT_VERSION,
+            'updated_at': datetime.now().isoformat(),
+            'data_dir': str(self.data_dir.resolve()),
+            'events': {'cursor': events_cursor.to_state(), 'aggregate': detection.to_state()},
+            'performance': {'cursor': performance_cursor.to_state(), 'aggregate': communication.to_state()}
+        }
+        temporary = checkpoint_path.with_name(checkpoint_path.name + '.tmp')
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        temporary.replace(checkpoint_path)
+
+        print(f"Checkpoint updated: {events_cursor.rows_read} new events, "
+              f"{performance_cursor.rows_read} new metrics")
+        return detection, communication
+
     def analyze_detection_performance(self) -> dict:
         """検出性能を分析"""
-        events_df = self.load_events()
+        events_df = self.load_events(self.DETECTION_COLUMNS)
         
         if events_df.empty:
             return {"error": "No event data found"}
@@ -43,7 +236,7 @@ class PerformanceAnalyzer:
         anomaly_events = len(events_df[events_df['anomaly_flag'] == True])
         
         # デバイス別統計
-        device_stats = events_df.groupby('device_id').agg({
+        device_stats = events_df.groupby('device_id', observed=True).agg({
             'person_count': ['count', 'sum', 'mean'],
             'anomaly_flag': 'sum',
             'processing_time_ms': 'mean'
@@ -66,7 +259,7 @@ class PerformanceAnalyzer:
     
     def analyze_communication_performance(self) -> dict:
         """通信性能を分析"""
-        perf_df = self.load_performance_metrics()
+        perf_df = self.load_performance_metrics(self.COMMUNICATION_COLUMNS)
         
         if perf_df.empty:
             return {"error": "No performance data found"}
@@ -82,7 +275,7 @@ class PerformanceAnalyzer:
         }
         
         # デバイス別統計
-        device_perf = perf_df.groupby('device_id').agg({
+        device_perf = perf_df.groupby('device_id', observed=True).agg({
             'total_response_time_ms': ['mean', 'std', 'min', 'max'],
             'inference_time_ms': ['mean', 'std'],
             'request_size_bytes': ['mean', 'std']
@@ -93,124 +286,279 @@ class PerformanceAnalyzer:
             "device_performance": device_perf.to_dict()
         }
     
-    def generate_report(self, output_file: str = None):
-        """分析レポートを生成"""
-        detection_analysis = self.analyze_detection_performance()
-        communication_analysis = self.analyze_communication_performance()
-        
+    def generate_report(self, output_file: str = None, streaming: bool = False, checkpoint: str = None):
+        """分析レポートを生成
+
+        streaming=True ではCSVをチャンク単位で集計する（p95/p99 は分位点スケッチによる近似値）。
+        checkpoint を指定すると、前回の実行以降に追記された行だけを集計に加える（streaming と同じ集計）。
+        """
+        if checkpoint:
+            detection, communication = self.update_checkpoint(checkpoint)
+            detection_analysis = detection.to_report()
+            communication_analysis = communication.to_report()
+        elif streaming:
+            detection_analysis = self.aggregate_events().to_report()
+            communication_analysis = self.aggregate_performance_metrics().to_report()
+        else:
+            detection_analysis = self.analyze_detection_performance()
+            communication_analysis = self.analyze_communication_performance()
+
         report = {
             "generated_at": datetime.now().isoformat(),
             "detection_performance": detection_analysis,
             "communication_performance": communication_analysis
         }
-        
+
         if output_file:
             with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(report, f, ensure_ascii=False, indent=2)
+                json.dump(json_ready(report), f, ensure_ascii=False, indent=2)
             print(f"Report saved to {output_file}")
-        
+
         return report
     
-    def plot_performance_charts(self, output_dir: str = "./charts"):
-        """パフォーマンスチャートを生成"""
+    def plot_performance_charts(self, output_dir: str = "./charts", jobs: int = None, preview: bool = False,
+                                devices_per_chart: int = 50, preview_points: int = 20000):
+        """パフォーマンスチャートを生成
+
+        描画はプロセスプールで並列に行う（jobs=1 で逐次）。preview=True では低解像度で描画し、
+        散布図を preview_points 点に間引き、箱ひげ図の外れ値を省略する。
+        デバイス別の比較は devices_per_chart 台ずつ別のファイルに分割する。
+        """
         output_path = Path(output_dir)
         output_path.mkdir(exist_ok=True)
         
         # データ読み込み
-        events_df = self.load_events()
-        perf_df = self.load_performance_metrics()
+        events_df = self.load_events(self.CHART_EVENTS_COLUMNS)
+        perf_df = self.load_performance_metrics(self.CHART_METRICS_COLUMNS)
         
         if events_df.empty and perf_df.empty:
             print("No data available for plotting")
             return
         
-        # スタイル設定
-        plt.style.use('seaborn-v0_8')
-        sns.set_palette("husl")
-        
+        # 描画に必要な集計だけを計算してワーカーに渡す
+        tasks = []
         # 1. 検出数の時系列グラフ
         if not events_df.empty:
-            plt.figure(figsize=(12, 6))
-            events_df.set_index('timestamp')['person_count'].resample('H').sum().plot()
-            plt.title('Person Detection Count Over Time')
-            plt.xlabel('Time')
-            plt.ylabel('Total Person Count')
-            plt.xticks(rotation=45)
-            plt.tight_layout()
-            plt.savefig(output_path / 'detection_timeline.png', dpi=300, bbox_inches='tight')
-            plt.close()
-        
-        # 2. レスポンス時間の分布
-        if not perf_df.empty:
-            plt.figure(figsize=(10, 6))
-            plt.hist(perf_df['total_response_time_ms'], bins=50, alpha=0.7, edgecolor='black')
-            plt.title('Response Time Distribution')
-            plt.xlabel('Response Time (ms)')
-            plt.ylabel('Frequency')
-            plt.axvline(perf_df['total_response_time_ms'].mean(), color='red', linestyle='--', label='Mean')
-            plt.axvline(perf_df['total_response_time_ms'].quantile(0.95), color='orange', linestyle='--', label='95th percentile')
-            plt.legend()
-            plt.tight_layout()
-            plt.savefig(output_path / 'response_time_distribution.png', dpi=300, bbox_inches='tight')
-            plt.close()
-        
-        # 3. デバイス別パフォーマンス比較
-        if not perf_df.empty and 'device_id' in perf_df.columns:
-            plt.figure(figsize=(12, 8))
-            device_groups = perf_df.groupby('device_id')['total_response_time_ms']
-            device_groups.boxplot()
-            plt.title('Response Time by Device')
-            plt.xlabel('Device ID')
-            plt.ylabel('Response Time (ms)')
-            plt.xticks(rotation=45)
-            plt.tight_layout()
-            plt.savefig(output_path / 'device_performance_comparison.png', dpi=300, bbox_inches='tight')
-            plt.close()
-        
-        # 4. 推論時間 vs 総処理時間
+            tasks.append(chart_rendering.timeline_task(events_df))
         if not perf_df.empty:
-            plt.figure(figsize=(10, 6))
-            plt.scatter(perf_df['inference_time_ms'], perf_df['total_response_time_ms'], alpha=0.6)
-            plt.title('Inference Time vs Total Response Time')
-            plt.xlabel('Inference Time (ms)')
-            plt.ylabel('Total Response Time (ms)')
-            plt.tight_layout()
-            plt.savefig(output_path / 'inference_vs_total_time.png', dpi=300, bbox_inches='tight')
-            plt.close()
+            # 2. レスポンス時間の分布
+            tasks.append(chart_rendering.histogram_task(perf_df))
+            # 3. デバイス別パフォーマンス比較
+            if 'device_id' in perf_df.columns:
+                tasks.extend(chart_rendering.boxplot_tasks(perf_df, devices_per_chart, fliers=not preview))
+            # 4. 推論時間 vs 総処理時間
+            tasks.append(chart_rendering.scatter_task(perf_df, preview_points if preview else None))
         
-        print(f"Charts saved to {output_path}")
+        dpi = chart_rendering.PREVIEW_DPI if preview else chart_rendering.FULL_DPI
+        chart_rendering.render_all(tasks, str(output_path), dpi, jobs)
+        print(f"Charts saved to {output_path} ({len(tasks)} charts)")
     
+    SUMMARY_WINDOWS = {'1h': pd.Timedelta(hours=1), '24h': pd.Timedelta(days=1), '7d': pd.Timedelta(days=7)}
+
+    @staticmethod
+    def _device_summary(events_df: pd.DataFrame, perf_df: pd.DataFrame, devices: pd.Index,
+                        quantiles: bool = True) -> pd.DataFrame:
+        """デバイスごとの集計を1回のグループ化で計算（devices の順に並べる）"""
+        events = events_df.groupby('device_id', observed=True).agg(
+            total_events=('person_count', 'size'),
+            total_detections=('person_count', 'sum'),
+            anomaly_events=('anomaly_flag', 'sum'),
+            avg_persons_per_event=('person_count', 'mean'),
+            **({'avg_processing_time_ms': ('processing_time_ms', 'mean')}
+               if 'processing_time_ms' in events_df.columns else {})
+        )
+        response = perf_df.groupby('device_id', observed=True)['total_response_time_ms']
+        # グループごとの正確な分位点
+        levels = [0.5, 0.95, 0.99] if quantiles else [0.95]
+        percentiles = response.quantile(levels).unstack().reindex(columns=levels)
+        percentiles = percentiles.rename(columns=lambda q: f'p{round(q * 100)}_response_time_ms')
+        perf = pd.DataFrame({
+            'avg_response_time_ms': response.mean(),
+            'p95_response_time_ms': percentiles['p95_response_time_ms'],
+            'avg_request_size_kb': perf_df.groupby('device_id', observed=True)['request_size_bytes'].mean() / 1024
+        })
+        if quantiles:
+            perf = perf.join(percentiles[['p50_response_time_ms', 'p99_response_time_ms']])
+        summary = events.reindex(devices).join(perf.reindex(devices))
+        summary[['total_events', 'total_detections', 'anomaly_events']] = (
+            summary[['total_events', 'total_detections', 'anomaly_events']].fillna(0).astype('int64')
+        )
+        return summary
+
+    def build_summary(self, events_df: pd.DataFrame, perf_df: pd.DataFrame, as_of: pd.Timestamp = None,
+                      windows: dict = None) -> pd.DataFrame:
+        """デバイス別サマリー（全期間 + 直近1時間/1日/1週間）
+
+        デバイスIDをカテゴリ型にそろえ、期間ごとに1回のグループ化で集計して結合する。
+        直近の期間は as_of（省略時はログ中の最新時刻）から数える。
+        """
+        windows = self.SUMMARY_WINDOWS if windows is None else windows
+        if perf_df.empty:
+            perf_df = pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in [
+                ('timestamp', 'datetime64[ns]'), ('device_id', 'object'),
+                ('total_response_time_ms', 'float64'), ('request_size_bytes', 'float64')
+            ]})
+        devices = pd.Index(pd.unique(events_df['device_id']), name='device_id')
+        device_type = pd.CategoricalDtype(devices)
+        events_df = events_df.assign(device_id=events_df['device_id'].astype(device_type))
+        perf_df = perf_df.assign(device_id=perf_df['device_id'].astype(device_type))
+        devices = pd.CategoricalIndex(devices, dtype=device_type, name='device_id')
+
+        summary = self._device_summary(events_df, perf_df, devices)
+        if as_of is None:
+            as_of = max(events_df['timestamp'].max(), perf_df['timestamp'].max() if not perf_df.empty else pd.NaT)
+
+        for label, window in windows.items():
+            since = as_of - window
+            recent = self._device_summary(events_df[events_df['timestamp'] > since],
+                                          perf_df[perf_df['timestamp'] > since], devices, quantiles=False)
+            recent = recent[['total_events', 'total_detections', 'anomaly_events',
+                             'avg_response_time_ms', 'p95_response_time_ms']]
+            summary = summary.join(recent.rename(columns=lambda column: f'{column}_{label}'))
+
+        return summary.reset_index().assign(device_id=lambda df: df['device_id'].astype(str))
+
     def export_summary_csv(self, output_file: str = "performance_summary.csv"):
         """サマリーをCSVで出力"""
-        events_df = self.load_events()
-        perf_df = self.load_performance_metrics()
-        
-        summary_data = []
-        
-        if not events_df.empty:
-            for device in events_df['device_id'].unique():
-                device_events = events_df[events_df['device_id'] == device]
-                device_perf = perf_df[perf_df['device_id'] == device] if not perf_df.empty else pd.DataFrame()
-                
-                summary = {
-                    'device_id': device,
-                    'total_events': len(device_events),
-                    'total_detections': device_events['person_count'].sum(),
-                    'anomaly_events': device_events['anomaly_flag'].sum(),
-                    'avg_persons_per_event': device_events['person_count'].mean(),
-                    'avg_processing_time_ms': device_events['processing_time_ms'].mean() if 'processing_time_ms' in device_events.columns else None,
-                    'avg_response_time_ms': device_perf['total_response_time_ms'].mean() if not device_perf.empty else None,
-                    'p95_response_time_ms': device_perf['total_response_time_ms'].quantile(0.95) if not device_perf.empty else None,
-                    'avg_request_size_kb': device_perf['request_size_bytes'].mean() / 1024 if not device_perf.empty else None
-                }
-                summary_data.append(summary)
-        
-        summary_df = pd.DataFrame(summary_data)
+        events_df = self.load_events(self.DETECTION_COLUMNS)
+        perf_df = self.load_performance_metrics(self.SUMMARY_METRICS_COLUMNS)
+
+        summary_df = self.build_summary(events_df, perf_df) if not events_df.empty else pd.DataFrame()
         summary_df.to_csv(output_file, index=False, encoding='utf-8')
         print(f"Summary exported to {output_file}")
         
         return summary_df
 
+class LiveMonitor:
+    """events.csv / performance_metrics.csv を追跡して直近 window 分の集計を保つ（--follow）
+
+    追記された行だけを読み（ローテーションにも追従）、ログの時刻で1分ごとの集計に振り分ける。
+    最新の時刻から window を過ぎた1分集計は捨てるため、メモリは window の長さとデバイス数だけで決まる。
+    """
+
+    def __init__(self, analyzer: PerformanceAnalyzer, window_minutes: float = 5.0, from_start: bool = False,
+                 top_devices: int = 5):
+        self.analyzer = analyzer
+        self.window = pd.Timedelta(minutes=window_minutes)
+        self.top_devices = top_devices
+        self.events_cursor = analyzer.events_cursor()
+        self.performance_cursor = analyzer.performance_cursor(
+            columns=analyzer.COMMUNICATION_COLUMNS + ['timestamp'])
+        self.from_start = from_start
+        if not from_start:
+            self.events_cursor.seek_end()
+            self.performance_cursor.seek_end()
+        self.detection = {}
+        self.communication = {}
+        self.latest = None
+        self.started_at = datetime.now()
+
+    def _fold(self, buckets: dict, aggregate_type, chunk: pd.DataFrame):
+        chunk = chunk.dropna(subset=['timestamp'])
+        if chunk.empty:
+            return
+        latest = chunk['timestamp'].max()
+        self.latest = latest if self.latest is None else max(self.latest, latest)
+        chunk = chunk[chunk['timestamp'] > self.latest - self.window]
+        for minute, part in chunk.groupby(chunk['timestamp'].dt.floor('min')):
+            if minute not in buckets:
+                buckets[minute] = aggregate_type()
+            buckets[minute].update(part)
+
+    def _expire(self):
+        if self.latest is None:
+            return
+        cutoff = (self.latest - self.window).floor('min')
+        for buckets in (self.detection, self.communication):
+            for minute in [minute for minute in buckets if minute < cutoff]:
+                del buckets[minute]
+
+    def poll(self) -> int:
+        """追記された行を集計に加え、読み込んだ行数を返す"""
+        rows = 0
+        for cursor, buckets, aggregate_type in (
+                (self.events_cursor, self.detection, DetectionAggregate),
+                (self.performance_cursor, self.communication, CommunicationAggregate)):
+            before = cursor.rows_read
+            for chunk in cursor.read_new(self.analyzer.chunksize):
+                self._fold(buckets, aggregate_type, chunk)
+            rows += cursor.rows_read - before
+        self._expire()
+        return rows
+
+    def _observed_seconds(self) -> float:
+        """レートの分母（末尾から追跡を始めた直後は経過時間）"""
+        window = self.window.total_seconds()
+        if self.from_start:
+            return window
+        return max(1.0, min(window, (datetime.now() - self.started_at).total_seconds()))
+
+    def summary(self) -> dict:
+        detection = DetectionAggregate()
+        for aggregate in self.detection.values():
+            detection.merge(aggregate)
+        communication = CommunicationAggregate()
+        for aggregate in self.communication.values():
+            communication.merge(aggregate)
+
+        summary = {
+            'latest': self.latest.isoformat() if self.latest is not None else None,
+            'window_minutes': self.window.total_seconds() / 60,
+            'events': detection.total_events,
+            'anomaly_events': detection.anomaly_events,
+            'persons': int(detection.by_hour.stat('person_count', 'sum').sum()) if detection.total_events else 0,
+            'requests': communication.total_requests,
+            'slowest_devices': {}
+        }
+        if communication.total_requests:
+            report = communication.to_report()['overall_statistics']
+            summary.update({
+                'requests_per_sec': communication.total_requests / self._observed_seconds(),
+                'avg_response_time_ms': report['avg_response_time_ms'],
+                'p95_response_time_ms': report['p95_response_time_ms'],
+                'p99_response_time_ms': report['p99_response_time_ms'],
+                'avg_inference_time_ms': report['avg_inference_time_ms']
+            })
+            device_means = communication.by_device.stat('total_response_time_ms', 'mean')
+            summary['slowest_devices'] = device_means.nlargest(self.top_devices).round(1).to_dict()
+        summary['devices'] = len(communication.by_device.groups.union(detection.by_device.groups))
+        return summary
+
+    @staticmethod
+    def format_summary(summary: dict) -> str:
+        lines = [f"[{datetime.now():%H:%M:%S}] last {summary['window_minutes']:g} min "
+                 f"(log time {summary['latest'] or '-'}), {summary['devices']} devices"]
+        if summary['requests']:
+            lines.append(f"  requests {summary['requests']} ({summary['requests_per_sec']:.1f}/s)  "
+                         f"response avg {summary['avg_response_time_ms']:.1f} / p95 {summary['p95_response_time_ms']:.1f}"
+                         f" / p99 {summary['p99_response_time_ms']:.1f} ms  "
+                         f"inference avg {summary['avg_inference_time_ms']:.1f} ms")
+        else:
+            lines.append("  requests 0")
+        rate = summary['anomaly_events'] / summary['events'] if summary['events'] else 0
+        lines.append(f"  events {summary['events']}  persons {summary['persons']}  "
+                     f"anomalies {summary['anomaly_events']} ({rate:.1%})")
+        if summary['slowest_devices']:
+            lines.append("  slowest devices: " + ', '.join(
+                f"{device} {mean:.1f}ms" for device, mean in summary['slowest_devices'].items()))
+        return '\n'.join(lines)
+
+    def run(self, interval: float = 5.0, output_file: str = None):
+        """interval 秒ごとに追記分を取り込んで集計を表示（Ctrl+C で終了）"""
+        try:
+            while True:
+                self.poll()
+                summary = self.summary()
+                print(self.format_summary(summary), flush=True)
+                if output_file:
+                    temporary = Path(output_file + '.tmp')
+                    with open(temporary, 'w', encoding='utf-8') as f:
+                        json.dump(json_ready(summary), f, ensure_ascii=False, indent=2)
+                    temporary.replace(output_file)
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            print("Stopped following")
+
 def main():
     parser = argparse.ArgumentParser(description='Performance Analysis Tool')
     parser.add_argument('--data-dir', default='./data', help='Data directory path')
@@ -218,13 +566,41 @@ def main():
     parser.add_argument('--output-csv', help='Output CSV summary file')
     parser.add_argument('--charts-dir', default='./charts', help='Charts output directory')
     parser.add_argument('--no-charts', action='store_true', help='Skip chart generation')
-    
+    parser.add_argument('--streaming', action='store_true',
+                        help='Aggregate the report in chunks with constant memory (p95/p99 approximated)')
+    parser.add_argument('--chunk-size', type=int, default=200000, help='Rows per chunk in streaming mode')
+    parser.add_argument('--csv-engine', choices=log_schema.ENGINES, default='c',
+                        help='CSV parser for full loads (pyarrow requires the pyarrow package)')
+    parser.add_argument('--checkpoint', help='Incremental mode: fold only rows appended since this checkpoint')
+    parser.add_argument('--reset-checkpoint', action='store_true', help='Discard the checkpoint and start over')
+    parser.add_argument('--chart-jobs', type=int, help='Processes used to render charts (default: CPU count)')
+    parser.add_argument('--preview-charts', action='store_true',
+                        help='Fast preview charts (low DPI, downsampled scatter, no boxplot outliers)')
+    parser.add_argument('--devices-per-chart', type=int, default=50, help='Devices per device comparison chart')
+    parser.add_argument('--follow', action='store_true',
+                        help='Tail the logs and print rolling stats until interrupted')
+    parser.add_argument('--interval', type=float, default=5.0, help='Seconds between refreshes in follow mode')
+    parser.add_argument('--window-minutes', type=float, default=5.0, help='Rolling window in follow mode')
+    parser.add_argument('--from-start', action='store_true', help='Follow mode: read existing rows first')
+    parser.add_argument('--follow-output', help='Follow mode: also write the latest summary to this JSON file')
+
     args = parser.parse_args()
-    
-    analyzer = PerformanceAnalyzer(args.data_dir)
-    
+
+    if args.csv_engine == 'pyarrow' and not log_schema.pyarrow_available():
+        print("pyarrow not available, using the C engine")
+        args.csv_engine = 'c'
+
+    analyzer = PerformanceAnalyzer(args.data_dir, args.chunk_size, args.csv_engine)
+
+    if args.follow:
+        LiveMonitor(analyzer, args.window_minutes, args.from_start).run(args.interval, args.follow_output)
+        return
+
+    if args.checkpoint and args.reset_checkpoint:
+        Path(args.checkpoint).unlink(missing_ok=True)
+
     # レポート生成
-    report = analyzer.generate_report(args.output_report)
+    report = analyzer.generate_report(args.output_report, streaming=args.streaming, checkpoint=args.checkpoint)
     
     # CSVサマリー出力
     if args.output_csv:
@@ -233,7 +609,8 @@ def main():
     # チャート生成
     if not args.no_charts:
         try:
-            analyzer.plot_performance_charts(args.charts_dir)
+            analyzer.plot_performance_charts(args.charts_dir, jobs=args.chart_jobs, preview=args.preview_charts,
+                                             devices_per_chart=args.devices_per_chart)
         except ImportError:
             print("matplotlib/seaborn not available, skipping chart generation")
         except Exception as e:
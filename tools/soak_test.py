@@ -0,0 +1,278 @@
+"""
+長時間の耐久試験（ソークテスト）: スタブモデルのサーバをプロセス内で起動して /ingest へ一定レートで
+送信し続け、RSS・Pythonヒープ（tracemalloc）・オープン中のファイルディスクリプタ数・デバイス状態の件数・
+data/ ディレクトリのサイズを定期的に記録する。
+
+ウォームアップ後のサンプルに直線を当てはめて1時間あたりの増加量（傾き）を求め、
+設定した上限を超えた項目があれば終了コード1で終了する。サーバの起動・終了処理
+（スナップショット・非同期キュー）も実運用と同じく実行する。
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+
+from ingest_benchmark import BOUNDARY, build_multipart, make_jpeg, load_server_app
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def rss_bytes() -> int:
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    with open('/proc/self/status', 'r') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def open_fds() -> int:
+    if psutil is not None and hasattr(psutil.Process, 'num_fds'):
+        return psutil.Process().num_fds()
+    try:
+        return len(os.listdir('/proc/self/fd'))
+    except OSError:
+        return -1
+
+
+def directory_size(path: Path) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def slope_per_hour(samples: list, key: str) -> float:
+    """最小二乗法による1時間あたりの増加量"""
+    if len(samples) < 2:
+        return 0.0
+    xs = [s['elapsed_s'] / 3600 for s in samples]
+    ys = [s[key] for s in samples]
+    mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+    denominator = sum((x - mean_x) ** 2 for x in xs)
+    if denominator == 0:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / denominator
+
+
+class SoakTest:
+    # 傾きの単位換算（報告値 = 生の値 / 係数）
+    METRICS = {
+        'rss_mb': ('rss_bytes', 1024 * 1024),
+        'heap_mb': ('heap_bytes', 1024 * 1024),
+        'open_fds': ('open_fds', 1),
+        'device_states': ('device_states', 1),
+        'trackers': ('trackers', 1),
+        'rate_advisor_devices': ('rate_advisor_devices', 1),
+        'frame_requests': ('frame_requests', 1),
+        'result_cache': ('result_cache', 1),
+        'subscribers': ('subscribers', 1),
+        'data_dir_mb': ('data_dir_bytes', 1024 * 1024)
+    }
+    # デバイス・接続ごとに増える構造（上限は --max-device-states-per-hour を共通で使う）
+    STATE_METRICS = ('device_states', 'trackers', 'rate_advisor_devices', 'frame_requests', 'result_cache',
+                     'subscribers')
+
+    def __init__(self, server, data_dir: Path, api_key: str, rate: float, devices: int, concurrency: int,
+                 sample_interval: float, trace_frames: int):
+        self.server = server
+        self.data_dir = data_dir
+        self.api_key = api_key
+        self.rate = rate
+        self.devices = devices
+        self.concurrency = concurrency
+        self.sample_interval = sample_interval
+        self.trace_frames = trace_frames
+        self.body_template = build_multipart(make_jpeg(640, 360), '{device_id}')
+        self.samples = []
+        self.sent = 0
+        self.errors = 0
+        self.warmup_snapshot = None
+
+    def _sample(self, elapsed: float) -> dict:
+        sizes = self.server.state_sizes()
+        sample = {
+            'elapsed_s': elapsed,
+            'rss_bytes': rss_bytes(),
+            'heap_bytes': tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0,
+            'open_fds': open_fds(),
+            'device_states': sizes['device_states'] + sizes['shared_alert_slots'],
+            'trackers': sizes['trackers'],
+            'rate_advisor_devices': sizes['rate_advisor_devices'],
+            'frame_requests': sizes['frame_requests'],
+            'result_cache': sizes['result_cache'],
+            'subscribers': sizes['result_subscribers'] + sizes['event_subscribers'],
+            'data_dir_bytes': directory_size(self.data_dir),
+            'sent': self.sent,
+            'errors': self.errors
+        }
+        self.samples.append(sample)
+        print(f"[{elapsed / 60:7.1f}min] rss={sample['rss_bytes'] / 1048576:.1f}MB "
+              f"heap={sample['heap_bytes'] / 1048576:.1f}MB fds={sample['open_fds']} "
+              f"devices={sample['device_states']} trackers={sample['trackers']} "
+              f"rate={sample['rate_advisor_devices']} cache={sample['result_cache']} "
+              f"data={sample['data_dir_bytes'] / 1048576:.1f}MB "
+              f"sent={self.sent} errors={self.errors}", flush=True)
+        return sample
+
+    async def _sender(self, client: httpx.AsyncClient, worker: int, end_at: float):
+        headers = {
+            'Authorization': f'Bearer {self.api_key}',
+            'Content-Type': f'multipart/form-data; boundary={BOUNDARY}'
+        }
+        interval = self.concurrency / self.rate
+        next_at = time.monotonic() + worker * interval / self.concurrency
+        i = worker
+        while time.monotonic() < end_at:
+            await asyncio.sleep(max(0.0, next_at - time.monotonic()))
+            next_at += interval
+            device_id = f'soak-{i % self.devices:04d}'
+            i += self.concurrency
+            body = self.body_template.replace(b'{device_id}', device_id.encode())
+            try:
+                response = await client.post('/ingest', content=body, headers=headers)
+                if response.status_code != 200:
+                    self.errors += 1
+            except httpx.HTTPError:
+                self.errors += 1
+            self.sent += 1
+
+    async def _sampler(self, start: float, end_at: float, warmup_until: float):
+        while True:
+            now = time.monotonic()
+            if self.warmup_snapshot is None and now >= warmup_until and tracemalloc.is_tracing():
+                self.warmup_snapshot = tracemalloc.take_snapshot()
+            self._sample(now - start)
+            if now >= end_at:
+                break
+            await asyncio.sleep(min(self.sample_interval, max(0.0, end_at - now)))
+
+    async def run(self, duration: float, warmup: float):
+        if self.trace_frames > 0:
+            tracemalloc.start(self.trace_frames)
+
+        app = self.server.app
+        transport = httpx.ASGITransport(app=app)
+        # 起動・終了処理（スナップショットの定期保存・非同期キュー）も実行する
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=transport, base_url='http://soak', timeout=60) as client:
+                start = time.monotonic()
+                end_at = start + duration
+                await asyncio.gather(
+                    self._sampler(start, end_at, start + warmup),
+                    *[self._sender(client, worker, end_at) for worker in range(self.concurrency)]
+                )
+
+    def top_allocators(self, limit: int = 10) -> list:
+        """ウォームアップ後に増えたメモリの確保元（ファイル:行）"""
+        if self.warmup_snapshot is None or not tracemalloc.is_tracing():
+            return []
+        stats = tracemalloc.take_snapshot().compare_to(self.warmup_snapshot, 'lineno')
+        return [
+            {'location': str(stat.traceback), 'size_diff_kb': stat.size_diff / 1024, 'count_diff': stat.count_diff}
+            for stat in stats[:limit]
+        ]
+
+    def evaluate(self, warmup: float, limits: dict) -> dict:
+        steady = [s for s in self.samples if s['elapsed_s'] >= warmup] or self.samples
+        slopes = {
+            name: slope_per_hour(steady, key) / divisor for name, (key, divisor) in self.METRICS.items()
+        }
+        failures = {
+            name: {'slope_per_hour': slopes[name], 'limit_per_hour': limit}
+            for name, limit in limits.items()
+            if limit is not None and slopes[name] > limit
+        }
+        return {'slopes_per_hour': slopes, 'limits_per_hour': limits, 'failures': failures,
+                'passed': not failures}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Soak test with memory/fd/state/disk growth checks')
+    parser.add_argument('--hours', type=float, default=2.0, help='Test duration in hours')
+    parser.add_argument('--warmup-minutes', type=float, default=10.0, help='Samples ignored for slope fitting')
+    parser.add_argument('--sample-interval', type=float, default=60.0, help='Seconds between samples')
+    parser.add_argument('--rate', type=float, default=10.0, help='Frames per second sent to /ingest')
+    parser.add_argument('--devices', type=int, default=100, help='Distinct device IDs (cycled)')
+    parser.add_argument('--concurrency', type=int, default=4, help='Concurrent senders')
+    parser.add_argument('--persons', type=int, default=0, help='Persons returned by the stub (>0 saves images)')
+    parser.add_argument('--trace-frames', type=int, default=1,
+                        help='tracemalloc traceback depth (0 disables heap tracking)')
+    parser.add_argument('--max-rss-mb-per-hour', type=float, default=20.0)
+    parser.add_argument('--max-heap-mb-per-hour', type=float, default=10.0)
+    parser.add_argument('--max-fds-per-hour', type=float, default=5.0)
+    parser.add_argument('--max-device-states-per-hour', type=float, default=10.0,
+                        help='Growth limit for each per-device structure (device states, trackers, rate advisor, '
+                             'frame requests, result cache, subscribers)')
+    parser.add_argument('--max-data-dir-mb-per-hour', type=float, default=None,
+                        help='data/ growth limit (off by default: CSV logs grow with traffic)')
+    parser.add_argument('--data-dir', help='Server data directory (default: temporary directory)')
+    parser.add_argument('--output', help='Output JSON report')
+
+    args = parser.parse_args()
+
+    data_dir = Path(args.data_dir or tempfile.mkdtemp(prefix='soak-'))
+    server = load_server_app(str(data_dir), args.persons)
+
+    soak = SoakTest(server, data_dir, os.getenv('API_KEY', 'your_api_key_here'), args.rate, args.devices,
+                    args.concurrency, args.sample_interval, args.trace_frames)
+    duration = args.hours * 3600
+    warmup = min(args.warmup_minutes * 60, duration / 2)
+    print(f"Soak test: {args.hours}h at {args.rate} fps, {args.devices} devices, data dir {data_dir}")
+    asyncio.run(soak.run(duration, warmup))
+
+    limits = {
+        'rss_mb': args.max_rss_mb_per_hour,
+        'heap_mb': args.max_heap_mb_per_hour,
+        'open_fds': args.max_fds_per_hour,
+        **{name: args.max_device_states_per_hour for name in SoakTest.STATE_METRICS},
+        'data_dir_mb': args.max_data_dir_mb_per_hour
+    }
+    result = soak.evaluate(warmup, limits)
+    report = {
+        'finished_at': datetime.now().isoformat(),
+        'config': vars(args),
+        'result': result,
+        'top_allocators': soak.top_allocators(),
+        'samples': soak.samples
+    }
+
+    print("\n=== Growth per hour (after warmup) ===")
+    for name, slope in result['slopes_per_hour'].items():
+        limit = limits[name]
+        status = 'FAIL' if name in result['failures'] else 'ok'
+        print(f"{name:>20}: {slope:+10.2f}  (limit {limit if limit is not None else '-'})  {status}")
+    if report['top_allocators']:
+        print("\nTop heap growth since warmup:")
+        for allocator in report['top_allocators'][:5]:
+            print(f"  {allocator['size_diff_kb']:+9.1f}KB  {allocator['location']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Report saved to {args.output}")
+
+    if not result['passed']:
+        print(f"\nSoak test FAILED: {', '.join(result['failures'])}")
+        sys.exit(1)
+    print("\nSoak test passed")
+
+
+if __name__ == "__main__":
+    main()